@@ -0,0 +1,9 @@
+"""
+Benchmarks for sprinter, to measure the performance of changes and
+catch regressions. They are not run with the tests.
+
+* micro: times the hot paths (manifests, interpolation, dependency
+  trees, feature instantiation and injections) against synthetic manifests
+* e2e: times install, update and remove of an environment, served by a
+  local http server and git repositories
+"""
@@ -0,0 +1,321 @@
+"""End to end benchmark of sprinter install, update and remove, without the network.
+Usage:
+  e2e [-o <file>] [--archives <count>] [--files <count>] [--file-size <bytes>] [--templates <count>] [--git-repos <count>] [--jobs <jobs>] [--strace] [--keep]
+  e2e (-h | --help)
+
+Options:
+  -h, --help             Show this usage guide.
+  -o <file>, --output <file>  Write the results to <file> as json
+  --archives <count>     The number of tar.gz, and of zip, archives to unpack [default: 5]
+  --files <count>        The number of files in each archive [default: 200]
+  --file-size <bytes>    The size of each file in the archives [default: 4096]
+  --templates <count>    The number of templates to install [default: 5]
+  --git-repos <count>    The number of local git repositories to clone [default: 3]
+  --jobs <jobs>          The number of features sprinter syncs concurrently [default: 1]
+  --strace               Count the system calls of each phase with strace
+  --keep                 Keep the generated files and installation, and print where they are
+
+A local http server serves generated archives, templates and a manifest
+that extends another, and the git repositories are local bare ones.
+sprinter runs as a subprocess, with HOME set to a temporary directory,
+through these phases:
+
+* install: install the environment
+* update: update the environment, with nothing changed
+* update-changed: update the environment, after every archive changed
+* remove: remove the environment
+
+Each phase reports it's wall time, peak RSS, bytes fetched from the
+server, and (with --strace) system calls.
+
+Run with python -m sprinter.benchmarks.e2e.
+"""
+from __future__ import unicode_literals, print_function
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import zipfile
+from contextlib import closing
+from timeit import default_timer
+
+from docopt import docopt
+from six.moves import BaseHTTPServer, socketserver
+
+import sprinter
+
+NAMESPACE = "benchmark"
+PHASES = ["install", "update", "update-changed", "remove"]
+FAILURE_MARKERS = ["Sprinter shut down with an error!", "failed! Writing debug output"]
+
+GLOBAL_CONFIG = """
+[global]
+env_source_rc = false
+manifest_cache_ttl = 0
+
+[shell]
+bash = false
+zsh = false
+gui = false
+"""
+
+
+class ArtifactServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """ Serves the files in <root> over http on localhost, counting the bytes served """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, root):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), _ArtifactHandler)
+        self.root = root
+        self.bytes_served = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d" % self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def served(self, size):
+        with self._lock:
+            self.bytes_served += size
+            self.requests += 1
+
+
+class _ArtifactHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        parts = [p for p in self.path.split('?')[0].split('/') if p not in ('', '.', '..')]
+        path = os.path.join(self.server.root, *parts)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, 'rb') as fh:
+            body = fh.read()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.served(len(body))
+
+    def log_message(self, *args):
+        pass
+
+
+def generate_archives(root, count, files, file_size, version):
+    """ Write <count> tar.gz and zip archives of <files> files each, returning their names """
+    names = []
+    content = (("%d" % version) * file_size)[:file_size].encode('utf-8')
+    for i in range(count):
+        tar_name = "archive%d-v%d.tar.gz" % (i, version)
+        with closing(tarfile.open(os.path.join(root, tar_name), 'w:gz')) as tf:
+            for f in range(files):
+                info = tarfile.TarInfo("archive%d/file%d.txt" % (i, f))
+                info.size = len(content)
+                tf.addfile(info, io.BytesIO(content))
+        zip_name = "archive%d-v%d.zip" % (i, version)
+        with closing(zipfile.ZipFile(os.path.join(root, zip_name), 'w', zipfile.ZIP_DEFLATED)) as zf:
+            for f in range(files):
+                zf.writestr("archive%d/file%d.txt" % (i, f), content)
+        names.append((tar_name, zip_name))
+    return names
+
+
+def generate_git_repos(root, count):
+    """ Create <count> bare git repositories with a commit each, returning their paths """
+    paths = []
+    for i in range(count):
+        bare = os.path.join(root, "repo%d.git" % i)
+        work = os.path.join(root, "work%d" % i)
+        _git(root, "init", "--bare", bare)
+        _git(root, "init", work)
+        with open(os.path.join(work, "README"), 'w') as fh:
+            fh.write("repository %d\n" % i)
+        _git(work, "add", "README")
+        _git(work, "-c", "user.name=benchmark", "-c", "user.email=benchmark@localhost",
+             "commit", "-m", "initial commit")
+        _git(work, "push", bare, "HEAD:refs/heads/master")
+        paths.append(bare)
+    return paths
+
+
+def _git(cwd, *args):
+    subprocess.check_call(("git",) + args, cwd=cwd, stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
+
+
+def generate_manifests(root, url, archives, templates, git_repos):
+    """ Write parent.cfg and the manifest extending it, benchmark.cfg """
+    with open(os.path.join(root, "parent.cfg"), 'w') as fh:
+        fh.write("[config]\nnamespace = %s\n\n" % NAMESPACE +
+                 "[environment]\nformula = sprinter.formula.env\n" +
+                 "benchmark_root = %(config:root_dir)s\n")
+    lines = ["[config]", "namespace = %s" % NAMESPACE, "extends = %s/parent.cfg" % url, ""]
+    for i, (tar_name, zip_name) in enumerate(archives):
+        lines += ["[tar%d]" % i, "formula = sprinter.formula.unpack",
+                  "url = %s/%s" % (url, tar_name), "remove_common_prefix = true", ""]
+        lines += ["[zip%d]" % i, "formula = sprinter.formula.unpack",
+                  "url = %s/%s" % (url, zip_name), "type = zip", "remove_common_prefix = true", ""]
+    for i in range(templates):
+        lines += ["[template%d]" % i, "formula = sprinter.formula.template",
+                  "source = %s/template%d.txt" % (url, i),
+                  "target = ~/templates/template%d.txt" % i, "remove_file_on_delete = yes", ""]
+    for i, path in enumerate(git_repos):
+        lines += ["[git%d]" % i, "formula = sprinter.formula.git", "url = %s" % path, ""]
+    with open(os.path.join(root, "benchmark.cfg"), 'w') as fh:
+        fh.write("\n".join(lines))
+
+
+def run_phase(phase, home, server, manifest_url, jobs=1, use_strace=False):
+    """ Run sprinter for <phase>, returning it's measurements """
+    args = {'install': ["install", manifest_url],
+            'remove': ["remove", NAMESPACE]}.get(phase, ["update", NAMESPACE])
+    args += ["-j", str(jobs)]
+    command = [sys.executable, "-c", "from sprinter.install import main; main()"] + args
+    strace_path = os.path.join(home, "strace-%s.txt" % phase)
+    if use_strace:
+        command = ["strace", "-f", "-c", "-o", strace_path] + command
+    env = dict(os.environ)
+    env['HOME'] = home
+    env['PYTHONPATH'] = os.pathsep.join([_package_root()] + [p for p in [env.get('PYTHONPATH')] if p])
+
+    bytes_before, requests_before = server.bytes_served, server.requests
+    start = default_timer()
+    with open(os.devnull) as stdin:
+        process = subprocess.Popen(command, stdin=stdin, stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT, env=env)
+        output = process.stdout.read().decode('utf-8', 'replace')
+        process.stdout.close()
+        # reap the child ourselves, to get it's resource usage alone
+        status, rusage = os.wait4(process.pid, 0)[1:]
+    wall_time = default_timer() - start
+    exit_code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1
+    installed = os.path.exists(os.path.join(home, ".sprinter", NAMESPACE))
+    succeeded = (exit_code == 0 and
+                 not [m for m in FAILURE_MARKERS if m in output] and
+                 installed == (phase != "remove"))
+    return {'phase': phase,
+            'succeeded': succeeded,
+            'wall_time': wall_time,
+            'peak_rss_kb': _maxrss_kb(rusage),
+            'context_switches': rusage.ru_nvcsw + rusage.ru_nivcsw,
+            'bytes_fetched': server.bytes_served - bytes_before,
+            'requests': server.requests - requests_before,
+            'syscalls': _strace_calls(strace_path) if use_strace else None,
+            'output': output}
+
+
+def _maxrss_kb(rusage):
+    """ ru_maxrss is in bytes on osx, and kilobytes elsewhere """
+    if sys.platform == 'darwin':
+        return rusage.ru_maxrss // 1024
+    return rusage.ru_maxrss
+
+
+def _strace_calls(path):
+    """ return the total number of system calls in an strace -c summary """
+    try:
+        with open(path) as fh:
+            for line in fh:
+                if line.strip().endswith("total"):
+                    return int(re.split(r"\s+", line.strip())[3])
+    except (IOError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _package_root():
+    return os.path.dirname(os.path.dirname(os.path.abspath(sprinter.__file__)))
+
+
+def run(archives=5, files=200, file_size=4096, templates=5, git_repos=3, jobs=1,
+        use_strace=False, keep=False, output=sys.stdout):
+    """ Generate the fixtures, and run every phase, returning the results """
+    work_dir = tempfile.mkdtemp(prefix="sprinter-e2e-")
+    serve_dir = os.path.join(work_dir, "www")
+    home = os.path.join(work_dir, "home")
+    for d in [serve_dir, os.path.join(home, ".sprinter", ".global")]:
+        os.makedirs(d)
+    with open(os.path.join(home, ".sprinter", ".global", "config.cfg"), 'w') as fh:
+        fh.write(GLOBAL_CONFIG)
+    if git_repos and not _which("git"):
+        print("git is not installed, skipping the git repositories", file=output)
+        git_repos = 0
+    if use_strace and not _which("strace"):
+        print("strace is not installed, not counting system calls", file=output)
+        use_strace = False
+
+    server = ArtifactServer(serve_dir)
+    server.start()
+    try:
+        for i in range(templates):
+            with open(os.path.join(serve_dir, "template%d.txt" % i), 'w') as fh:
+                fh.write(("template %d\n" % i) * 100)
+        repos = generate_git_repos(work_dir, git_repos)
+        generate_manifests(serve_dir, server.url,
+                           generate_archives(serve_dir, archives, files, file_size, 1),
+                           templates, repos)
+        manifest_url = server.url + "/benchmark.cfg"
+        results = []
+        for phase in PHASES:
+            if phase == "update-changed":
+                generate_manifests(serve_dir, server.url,
+                                   generate_archives(serve_dir, archives, files, file_size, 2),
+                                   templates, repos)
+            result = run_phase(phase, home, server, manifest_url, jobs=jobs, use_strace=use_strace)
+            results.append(result)
+            print("%-15s %-6s %8.2fs %10d KB %12d bytes %6d requests %10s syscalls" % (
+                phase, "ok" if result['succeeded'] else "FAILED", result['wall_time'],
+                result['peak_rss_kb'], result['bytes_fetched'], result['requests'],
+                result['syscalls'] if result['syscalls'] is not None else "-"), file=output)
+            if not result['succeeded']:
+                print(result['output'], file=output)
+                break
+    finally:
+        server.stop()
+        if keep:
+            print("Kept the benchmark files in %s" % work_dir, file=output)
+        else:
+            shutil.rmtree(work_dir)
+    return {'parameters': {'archives': archives, 'files': files, 'file_size': file_size,
+                           'templates': templates, 'git_repos': git_repos, 'jobs': jobs},
+            'phases': results}
+
+
+def _which(program):
+    for path in os.environ.get("PATH", "").split(os.pathsep):
+        if os.access(os.path.join(path, program), os.X_OK):
+            return True
+    return False
+
+
+def main(argv=None):
+    options = docopt(__doc__, argv=argv)
+    results = run(archives=int(options['--archives']), files=int(options['--files']),
+                  file_size=int(options['--file-size']), templates=int(options['--templates']),
+                  git_repos=int(options['--git-repos']), jobs=int(options['--jobs']),
+                  use_strace=options['--strace'], keep=options['--keep'])
+    if options['--output']:
+        with open(options['--output'], 'w') as fh:
+            fh.write(json.dumps(results, indent=2, sort_keys=True))
+    return 0 if all(p['succeeded'] for p in results['phases']) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,213 @@
+"""Microbenchmarks of sprinter's hot paths, against synthetic manifests.
+Usage:
+  micro run [-o <file>] [--sizes <sizes>] [--keys <keys>] [--depth <depth>] [--repeat <repeat>] [--only <name>]
+  micro compare <baseline> <current> [--threshold <threshold>]
+  micro (-h | --help)
+
+Options:
+  -h, --help                   Show this usage guide.
+  -o <file>, --output <file>   Write the results to <file> as json
+  --sizes <sizes>              The numbers of features to generate, comma separated [default: 10,100,1000,10000]
+  --keys <keys>                The number of keys per feature [default: 10]
+  --depth <depth>              The length of the chains of references between features [default: 5]
+  --repeat <repeat>            The number of times to run each benchmark [default: 5]
+  --only <name>                Only run the benchmarks whose name contains <name>
+  --threshold <threshold>      The slowdown, as a fraction, past which a benchmark has regressed [default: 0.2]
+
+Run with python -m sprinter.benchmarks.micro. Compare exits with 1 if
+any benchmark regressed.
+"""
+from __future__ import unicode_literals, print_function
+import gc
+import json
+import platform
+import shutil
+import sys
+import tempfile
+from io import StringIO
+from timeit import default_timer
+
+from docopt import docopt
+
+from sprinter.core import FeatureDict, FormulaStore, Injections, load_manifest
+from sprinter.lib.dependencytree import DependencyTree
+
+RC_LINES = 20000  # the number of lines of the rc file injections are benchmarked with
+NOISE_FLOOR = 0.001  # differences of fewer seconds are never flagged
+
+
+def generate_manifest(features, keys, depth):
+    """
+    Return the text of a manifest with <features> features of <keys>
+    keys each. Every feature but the first of each chain of <depth>
+    depends on, and references each key of, the feature before it.
+    """
+    lines = ["[config]", "namespace = benchmark", "inputs = user==benchmark", ""]
+    for i in range(features):
+        lines.append("[feature%d]" % i)
+        lines.append("formula = sprinter.formula.base")
+        chained = i % depth != 0
+        if chained:
+            lines.append("depends = feature%d" % (i - 1))
+        for k in range(keys):
+            if chained:
+                lines.append("key%d = %%(feature%d:key%d)s/%d" % (k, i - 1, k, i))
+            else:
+                lines.append("key%d = %%(config:user)s/%d/%d" % (k, i, k))
+        lines.append("")
+    return "\n".join(lines)
+
+
+def generate_rc(lines, wrapper):
+    """ Return the text of an rc file of <lines> lines, with an injection in it's middle """
+    content = ["export PATH_%d=/usr/local/%d/bin:$PATH" % (i, i) for i in range(lines // 2)]
+    content += ["#%s" % wrapper, "[ -r ~/.sprinter/env ] && . ~/.sprinter/env", "#%s" % wrapper]
+    content += ["alias a%d='ls -l %d'" % (i, i) for i in range(lines // 2)]
+    return "\n".join(content) + "\n"
+
+
+class NullFormula(object):
+    """ A formula that does nothing, so instantiating features is measured alone """
+
+    def __init__(self, environment, feature_name, source=None, target=None):
+        self.environment = environment
+        self.feature_name = feature_name
+        self.source = source
+        self.target = target
+
+    def should_run(self):
+        return True
+
+
+class NullEnvironment(object):
+    """ The part of an environment a FeatureDict uses """
+
+    def log_error(self, error_message):
+        raise Exception(error_message)
+
+
+def measure(func, setup=None, repeat=5):
+    """
+    Run <func> <repeat> times, each with a fresh argument from <setup>
+    (which is not timed). Return the min and median seconds taken.
+    """
+    timings = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        gc.collect()
+        start = default_timer()
+        func(*args)
+        timings.append(default_timer() - start)
+    timings.sort()
+    return {'min': timings[0], 'median': timings[len(timings) // 2], 'repeat': repeat}
+
+
+def benchmarks(features, keys, depth):
+    """ Return a list of (name, func, setup) tuples benchmarking manifests of <features> features """
+    text = generate_manifest(features, keys, depth)
+    wrapper = "SPRINTER_BENCHMARK"
+    rc = generate_rc(RC_LINES, wrapper)
+    injections = Injections(wrapper=wrapper, override="SPRINTER_OVERRIDES")
+
+    def manifest():
+        return (load_manifest(StringIO(text)),)
+
+    def feature_configs():
+        m = load_manifest(StringIO(text))
+        return ([m.get_feature_config(s) for s in m.formula_sections()],)
+
+    def get_all(configs):
+        for config in configs:
+            for key in config.keys():
+                config.get(key)
+
+    def to_dict_all(configs):
+        for config in configs:
+            config.to_dict()
+
+    def dependency_dict():
+        m = load_manifest(StringIO(text))
+        return (dict((s, m.dependencies(s)) for s in m.formula_sections()),)
+
+    def feature_dict(m):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            FeatureDict(NullEnvironment(), None, m, FormulaStore(temp_dir),
+                        formula_dict={'sprinter.formula.base': NullFormula})
+        finally:
+            shutil.rmtree(temp_dir)
+
+    suffix = "[features=%d]" % features
+    return [
+        ("load_manifest" + suffix, lambda: load_manifest(StringIO(text)), None),
+        ("get_context_dict" + suffix, lambda m: m.get_context_dict(), manifest),
+        ("FeatureConfig.get" + suffix, get_all, feature_configs),
+        ("FeatureConfig.to_dict" + suffix, to_dict_all, feature_configs),
+        ("DependencyTree" + suffix, DependencyTree, dependency_dict),
+        ("FeatureDict" + suffix, feature_dict, manifest),
+        ("Injections.inject_content[lines=%d]" % RC_LINES,
+         lambda: injections.inject_content(rc, "[ -r ~/.sprinter/rc ] && . ~/.sprinter/rc"), None),
+    ]
+
+
+def run(sizes, keys, depth, repeat, only=None, output=sys.stdout):
+    """ Run the benchmarks for manifests of each size, returning the results """
+    results = {}
+    for features in sizes:
+        for name, func, setup in benchmarks(features, keys, depth):
+            if name in results or (only and only not in name):
+                continue
+            results[name] = measure(func, setup=setup, repeat=repeat)
+            print("%-50s %10.4fs %10.4fs" % (name, results[name]['min'], results[name]['median']),
+                  file=output)
+    return {'environment': {'python': platform.python_version(),
+                            'implementation': platform.python_implementation(),
+                            'platform': platform.platform()},
+            'parameters': {'sizes': sizes, 'keys': keys, 'depth': depth, 'repeat': repeat},
+            'results': results}
+
+
+def compare(baseline, current, threshold):
+    """
+    Compare the minimum times of the benchmarks in both results,
+    ignoring differences below the noise floor. Return a list of
+    (name, baseline, current, ratio, status) tuples, where status is
+    regressed, improved or unchanged.
+    """
+    comparison = []
+    for name in sorted(set(baseline['results']) & set(current['results'])):
+        before, after = baseline['results'][name]['min'], current['results'][name]['min']
+        ratio = after / before if before else 1.0
+        significant = abs(after - before) >= NOISE_FLOOR
+        if significant and ratio > 1 + threshold:
+            status = "regressed"
+        elif significant and ratio < 1 - threshold:
+            status = "improved"
+        else:
+            status = "unchanged"
+        comparison.append((name, before, after, ratio, status))
+    return comparison
+
+
+def main(argv=None):
+    options = docopt(__doc__, argv=argv)
+    if options['run']:
+        results = run([int(s) for s in options['--sizes'].split(",")],
+                      int(options['--keys']), int(options['--depth']), int(options['--repeat']),
+                      only=options['--only'])
+        if options['--output']:
+            with open(options['--output'], 'w') as fh:
+                fh.write(json.dumps(results, indent=2, sort_keys=True))
+        return 0
+    with open(options['<baseline>']) as fh:
+        baseline = json.load(fh)
+    with open(options['<current>']) as fh:
+        current = json.load(fh)
+    comparison = compare(baseline, current, float(options['--threshold']))
+    for name, before, after, ratio, status in comparison:
+        print("%-50s %10.4fs %10.4fs %6.2fx %s" % (name, before, after, ratio, status))
+    return 1 if [c for c in comparison if c[4] == "regressed"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+from __future__ import unicode_literals
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+
+from nose import tools
+from six.moves.urllib.request import urlopen
+from six.moves.urllib.error import HTTPError
+
+from sprinter.benchmarks.e2e import ArtifactServer, generate_archives, generate_manifests, _strace_calls
+from sprinter.core import load_manifest
+
+
+class TestE2E(object):
+
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_generate_archives(self):
+        """ Generated archives should hold the requested files, under a common prefix """
+        tar_name, zip_name = generate_archives(self.temp_dir, 1, 3, 10, 1)[0]
+        tf = tarfile.open(os.path.join(self.temp_dir, tar_name))
+        tools.eq_(sorted(tf.getnames()), ['archive0/file0.txt', 'archive0/file1.txt', 'archive0/file2.txt'])
+        tf.close()
+        zf = zipfile.ZipFile(os.path.join(self.temp_dir, zip_name))
+        tools.eq_(len(zf.namelist()), 3)
+        zf.close()
+
+    def test_generate_manifests(self):
+        """ The generated manifest should extend the parent, and have a feature per fixture """
+        generate_manifests(self.temp_dir, "http://localhost", [("a.tar.gz", "a.zip")], 2, ["/tmp/repo.git"])
+        manifest = load_manifest(os.path.join(self.temp_dir, "benchmark.cfg"), do_inherit=False)
+        tools.eq_(manifest.get('config', 'extends'), "http://localhost/parent.cfg")
+        tools.eq_(sorted(manifest.formula_sections()), ['git0', 'tar0', 'template0', 'template1', 'zip0'])
+
+    def test_server_counts_bytes(self):
+        """ The artifact server should serve files, and count the bytes served """
+        with open(os.path.join(self.temp_dir, "file.txt"), 'w') as fh:
+            fh.write("x" * 100)
+        server = ArtifactServer(self.temp_dir)
+        server.start()
+        try:
+            tools.eq_(len(urlopen(server.url + "/file.txt").read()), 100)
+            try:
+                urlopen(server.url + "/../missing.txt")
+                raise AssertionError("a missing file should not be served")
+            except HTTPError as e:
+                tools.eq_(e.code, 404)
+            tools.eq_((server.bytes_served, server.requests), (100, 1))
+        finally:
+            server.stop()
+
+    def test_strace_calls(self):
+        """ The total number of calls should be read from an strace summary """
+        path = os.path.join(self.temp_dir, "strace.txt")
+        with open(path, 'w') as fh:
+            fh.write(STRACE_SUMMARY)
+        tools.eq_(_strace_calls(path), 1234)
+        tools.eq_(_strace_calls(os.path.join(self.temp_dir, "missing.txt")), None)
+
+
+STRACE_SUMMARY = """% time     seconds  usecs/call     calls    errors syscall
+------ ----------- ----------- --------- --------- ----------------
+ 60.00    0.000600           1      1000           read
+ 40.00    0.000400           1       234        12 open
+------ ----------- ----------- --------- --------- ----------------
+100.00    0.001000           1      1234        12 total
+"""
@@ -0,0 +1,34 @@
+from __future__ import unicode_literals
+from io import StringIO
+
+from nose import tools
+
+from sprinter.benchmarks.micro import compare, generate_manifest, run
+from sprinter.core import load_manifest
+
+
+class TestMicro(object):
+
+    def test_generate_manifest(self):
+        """ A generated manifest should chain references and dependencies between features """
+        manifest = load_manifest(StringIO(generate_manifest(6, 2, 3)))
+        tools.eq_(len(manifest.formula_sections()), 6)
+        tools.eq_(manifest.dependencies('feature2'), ['feature1'])
+        tools.eq_(manifest.dependencies('feature3'), [])
+        tools.eq_(manifest.get_feature_config('feature2').get('key1'), 'benchmark/0/1/1/2')
+
+    def test_run(self):
+        """ Every benchmark should run, and report it's timings """
+        results = run([5], 2, 2, 1, output=StringIO())
+        tools.eq_(len(results['results']), 7)
+        for timings in results['results'].values():
+            assert timings['min'] <= timings['median']
+
+    def test_compare(self):
+        """ Benchmarks slower than the threshold should be flagged """
+        baseline = {'results': {'a': {'min': 1.0}, 'b': {'min': 1.0}, 'c': {'min': 1.0},
+                                'd': {'min': 0.0001}, 'e': {'min': 1.0}}}
+        current = {'results': {'a': {'min': 1.5}, 'b': {'min': 1.1}, 'c': {'min': 0.5},
+                               'd': {'min': 0.0005}}}
+        tools.eq_([(c[0], c[4]) for c in compare(baseline, current, 0.2)],
+                  [('a', 'regressed'), ('b', 'unchanged'), ('c', 'improved'), ('d', 'unchanged')])
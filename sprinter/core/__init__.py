@@ -4,3 +4,4 @@ from .globals import load_global_config
 from .injections import Injections
 from .manifest import Manifest, ManifestException, load_manifest
 from .featuredict import FeatureDict
+from .formulastore import FormulaStore, FormulaStoreException
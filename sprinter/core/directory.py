@@ -8,6 +8,9 @@ import logging
 import os
 import shutil
 import stat
+import threading
+
+import sprinter.lib as lib
 
 from .templates import source_template
 
@@ -39,6 +42,8 @@ class Directory(object):
         self.manifest_path = os.path.join(self.root_dir, "manifest.cfg")
         self.rewrite_config = rewrite_config
         self.shell_util_path = shell_util_path
+        # features syncing concurrently share the rc and env files
+        self._write_lock = threading.Lock()
 
     def __del__(self):
         if self.rc_file:
@@ -123,15 +128,22 @@ class Directory(object):
         """
         return os.path.join(self.root_dir, "features", feature_name)
 
+    def log_path(self, feature_name):
+        """
+        return a path to the log the commands of the feature append their output to.
+        """
+        return os.path.join(self.root_dir, "logs", feature_name + ".log")
+
     def add_to_env(self, content):
         """
         add content to the env script.
         """
         if not self.rewrite_config:
             raise DirectoryException("Error! Directory was not intialized w/ rewrite_config.")
-        if not self.env_file:
-            self.env_path, self.env_file = self.__get_env_handle(self.root_dir)
-        self.env_file.write(content + '\n')
+        with self._write_lock:
+            if not self.env_file:
+                self.env_path, self.env_file = self.__get_env_handle(self.root_dir)
+            self.env_file.write(content + '\n')
 
     def add_to_rc(self, content):
         """
@@ -139,9 +151,10 @@ class Directory(object):
         """
         if not self.rewrite_config:
             raise DirectoryException("Error! Directory was not intialized w/ rewrite_config.")
-        if not self.rc_file:
-            self.rc_path, self.rc_file = self.__get_rc_handle(self.root_dir)
-        self.rc_file.write(content + '\n')
+        with self._write_lock:
+            if not self.rc_file:
+                self.rc_path, self.rc_file = self.__get_rc_handle(self.root_dir)
+            self.rc_file.write(content + '\n')
 
     def add_to_gui(self, content):
         """
@@ -149,9 +162,10 @@ class Directory(object):
         """
         if not self.rewrite_config:
             raise DirectoryException("Error! Directory was not intialized w/ rewrite_config.")
-        if not self.gui_file:
-            self.gui_path, self.gui_file = self.__get_gui_handle(self.root_dir)
-        self.gui_file.write(content + '\n')
+        with self._write_lock:
+            if not self.gui_file:
+                self.gui_path, self.gui_file = self.__get_gui_handle(self.root_dir)
+            self.gui_file.write(content + '\n')
 
     def __remove_path(self, path):
         """ Remove an object """
@@ -197,9 +211,7 @@ class Directory(object):
         """
         Symlink an object at path to name in the dir_name folder. remove it if it already exists.
         """
-        target_dir = os.path.join(self.root_dir, dir_name)
-        if not os.path.exists(target_dir):
-            os.makedirs(target_dir)
+        lib.makedirs(os.path.join(self.root_dir, dir_name))
         target_path = os.path.join(self.root_dir, dir_name, name)
         logger.debug("Attempting to symlink %s to %s..." % (path, target_path))
         if os.path.exists(target_path):
@@ -1,6 +1,5 @@
 from __future__ import unicode_literals
 import logging
-import copy
 import sys
 
 import sprinter.lib as lib
@@ -32,23 +31,12 @@ class FeatureConfig(object):
             if default is not None:
                 return default
             raise ParamNotFoundException("value for %s not found" % param)
-        context_dict = copy.deepcopy(self.manifest.get_context_dict())
-        for k, v in self.raw_dict.items():
-            context_dict["%s:%s" % (self.feature_name, k)] = v
-        while True:
-            try:
-                return str(self.raw_dict[param]) % context_dict
-            except KeyError:
-                e = sys.exc_info()[1]
-                key = e.args[0]
-                if key.startswith('config:'):
-                    missing_key = key.split(':')[1]
-                    if self.manifest.inputs.is_input(missing_key):
-                        val = self.manifest.inputs.get_input(missing_key)
-                        context_dict[key] = val
-                else:
-                    logger.warn("Could not specialize %s! Error: %s" % (self.raw_dict[param], e))
-                    return self.raw_dict[param]
+        key = "%s:%s" % (self.feature_name, param)
+        value = self.manifest.resolve(key)
+        error = self.manifest.resolution_error(key)
+        if error:
+            logger.warn("Could not specialize %s! Error: %s" % (self.raw_dict[param], error))
+        return value
 
     def has(self, param):
         """ return true if the param exists """
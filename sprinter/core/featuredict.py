@@ -1,9 +1,9 @@
 from __future__ import unicode_literals
 from sprinter import lib
 from sprinter.lib import SprinterException
-from sprinter.external.pippuppet import Pip, PipException
 import sys
 import logging
+from collections import defaultdict
 
 logger = logging.getLogger(__name__)
 
@@ -17,14 +17,23 @@ class FeatureDict(dict):
     Dictionary which contains instances of features, formulas with a specific configuration
     """
 
-    def __init__(self, environment, source_manifest, target_manifest, pip_install_path, formula_dict=None):
-        """ generate a feature dict from Manifests <source_manifest> and <target_manifest> """
+    def __init__(self, environment, source_manifest, target_manifest, formula_store, formula_dict=None, jobs=1,
+                 install_formulas=True):
+        """
+        generate a feature dict from Manifests <source_manifest> and
+        <target_manifest>. Third party formulas are installed to
+        <formula_store>, up to <jobs> at a time, unless <install_formulas>
+        is false, in which case the features using them are left out.
+        """
         self._environment = environment
         self._run_order = []  # the order with which these features should run
+        self._removed = set()  # features that only exist in the source, and are being removed
+        self._source_manifest = source_manifest
+        self._target_manifest = target_manifest
         self._formula_dict = formula_dict or {}  # a dictionary to hold formula classes
-        self._pip = Pip(pip_install_path)
-        # TODO: have a better way of detecting exists eggs are installed
-        self._pip.delete_all_eggs()
+        self._formula_store = formula_store
+        self.uninstalled_formulas = []  # the formulas that were not installed, without install_formulas
+        self._load_formula_classes([m for m in (target_manifest, source_manifest) if m], jobs, install_formulas)
 
         if target_manifest:
             for feature in target_manifest.sections():
@@ -37,17 +46,46 @@ class FeatureDict(dict):
                 feature_key = self._instantiate_feature(feature, source_manifest, 'source')
                 if feature_key:
                     self._run_order.append(feature_key)
+                    self._removed.add(feature_key)
 
     @property
     def run_order(self):
         return self._run_order
 
+    def dependency_dict(self):
+        """
+        Return a dictionary of each feature key to the feature keys it
+        must run after. Features being removed run in reverse
+        dependency order, so a feature is removed before the features
+        it depends on.
+        """
+        keys_by_name = defaultdict(list)
+        for key in self._run_order:
+            keys_by_name[key[0]].append(key)
+        dependency_dict = {}
+        for key in self._run_order:
+            # a feature that changed formulas keeps the old removal after the new install
+            same_name = keys_by_name[key[0]]
+            dependency_dict[key] = same_name[:same_name.index(key)]
+        for key in self._run_order:
+            if key in self._removed:
+                for name in self._source_manifest.dependencies(key[0]):
+                    for dependency in keys_by_name[name]:
+                        if dependency in self._removed:
+                            dependency_dict[dependency].append(key)
+            else:
+                for name in self._target_manifest.dependencies(key[0]):
+                    dependency_dict[key] += [d for d in keys_by_name[name] if d not in self._removed]
+        return dependency_dict
+
     def _instantiate_feature(self, feature, manifest, kind):
         if feature == "config":
             return None
         feature_config = manifest.get_feature_config(feature)
         if feature_config.has('formula'):
             key = (feature, feature_config.get('formula'))
+            if _parse_formula(key[1])[1] in self.uninstalled_formulas:
+                return None
             if key not in self:
                 try:
                     formula_class = self._get_formula_class(feature_config.get('formula'))
@@ -66,30 +104,66 @@ class FeatureDict(dict):
             self._environment.log_error('feature {0} has no formula!'.format(feature))
         return None
 
-    def _get_formula_class(self, formula):
+    def _load_formula_classes(self, manifests, jobs, install):
         """
-        get a formula class object if it exists, else
-        create one, add it to the dict, and pass return it.
+        load the formula classes the manifests use, first installing
+        those that can not be imported, concurrently, if <install>.
         """
+        missing = {}
+        for manifest in manifests:
+            for feature in manifest.formula_sections():
+                # the raw value, a formula interpolated from the context is loaded on instantiation
+                formula = manifest.get(feature, 'formula', None)
+                if formula is None:
+                    continue
+                formula_class, requirement = _parse_formula(formula)
+                if formula_class in self._formula_dict or formula_class in missing:
+                    continue
+                if not self._import_formula_class(formula_class, requirement):
+                    missing[formula_class] = requirement
+        requirements = [r for r in missing.values() if not self._formula_store.is_installed(r)]
+        if requirements and not install:
+            self.uninstalled_formulas = sorted(requirements)
+            return
+        if requirements:
+            errors = self._formula_store.install_all(requirements, jobs=jobs)
+            for requirement in sorted(errors):
+                logger.error("ERROR: Unable to download %s!" % requirement)
+                logger.debug(errors[requirement])
+        for formula_class, requirement in missing.items():
+            self._import_formula_class(formula_class, requirement)
+
+    def _import_formula_class(self, formula_class, requirement):
+        """ add the formula class to the formula dict, returning false if it can not be imported """
         # recursive import otherwise
         from sprinter.formula.base import FormulaBase
-        if formula in LEGACY_MAPPINGS:
-            formula = LEGACY_MAPPINGS[formula]
-        formula_class, formula_url = formula, None
-        if ':' in formula:
-            formula_class, formula_url = formula.split(":", 1)
-        if formula_class not in self._formula_dict:
+        for attempt in range(2):
             try:
                 self._formula_dict[formula_class] = lib.get_subclass_from_module(formula_class, FormulaBase)
+                return True
             except (SprinterException, ImportError):
-                logger.info("Downloading %s..." % formula_class)
-                try:
-                    self._pip.install_egg(formula_url or formula_class)
-                    try:
-                        self._formula_dict[formula_class] = lib.get_subclass_from_module(formula_class, FormulaBase)
-                    except ImportError:
-                        logger.debug("FeatureDict import Error", exc_info=sys.exc_info())
-                        raise SprinterException("Error: Unable to retrieve formula %s!" % formula_class)
-                except PipException:
-                    logger.error("ERROR: Unable to download %s!" % formula_class)
+                logger.debug("FeatureDict import Error", exc_info=sys.exc_info())
+                # the formula may be installed in the store, but not yet importable
+                if attempt or not self._formula_store.activate(requirement):
+                    return False
+
+    def _get_formula_class(self, formula):
+        """
+        get a formula class object if it exists, else
+        create one, add it to the dict, and pass return it.
+        """
+        formula_class, requirement = _parse_formula(formula)
+        if formula_class not in self._formula_dict:
+            if not self._import_formula_class(formula_class, requirement):
+                raise SprinterException("Error: Unable to retrieve formula %s!" % formula_class)
         return self._formula_dict[formula_class]
+
+
+def _parse_formula(formula):
+    """ return the formula class of a formula, and the requirement it is installed from """
+    if formula in LEGACY_MAPPINGS:
+        formula = LEGACY_MAPPINGS[formula]
+    formula_class, formula_url = formula, None
+    if ':' in formula:
+        formula_class, formula_url = formula.split(":", 1)
+    return formula_class, formula_url or formula_class
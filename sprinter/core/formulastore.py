@@ -0,0 +1,151 @@
+"""
+formulastore.py keeps third party formulas, e.g.:
+
+[myfeature]
+formula = mypkg.formula:https://example.com/mypkg-1.0.tar.gz
+
+installed across runs, under .global/formulas. Each requirement (the
+part after the colon, or the module if there is none) is installed
+into it's own directory, keyed by the requirement and the python
+version, by pip running in a subprocess:
+
+pip install --target <directory> <requirement>
+
+with pip's cache in <store>/wheels, so built wheels are reused.
+
+A requirement that is already installed is reused without contacting
+an index. Requirements are only installed again on an explicit
+refresh (sprinter formulas --refresh).
+"""
+from __future__ import unicode_literals
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+
+import sprinter.lib as lib
+from sprinter.lib.scheduler import run_in_dependency_order
+
+logger = logging.getLogger(__name__)
+
+METADATA_FILE = "requirement.json"  # written last, so it's presence marks a complete install
+WHEEL_DIRECTORY = "wheels"  # pip's cache, so built wheels are reused
+
+
+class FormulaStoreException(Exception):
+    """ Raised when a formula can not be installed """
+
+
+class FormulaStore(object):
+
+    root = None  # the directory the requirements are installed under
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def path(self, requirement):
+        """ return the directory <requirement> is installed to """
+        key = "%s python%d.%d" % (requirement, sys.version_info[0], sys.version_info[1])
+        return os.path.join(self.root, hashlib.sha1(key.encode('utf-8')).hexdigest()[:16])
+
+    def is_installed(self, requirement):
+        return os.path.exists(os.path.join(self.path(requirement), METADATA_FILE))
+
+    def activate(self, requirement):
+        """ make <requirement> importable, returning false if it is not installed """
+        if not self.is_installed(requirement):
+            return False
+        path = self.path(requirement)
+        with self._lock:
+            if path not in sys.path:
+                sys.path.append(path)
+                _invalidate_import_caches()
+        return True
+
+    def installed(self):
+        """ return the metadata of every requirement installed for this python, by requirement """
+        installed = {}
+        if os.path.exists(self.root):
+            for name in sorted(os.listdir(self.root)):
+                metadata_path = os.path.join(self.root, name, METADATA_FILE)
+                if os.path.exists(metadata_path):
+                    with open(metadata_path) as fh:
+                        metadata = json.load(fh)
+                    if self.path(metadata['requirement']) == os.path.join(self.root, name):
+                        installed[metadata['requirement']] = metadata
+        return installed
+
+    def install(self, requirement, refresh=False):
+        """
+        install <requirement> unless it already is (or, with refresh,
+        install it again), and activate it. A requirement being
+        refreshed stays usable until it's replacement is installed.
+        """
+        path = self.path(requirement)
+        if refresh or not self.is_installed(requirement):
+            temp_path = "%s.%d.%d.tmp" % (path, os.getpid(), threading.current_thread().ident)
+            try:
+                self.__pip_install(requirement, temp_path)
+                with open(os.path.join(temp_path, METADATA_FILE), 'w') as fh:
+                    fh.write(json.dumps({'requirement': requirement,
+                                         'python': "%d.%d" % sys.version_info[:2],
+                                         'installed': time.time()}))
+                with self._lock:
+                    if os.path.exists(path):
+                        shutil.rmtree(path)
+                    os.rename(temp_path, path)
+            finally:
+                if os.path.exists(temp_path):
+                    shutil.rmtree(temp_path)
+        self.activate(requirement)
+
+    def install_all(self, requirements, refresh=False, jobs=1):
+        """
+        install every requirement (see install), up to <jobs> at a
+        time. Return a dictionary of the requirements that failed to
+        install, to their error.
+        """
+        errors = {}
+
+        def install(requirement):
+            try:
+                self.install(requirement, refresh=refresh)
+            except (FormulaStoreException, OSError, IOError):
+                errors[requirement] = str(sys.exc_info()[1])
+
+        requirements = sorted(set(requirements))
+        run_in_dependency_order(requirements, {}, install, workers=jobs)
+        return errors
+
+    def refresh(self, jobs=1):
+        """ install every installed requirement again, returning the errors as install_all does """
+        return self.install_all(self.installed().keys(), refresh=True, jobs=jobs)
+
+    def __pip_install(self, requirement, target):
+        logger.info("Installing formula %s..." % requirement)
+        with self._lock:
+            if not os.path.exists(self.root):
+                os.makedirs(self.root)
+        command = "%s -m pip install --quiet --target %s %s" % (sys.executable, target, requirement)
+        # passed through the environment, which pip versions without the options ignore
+        env = dict(os.environ)
+        env['PIP_CACHE_DIR'] = os.path.join(self.root, WHEEL_DIRECTORY)
+        env['PIP_DISABLE_PIP_VERSION_CHECK'] = "1"
+        error, output = lib.call(command, env=env, output_log_level=logging.DEBUG, stream=True)
+        if error:
+            raise FormulaStoreException("Unable to install formula %s!\n%s"
+                                        % (requirement, output.decode('utf-8', 'replace')))
+
+
+def _invalidate_import_caches():
+    """ python 3 caches directory listings, which new requirements are missing from """
+    try:
+        import importlib
+        importlib.invalidate_caches()
+    except (ImportError, AttributeError):
+        pass
@@ -10,6 +10,10 @@ from __future__ import unicode_literals
 import logging
 import os
 import re
+import threading
+
+import sprinter.lib as lib
+from sprinter.lib.tracing import span
 
 
 class Injections(object):
@@ -34,14 +38,16 @@ class Injections(object):
         self.logger = logging.getLogger(logger)
         self.inject_dict = {}
         self.clear_set = set()
+        self._lock = threading.Lock()
 
     def inject(self, filename, content):
         """ add the injection content to the dictionary """
         # ensure content always has one trailing newline
         content = content.rstrip() + "\n"
-        if not filename in self.inject_dict:
-            self.inject_dict[filename] = ""
-        self.inject_dict[filename] += content
+        with self._lock:
+            if not filename in self.inject_dict:
+                self.inject_dict[filename] = ""
+            self.inject_dict[filename] += content
 
     def clear(self, filename):
         """ add the file to the list of files to clear """
@@ -59,12 +65,14 @@ class Injections(object):
         self.logger.debug(self.inject_dict)
         self.logger.debug("Clear list is:")
         self.logger.debug(self.clear_set)
-        for filename, content in self.inject_dict.items():
-            self.logger.info("Injecting values into %s..." % filename)
-            self.destructive_inject(filename, content)
-        for filename in self.clear_set:
-            self.logger.info("Clearing injection from %s..." % filename)
-            self.destructive_clear(filename)
+        with span("commit injections", "inject", wrapper=self.wrapper,
+                  injected=len(self.inject_dict), cleared=len(self.clear_set)):
+            for filename, content in self.inject_dict.items():
+                self.logger.info("Injecting values into %s..." % filename)
+                self.destructive_inject(filename, content)
+            for filename in self.clear_set:
+                self.logger.info("Clearing injection from %s..." % filename)
+                self.destructive_clear(filename)
 
     def injected(self, filename):
         """ Return true if the file has already been injected before. """
@@ -102,9 +110,7 @@ class Injections(object):
         directories on the way. returns the absolute path of the file.
         """
         file_path = os.path.expanduser(file_path)
-        if not os.path.exists(os.path.dirname(file_path)):
-            self.logger.debug("Directories missing! Creating directories for %s..." % file_path)
-            os.makedirs(os.path.dirname(file_path))
+        lib.makedirs(os.path.dirname(file_path))
         if not os.path.exists(file_path):
             open(file_path, "w+").close()
         return file_path
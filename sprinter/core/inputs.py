@@ -42,6 +42,10 @@ class Inputs(object):
         """ Returns true if <key> is a key """
         return key in self._inputs
 
+    def is_secret(self, key):
+        """ Returns true if <key> is an input that should never be written out """
+        return key in self._inputs and self._inputs[key].is_secret
+
     def is_set(self, key):
         if key not in self._inputs:
             raise InputException("Key {0} is not a valid input!".format(key))
@@ -0,0 +1,225 @@
+"""
+interpolation.py resolves the %(section:key)s references between
+the values of a context dictionary.
+
+Every value is parsed once for the keys it references. A value is
+resolved after the values it references, exactly once, and the
+result is kept until the value or one of it's references changes.
+
+A reference inserts the referenced value as written, with it's own
+references resolved: only the %% escapes of the value being resolved
+are turned into %, as when values were formatted a single level deep.
+
+A value that can not be resolved (it references a key that does not
+exist, or it is part of a cycle) resolves to it's raw value.
+"""
+from __future__ import unicode_literals
+import logging
+import re
+import threading
+from collections import defaultdict
+
+from six import string_types
+
+logger = logging.getLogger(__name__)
+
+ESCAPED_SUFFIX = "|escaped"
+# matches %% escapes as well, so a reference is never read out of one
+REFERENCE_REGEX = re.compile(r"%(?:%|\(([^)]*)\))")
+
+
+def parse_references(value):
+    """ Return the keys referenced by the value, in order of appearance """
+    references = []
+    for reference in REFERENCE_REGEX.findall(text(value)):
+        if reference and reference not in references:
+            references.append(reference)
+    return references
+
+
+def base_key(key):
+    """ Return the key an escaped key is derived from, or the key itself """
+    if key.endswith(ESCAPED_SUFFIX):
+        return key[:-len(ESCAPED_SUFFIX)]
+    return key
+
+
+def text(value):
+    """ Return the value as a string, as values are not always strings (e.g. additional context) """
+    return value if isinstance(value, string_types) else str(value)
+
+
+class _Deferred(Exception):
+    """ Raised when a value depends on a key that can only be provided by prompting """
+
+
+class Interpolator(object):
+    """
+    Resolves values against a context dictionary of raw values.
+
+    <promptable> returns true for a missing key that can be provided by
+    prompting the user, and <prompt> provides it, adding it to the context.
+    Whoever changes the context should hold <lock> (a threading.RLock)
+    while changing it and invalidating the keys changed.
+    """
+
+    unresolved = None  # a dictionary of keys to the missing keys they reference
+    cyclic = None  # a set of keys that are part of a reference cycle
+
+    def __init__(self, context_dict, promptable=None, prompt=None, lock=None):
+        self.context_dict = context_dict
+        self.promptable = promptable or (lambda key: False)
+        self.prompt = prompt
+        self.unresolved = {}
+        self.cyclic = set()
+        self._references = {}  # the parsed references of each key
+        self._dependents = defaultdict(set)  # the keys that reference each key
+        self._resolved = {}
+        self._inserted = {}  # the value each key inserts where it's referenced, with %% escapes kept
+        self._lock = lock or threading.RLock()
+
+    def get(self, key):
+        """ Return the resolved value of key, prompting for missing inputs if necessary """
+        with self._lock:
+            if key not in self._resolved:
+                self.__resolve(key, prompt=True)
+            return self._resolved[key]
+
+    def interpolate(self, value):
+        """
+        Return <value>, which is not itself in the context (e.g. a value
+        the context overrides), with it's references resolved, prompting
+        for missing inputs if necessary. A value that can not be resolved
+        is returned as it is.
+        """
+        with self._lock:
+            references = parse_references(value)
+            for reference in references:
+                if reference not in self._resolved and self.__available(reference, True):
+                    self.__resolve(reference, prompt=True)
+            if [r for r in references if r not in self._resolved]:
+                return value
+            try:
+                return self.__format(value, references)[0]
+            except (ValueError, TypeError):
+                return value
+
+    def resolve_all(self):
+        """
+        Resolve every value in the context. Values that depend on keys
+        that have to be prompted for are left to be resolved when they
+        are first asked for.
+        """
+        with self._lock:
+            for key in sorted(self.context_dict.keys()):
+                if key not in self._resolved:
+                    try:
+                        self.__resolve(key, prompt=False)
+                    except _Deferred:
+                        pass
+            for key, missing in sorted(self.unresolved.items()):
+                logger.debug("Unable to resolve %s, missing %s" % (key, ", ".join(missing)))
+            if self.cyclic:
+                logger.warn("Values referencing each other can not be resolved: %s" %
+                            ", ".join(sorted(self.cyclic)))
+
+    def error(self, key):
+        """ Return why key could not be resolved, or None if it was """
+        with self._lock:
+            if key in self.cyclic:
+                return "%s is part of a reference cycle" % key
+            if key in self.unresolved:
+                missing = self.unresolved[key]
+                return "missing %s" % ", ".join(missing) if missing else "invalid format"
+            return None
+
+    def invalidate(self, key):
+        """ Forget the resolution of key and every value that references it """
+        with self._lock:
+            for reference in self._references.pop(key, []):
+                self._dependents[reference].discard(key)
+            stale = [key, key + ESCAPED_SUFFIX]
+            seen = set()
+            while stale:
+                stale_key = stale.pop()
+                if stale_key in seen:
+                    continue
+                seen.add(stale_key)
+                self._resolved.pop(stale_key, None)
+                self._inserted.pop(stale_key, None)
+                self.unresolved.pop(stale_key, None)
+                self.cyclic.discard(stale_key)
+                stale.extend(self._dependents[stale_key])
+
+    def __references(self, key):
+        if key not in self._references:
+            if key.endswith(ESCAPED_SUFFIX):
+                references = [base_key(key)]
+            else:
+                references = parse_references(self.context_dict[key])
+            self._references[key] = references
+            for reference in references:
+                self._dependents[reference].add(key)
+        return self._references[key]
+
+    def __available(self, key, prompt):
+        """ Return true if key exists in the context, prompting for it if allowed """
+        if base_key(key) in self.context_dict:
+            return True
+        if self.promptable(base_key(key)):
+            if not prompt:
+                raise _Deferred(key)
+            self.prompt(base_key(key))
+            return base_key(key) in self.context_dict
+        return False
+
+    def __resolve(self, key, prompt):
+        """ resolve key after the keys it references, with an explicit stack """
+        if not self.__available(key, prompt):
+            raise KeyError(key)
+        stack, on_stack = [key], set([key])
+        while stack:
+            current = stack[-1]
+            pending = None
+            for reference in self.__references(current):
+                if reference in self._resolved or not self.__available(reference, prompt):
+                    continue
+                if reference in on_stack:
+                    self.cyclic.update(stack[stack.index(reference):])
+                    continue
+                pending = reference
+                break
+            if pending is not None:
+                stack.append(pending)
+                on_stack.add(pending)
+                continue
+            on_stack.discard(stack.pop())
+            self._resolved[current], self._inserted[current] = self.__render(current)
+
+    def __render(self, key):
+        """ return the resolved value of key, and the value it inserts where it's referenced """
+        if key.endswith(ESCAPED_SUFFIX):
+            value = re.escape(text(self._inserted[base_key(key)]) or "")
+            return value, value
+        raw = self.context_dict[key]
+        if key in self.cyclic:
+            return raw, raw
+        references = self.__references(key)
+        missing = [r for r in references if r not in self._resolved]
+        if missing:
+            self.unresolved[key] = missing
+            return raw, raw
+        try:
+            return self.__format(raw, references)
+        except (ValueError, TypeError):
+            self.unresolved[key] = []
+            return raw, raw
+
+    def __format(self, raw, references):
+        """ return raw with it's references inserted, with and without it's %% escapes kept """
+        raw = text(raw)
+        values = dict((r, self._inserted[r]) for r in references)
+        value = raw % values
+        if "%%" not in raw:
+            return value, value
+        return value, raw.replace("%%", "%%%%") % values
@@ -10,25 +10,31 @@ The manifest can take a source and/or a target manifest
 """
 from __future__ import unicode_literals
 
+import binascii
+import hashlib
 import logging
 import os
 import re
 import sys
+import threading
 from io import StringIO
 
 from six.moves import configparser
 from six import string_types
-import requests
 import sprinter.lib as lib
 from sprinter.lib.compatability import create_configparser
 from sprinter.lib.dependencytree import DependencyTree, DependencyTreeException
+from sprinter.lib.scheduler import run_in_dependency_order
+from sprinter.lib.tracing import span
 from .featureconfig import FeatureConfig
 from .inputs import Inputs
+from .interpolation import Interpolator, ESCAPED_SUFFIX, base_key, parse_references, text
 
 CONFIG_RESERVED = ['source', 'inputs']
 FEATURE_RESERVED = ['rc', 'command', 'phase']
 NAMESPACE_REGEX = re.compile('([a-zA-Z0-9_]+)(\.[a-zA-Z0-9_]+)?$')
 MANIFEST_NULL_KEY = object()
+MAX_CONCURRENT_FETCHES = 8  # the most manifest parents fetched at once
 
 logger = logging.getLogger(__name__)
 
@@ -49,33 +55,20 @@ def load_manifest(raw_manifest, namespace=None, **kwargs):
     return Manifest(manifest, namespace=namespace)
 
 
-def _load_manifest_interpret_source(manifest, source, username=None, password=None, verify_certificate=True, do_inherit=True):
-    """ Interpret the <source>, and load the results into <manifest> """
+def _load_manifest_interpret_source(manifest, source, username=None, password=None, verify_certificate=True, do_inherit=True,
+                                    cache=None):
+    """
+    Interpret the <source>, and load the results into <manifest>.
+    Urls are fetched through <cache> (an HttpCache), if one is passed.
+    """
     try:
-        if isinstance(source, string_types):
-            if source.startswith("http"):
-                # if manifest is a url
-                _load_manifest_from_url(manifest, source,
-                                        verify_certificate=verify_certificate,
-                                        username=username, password=password)
-            else:
-                _load_manifest_from_file(manifest, source)
-            if not manifest.has_option('config', 'source'):
-                manifest.set('config', 'source', str(source))
-        else:
-            # assume source is a file pointer
-            manifest.readfp(source)
+        _load_manifest_source(manifest, source, username=username, password=password,
+                              verify_certificate=verify_certificate, cache=cache)
         if manifest.has_option('config', 'extends') and do_inherit:
-            parent_manifest = configparser.RawConfigParser()
-            _load_manifest_interpret_source(parent_manifest,
-                                            manifest.get('config', 'extends'),
-                                            username=username,
-                                            password=password,
-                                            verify_certificate=verify_certificate)
-            for s in parent_manifest.sections():
-                for k, v in parent_manifest.items(s):
-                    if not manifest.has_option(s, k):
-                        manifest.set(s, k, v)
+            parents = _load_manifest_ancestors(manifest, username=username, password=password,
+                                               verify_certificate=verify_certificate, cache=cache)
+            root = manifest.get('config', 'source') if manifest.has_option('config', 'source') else None
+            _inherit_manifest_parents(manifest, parents, {}, [root])
 
     except configparser.Error:
         logger.debug("", exc_info=True)
@@ -83,10 +76,97 @@ def _load_manifest_interpret_source(manifest, source, username=None, password=No
         raise ManifestException("Unable to parse manifest!: {0}".format(error_message))
 
 
-def _load_manifest_from_url(manifest, url, verify_certificate=True, username=None, password=None):
+def _load_manifest_source(manifest, source, **kwargs):
+    """ load the <source> itself into <manifest>, without it's parents """
+    if isinstance(source, string_types):
+        with span("load manifest", "manifest", source=source):
+            if source.startswith("http"):
+                # if manifest is a url
+                _load_manifest_from_url(manifest, source, **kwargs)
+            else:
+                _load_manifest_from_file(manifest, source)
+        if not manifest.has_section('config'):
+            manifest.add_section('config')
+        if not manifest.has_option('config', 'source'):
+            manifest.set('config', 'source', str(source))
+    else:
+        # assume source is a file pointer
+        manifest.readfp(source)
+
+
+def _manifest_parents(manifest):
+    """ return the sources a manifest extends, in order of precedence """
+    if not manifest.has_option('config', 'extends'):
+        return []
+    parents = []
+    for parent in manifest.get('config', 'extends').split(','):
+        parent = parent.strip()
+        if parent and parent not in parents:
+            parents.append(parent)
+    return parents
+
+
+def _load_manifest_ancestors(manifest, **kwargs):
+    """
+    Load every ancestor of <manifest>, returning a dictionary of
+    sources to their (uninherited) manifests. Each generation is
+    fetched concurrently, and every source is fetched only once.
+    """
+    ancestors = {}
+
+    def load(source):
+        parent = configparser.RawConfigParser()
+        _load_manifest_source(parent, source, **kwargs)
+        ancestors[source] = parent
+
+    generation = _manifest_parents(manifest)
+    while generation:
+        run_in_dependency_order(generation, {}, load,
+                                workers=min(len(generation), MAX_CONCURRENT_FETCHES))
+        next_generation = []
+        for source in generation:
+            for parent in _manifest_parents(ancestors[source]):
+                if parent not in ancestors and parent not in next_generation:
+                    next_generation.append(parent)
+        generation = next_generation
+    return ancestors
+
+
+def _inherit_manifest_parents(manifest, ancestors, inherited, chain):
+    """
+    Fill in the values <manifest> does not set from it's parents,
+    earlier parents taking precedence over later ones. <inherited>
+    holds the ancestors that have already inherited their own parents,
+    and <chain> the sources that lead to <manifest>.
+    """
+    for source in _manifest_parents(manifest):
+        if source in chain:
+            cycle = chain[chain.index(source):] + [source]
+            raise ManifestException("Manifest inheritance is cyclic: {0}".format(" -> ".join(cycle)))
+        parent = ancestors[source]
+        if source not in inherited:
+            _inherit_manifest_parents(parent, ancestors, inherited, chain + [source])
+            inherited[source] = parent
+        for s in parent.sections():
+            if not manifest.has_section(s):
+                manifest.add_section(s)
+            for k, v in parent.items(s):
+                if not manifest.has_option(s, k):
+                    manifest.set(s, k, v)
+
+
+def _load_manifest_from_url(manifest, url, verify_certificate=True, username=None, password=None, cache=None):
     """ load a url body into a manifest """
+    import requests
+    if username and password:
+        # so the other requests to the host (e.g. templates) authenticate as well
+        lib.request.SESSION_MANAGER.bind_auth(url, (username, password))
     try:
-        if username and password:
+        if cache:
+            auth = (username, password) if username and password else None
+            manifest_file_handler = StringIO(cache.get(url, auth=auth,
+                                                       verify=verify_certificate).decode("utf-8"))
+        elif username and password:
             manifest_file_handler = StringIO(lib.authenticated_get(username, password, url,
                                                                    verify=verify_certificate).decode("utf-8"))
         else:
@@ -111,6 +191,43 @@ class ManifestException(Exception):
     """ Returned if an exception occurred with the manifest """
 
 
+class ContextDict(dict):
+    """
+    The context variables of a manifest. The escaped variant of a
+    value ("section:key|escaped") is only computed once it is asked for.
+    """
+
+    def __missing__(self, key):
+        base_key = self.__base_key(key)
+        if base_key is None:
+            raise KeyError(key)
+        value = re.escape(str(self[base_key]) or "")
+        self[key] = value
+        return value
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or self.__base_key(key) is not None
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def discard(self, key):
+        """ Remove a key, along with it's escaped variant """
+        self.pop(key, None)
+        self.pop(key + ESCAPED_SUFFIX, None)
+
+    def __base_key(self, key):
+        """ Return the unescaped key if key is an escaped variant of an existing key """
+        if key.endswith(ESCAPED_SUFFIX):
+            base_key = key[:-len(ESCAPED_SUFFIX)]
+            if dict.__contains__(self, base_key):
+                return base_key
+        return None
+
+
 class Manifest(object):
     """
     A representation of a manifest object
@@ -125,9 +242,14 @@ class Manifest(object):
     """
     dtree = None  # dependency tree object to ascertain order
     additional_context_variables = {}  # a list of the additional context variables available
+    prompt_inputs = True  # prompt for the inputs that values being resolved need, and are not set
 
     def __init__(self, raw_manifest, namespace=None):
         self.manifest = raw_manifest
+        self.additional_context_variables = {}
+        self._context_dict = None  # built on first use, and kept up to date afterwards
+        self._interpolator = None  # resolves references between context values
+        self._context_lock = threading.RLock()  # held while the context dict or it's resolutions change
         if not self.manifest.has_section('config'):
             self.manifest.add_section('config')
         self.inputs = self.__setup_inputs()
@@ -143,6 +265,78 @@ class Manifest(object):
         else:
             return [s for s in self.manifest.sections() if s != "config"]
 
+    def copy_sections(self, manifest, sections):
+        """
+        Replace each of <sections> with it's configuration in
+        <manifest>, removing the ones <manifest> does not have, and
+        regenerate the dependency tree.
+        """
+        for section in sections:
+            if self.manifest.has_section(section):
+                self.remove_section(section)
+            if manifest.has_section(section):
+                self.manifest.add_section(section)
+                for k, v in manifest.manifest.items(section):
+                    self.set(section, k, v)
+        self.dtree = self.__generate_dependency_tree()
+
+    def fingerprint(self, section, facts=()):
+        """
+        Return a hash of the configuration of feature <section>: it's
+        raw values, the raw values they reference (transitively), and
+        <facts> about the system. Secret inputs are hashed with a salt
+        kept in the manifest, so they are never written out as is, and
+        are prompted for if they are not set yet.
+        """
+        context_dict = self.get_context_dict()
+        checksum = hashlib.sha1()
+        for fact in facts:
+            checksum.update(("%s\n" % fact).encode('utf-8'))
+        keys = ["%s:%s" % (section, k) for k in sorted(self.manifest.options(section))]
+        seen = set()
+        while keys:
+            key = base_key(keys.pop(0))
+            if key in seen:
+                continue
+            seen.add(key)
+            section_name, _, option = key.partition(':')
+            if section_name == 'config' and self.inputs.is_secret(option):
+                value = self.__secret_digest(key)
+            elif key in context_dict:
+                value = text(context_dict[key])
+                keys.extend(parse_references(value))
+            else:
+                value = "<unset>"
+            checksum.update(("%s=%s\n" % (key, value)).encode('utf-8'))
+        return checksum.hexdigest()
+
+    def __secret_digest(self, key):
+        """ return a salted digest of the secret input <key>, or <unset> if it can't be prompted for """
+        try:
+            value = self.resolve(key)
+        except KeyError:
+            return "<unset>"
+        if not self.has_option('config', 'fingerprint_salt'):
+            self.set('config', 'fingerprint_salt', binascii.hexlify(os.urandom(16)).decode('ascii'))
+        salt = self.get('config', 'fingerprint_salt')
+        return hashlib.sha256(("%s\n%s" % (salt, text(value))).encode('utf-8')).hexdigest()
+
+    def fingerprints(self):
+        """ Return the fingerprints recorded in the manifest, by feature """
+        if not self.has_option('config', 'fingerprints'):
+            return {}
+        fingerprints = {}
+        for line in self.get('config', 'fingerprints').splitlines():
+            if line.strip():
+                feature, fingerprint = line.split()
+                fingerprints[feature] = fingerprint
+        return fingerprints
+
+    def set_fingerprints(self, fingerprints):
+        """ Record the fingerprints of features, so a later update can tell if they changed """
+        self.set('config', 'fingerprints',
+                 "\n".join("%s %s" % item for item in sorted(fingerprints.items())))
+
     def source(self):
         """
         Return the manifest source
@@ -167,6 +361,25 @@ class Manifest(object):
             self.inputs.set_input(key, value)
         self.set('config', key, value)
 
+    def set(self, section, key, value):
+        """ Set the value of the section key combo """
+        with self._context_lock:
+            self.manifest.set(section, key, value)
+            self.__refresh_context("%s:%s" % (section, key))
+
+    def remove_option(self, section, key):
+        """ Remove the section key combo """
+        with self._context_lock:
+            removed = self.manifest.remove_option(section, key)
+            self.__refresh_context("%s:%s" % (section, key))
+        return removed
+
+    def remove_section(self, section):
+        """ Remove the section and all of it's keys """
+        with self._context_lock:
+            self._context_dict, self._interpolator = None, None
+            return self.manifest.remove_section(section)
+
     def write(self, file_handle):
         """ write the current state to a file manifest """
         for k, v in self.inputs.write_values().items():
@@ -176,26 +389,71 @@ class Manifest(object):
 
     def grab_inputs(self, force=False):
         self.inputs.prompt_unset_inputs(force=force)
+        with self._context_lock:
+            self._context_dict, self._interpolator = None, None
+
+    def get_input(self, key):
+        """ Return the value of input <key>, prompting for it if it's not set yet """
+        value = self.inputs.get_input(key)
+        self.__refresh_context("config:%s" % key)
+        return value
+
+    def dependencies(self, section):
+        """ Return the list of sections that <section> depends on """
+        if not self.manifest.has_option(section, 'depends'):
+            return []
+        return [d.strip() for d in re.split('\n|,', self.manifest.get(section, 'depends'))]
 
     def get_feature_config(self, feature_name):
         """ Return a FeatureConfig for the feature name provided """
         return FeatureConfig(self, feature_name)
 
     def get_context_dict(self):
-        """ return a context dict of the desired state """
-        context_dict = {}
-        for s in self.sections():
-            for k, v in self.manifest.items(s):
-                context_dict["%s:%s" % (s, k)] = v
-        for k, v in self.inputs.values().items():
-            context_dict["config:{0}".format(k)] = v
-        context_dict.update(self.additional_context_variables.items())
-        context_dict.update(dict([("%s|escaped" % k, re.escape(str(v) or "")) for k, v in context_dict.items()]))
-        return context_dict
+        """
+        return a context dict of the desired state.
+
+        The dictionary is shared between calls and kept up to date
+        as the manifest changes, so it should not be modified.
+        """
+        with self._context_lock:
+            if self._context_dict is None:
+                context_dict = ContextDict()
+                for s in self.sections():
+                    for k, v in self.manifest.items(s):
+                        context_dict["%s:%s" % (s, k)] = v
+                for k, v in self.inputs.values().items():
+                    context_dict["config:{0}".format(k)] = v
+                context_dict.update(self.additional_context_variables.items())
+                self._context_dict = context_dict
+            return self._context_dict
+
+    def resolve(self, key):
+        """
+        Return the value of the context key <key> (e.g. 'section:key'),
+        with every reference to another key resolved.
+
+        A manifest value overridden by additional context resolves to
+        it's own value, while the values referencing it see the override.
+        """
+        if key in self.additional_context_variables and ':' in key:
+            section, option = key.split(':', 1)
+            if self.manifest.has_option(section, option):
+                return self.__get_interpolator().interpolate(self.manifest.get(section, option))
+        return self.__get_interpolator().get(key)
+
+    def resolve_all(self):
+        """ Resolve every value in the manifest, reporting values that can't be resolved """
+        self.__get_interpolator().resolve_all()
+
+    def resolution_error(self, key):
+        """ Return why the context key <key> could not be resolved, or None """
+        return self.__get_interpolator().error(key)
 
     def add_additional_context(self, additional_context):
         """ Add additional context variable """
         self.additional_context_variables.update(additional_context)
+        for key in additional_context:
+            self.__refresh_context(key)
 
     def get(self, section, key, default=MANIFEST_NULL_KEY):
         """ Returns the value if it exist, or default if default is set """
@@ -203,6 +461,40 @@ class Manifest(object):
             return default
         return self.manifest.get(section, key)
 
+    def __get_interpolator(self):
+        with self._context_lock:
+            if self._interpolator is None:
+                self._interpolator = Interpolator(
+                    self.get_context_dict(),
+                    promptable=lambda key: (self.prompt_inputs and key.startswith('config:') and
+                                            self.inputs.is_input(key.split(':', 1)[1])),
+                    prompt=lambda key: self.get_input(key.split(':', 1)[1]),
+                    lock=self._context_lock)
+            return self._interpolator
+
+    def __refresh_context(self, key):
+        """
+        Update a single key of the context dict, if it's been built,
+        with the same precedence as get_context_dict:
+        additional context, then inputs, then the manifest itself.
+
+        The interpolator resolves values under the same lock, so it
+        never sees the key half updated.
+        """
+        with self._context_lock:
+            if self._context_dict is None:
+                return
+            self._context_dict.discard(key)
+            section, option = key.split(':', 1) if ':' in key else (None, None)
+            if key in self.additional_context_variables:
+                self._context_dict[key] = self.additional_context_variables[key]
+            elif section == 'config' and option in self.inputs.values():
+                self._context_dict[key] = self.inputs.values()[option]
+            elif section is not None and self.manifest.has_option(section, option):
+                self._context_dict[key] = self.manifest.get(section, option)
+            if self._interpolator is not None:
+                self._interpolator.invalidate(key)
+
     def __parse_namespace(self):
         """
         Parse the namespace from various sources
@@ -220,15 +512,11 @@ class Manifest(object):
         Generate the dependency tree object
         """
         dependency_dict = {}
-        for s in self.manifest.sections():
-            if s != "config":
-                if self.manifest.has_option(s, 'depends'):
-                    dependency_list = [d.strip() for d in re.split('\n|,', self.manifest.get(s, 'depends'))]
-                    dependency_dict[s] = dependency_list
-                else:
-                    dependency_dict[s] = []
+        sections = [s for s in self.manifest.sections() if s != "config"]
+        for s in sections:
+            dependency_dict[s] = self.dependencies(s)
         try:
-            return DependencyTree(dependency_dict)
+            return DependencyTree(dependency_dict, node_order=sections)
         except DependencyTreeException:
             dte = sys.exc_info()[1]
             raise ManifestException("Dependency tree for manifest is invalid! %s" % str(dte))
@@ -0,0 +1,61 @@
+from __future__ import unicode_literals
+from io import StringIO
+
+from mock import patch
+from nose import tools
+
+from sprinter.core.manifest import load_manifest
+import sprinter.lib as lib
+
+manifest_with_inputs = """
+[config]
+namespace = sprinter
+inputs = username
+
+[git]
+formula = sprinter.formula.git
+user = %(config:username)s
+url = %(config:undefined)s
+home = /home/%(git:user)s
+"""
+
+
+class TestFeatureConfig(object):
+
+    def setup(self):
+        self.manifest = load_manifest(StringIO(manifest_with_inputs))
+        self.feature_config = self.manifest.get_feature_config('git')
+
+    @patch.object(lib, 'prompt')
+    def test_get_prompts_for_input_once(self, prompt):
+        """ An unset input should be prompted for once, and reused afterwards """
+        prompt.return_value = "toumorokoshi"
+        tools.eq_(self.feature_config.get('user'), "toumorokoshi")
+        tools.eq_(self.feature_config.get('user'), "toumorokoshi")
+        tools.eq_(prompt.call_count, 1)
+
+    def test_get_unresolvable(self):
+        """ A value referencing a missing key should be returned unspecialized """
+        tools.eq_(self.feature_config.get('url'), "%(config:undefined)s")
+
+    def test_set_updates_context(self):
+        """ Setting a value should be reflected in values that reference it """
+        self.feature_config.set('name', 'git')
+        self.feature_config.set('path', '/opt/%(git:name)s')
+        tools.eq_(self.feature_config.get('path'), '/opt/git')
+        self.feature_config.set('name', 'hg')
+        tools.eq_(self.feature_config.get('path'), '/opt/hg')
+
+    @patch.object(lib, 'prompt')
+    def test_get_resolves_transitively(self, prompt):
+        """ A value referencing another reference should be fully resolved """
+        prompt.return_value = "toumorokoshi"
+        tools.eq_(self.feature_config.get('home'), "/home/toumorokoshi")
+
+    def test_get_own_value_over_additional_context(self):
+        """ A feature should read it's own value, while references see the additional context """
+        self.feature_config.set('root_dir', '/custom')
+        self.feature_config.set('bin', '%(git:root_dir)s/bin')
+        self.manifest.add_additional_context({'git:root_dir': '/install/git'})
+        tools.eq_(self.feature_config.get('root_dir'), '/custom')
+        tools.eq_(self.feature_config.get('bin'), '/install/git/bin')
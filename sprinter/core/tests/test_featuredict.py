@@ -4,6 +4,7 @@ from mock import Mock
 from io import StringIO
 from six.moves import configparser
 from sprinter.core.featuredict import FeatureDict
+from sprinter.core.formulastore import FormulaStore
 from sprinter.core.manifest import Manifest
 
 source_config = """
@@ -47,7 +48,7 @@ class TestFeatureDict():
         self.feature_dict = FeatureDict(Mock(),
                                         self.source_manifest,
                                         self.target_manifest,
-                                        "dummy_path")
+                                        FormulaStore("dummy_path"))
 
     def test_run_order(self):
         """ run_order should return the order in which features should run """
@@ -56,3 +57,39 @@ class TestFeatureDict():
                                                    ('osx', 'sprinter.formula.base'),
                                                    ('osx2', 'sprinter.formula.base'),
                                                    ('debian', 'sprinter.formula.base')]))
+
+    def test_dependency_dict(self):
+        """ dependency_dict should order installs after, and removals before, their dependencies """
+        source_rawconfig = configparser.RawConfigParser()
+        source_rawconfig.readfp(StringIO(dependency_source_config))
+        target_rawconfig = configparser.RawConfigParser()
+        target_rawconfig.readfp(StringIO(dependency_target_config))
+        feature_dict = FeatureDict(Mock(),
+                                   Manifest(source_rawconfig),
+                                   Manifest(target_rawconfig),
+                                   FormulaStore("dummy_path"))
+        dependency_dict = feature_dict.dependency_dict()
+        eq_(dependency_dict[('app', 'sprinter.formula.base')],
+            [('runtime', 'sprinter.formula.base')])
+        eq_(dependency_dict[('runtime', 'sprinter.formula.base')], [])
+        eq_(dependency_dict[('oldlib', 'sprinter.formula.base')],
+            [('oldapp', 'sprinter.formula.base')])
+        eq_(dependency_dict[('oldapp', 'sprinter.formula.base')], [])
+
+dependency_source_config = """
+[oldapp]
+formula = sprinter.formula.base
+depends = oldlib
+
+[oldlib]
+formula = sprinter.formula.base
+""".strip()
+
+dependency_target_config = """
+[app]
+formula = sprinter.formula.base
+depends = runtime
+
+[runtime]
+formula = sprinter.formula.base
+""".strip()
@@ -0,0 +1,107 @@
+from __future__ import unicode_literals
+import os
+import shutil
+import sys
+import tempfile
+from io import StringIO
+
+from mock import Mock, patch
+from nose import tools
+
+import sprinter.lib as lib
+from sprinter.core.featuredict import FeatureDict
+from sprinter.core.formulastore import FormulaStore
+from sprinter.core.manifest import load_manifest
+
+SETUP_PY = """
+from setuptools import setup
+setup(name='%(name)s', version='0.1', packages=['%(name)s'])
+"""
+
+FORMULA = """
+from sprinter.formula.base import FormulaBase
+
+
+class StoredFormula(FormulaBase):
+    pass
+"""
+
+
+class TestFormulaStore(object):
+
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.store = FormulaStore(os.path.join(self.temp_dir, "formulas"))
+        self.sys_path = list(sys.path)
+
+    def teardown(self):
+        sys.path[:] = self.sys_path
+        shutil.rmtree(self.temp_dir)
+
+    def _package(self, name):
+        """ create a package with a formula, returning it's path """
+        path = os.path.join(self.temp_dir, name)
+        os.makedirs(os.path.join(path, name))
+        with open(os.path.join(path, "setup.py"), 'w') as fh:
+            fh.write(SETUP_PY % {'name': name})
+        with open(os.path.join(path, name, "__init__.py"), 'w') as fh:
+            fh.write(FORMULA)
+        return path
+
+    def test_install(self):
+        """ An installed requirement should be importable, and listed """
+        path = self._package("storedformulaone")
+        tools.eq_(self.store.install_all([path]), {})
+        assert self.store.is_installed(path)
+        assert os.path.exists(os.path.join(self.store.path(path), "storedformulaone", "__init__.py"))
+        tools.eq_(list(self.store.installed().keys()), [path])
+        assert self.store.path(path) in sys.path
+
+    def test_feature_dict_installs_formulas(self):
+        """ A formula that can not be imported should be installed to the store, and used """
+        path = self._package("storedformulatwo")
+        manifest = load_manifest(StringIO("[feature]\nformula = storedformulatwo:%s\n" % path))
+        features = FeatureDict(Mock(), None, manifest, self.store)
+        tools.eq_(type(features[('feature', 'storedformulatwo:%s' % path)]).__name__, "StoredFormula")
+
+    @patch.object(lib, 'call')
+    def test_reuse(self, call):
+        """ An installed requirement should be reused without running pip """
+        os.makedirs(self.store.path("mypkg==1.0"))
+        with open(os.path.join(self.store.path("mypkg==1.0"), "requirement.json"), 'w') as fh:
+            fh.write('{"requirement": "mypkg==1.0", "python": "", "installed": 0}')
+        tools.eq_(self.store.install_all(["mypkg==1.0"]), {})
+        assert not call.called
+        assert self.store.path("mypkg==1.0") in sys.path
+
+    @patch.object(lib, 'call')
+    def test_failure(self, call):
+        """ A requirement pip can not install should be returned with it's error, and not be installed """
+        call.return_value = (1, b"No distributions found")
+        errors = self.store.install_all(["mypkg==1.0", "otherpkg"], jobs=2)
+        tools.eq_(sorted(errors.keys()), ["mypkg==1.0", "otherpkg"])
+        assert "No distributions found" in errors["mypkg==1.0"]
+        assert not self.store.is_installed("mypkg==1.0")
+        tools.eq_(os.listdir(self.store.root), [])
+
+    @patch.object(lib, 'call')
+    def test_failed_refresh_keeps_install(self, call):
+        """ A requirement that fails to refresh should stay installed """
+        os.makedirs(self.store.path("mypkg"))
+        with open(os.path.join(self.store.path("mypkg"), "requirement.json"), 'w') as fh:
+            fh.write('{"requirement": "mypkg", "python": "", "installed": 0}')
+        call.return_value = (1, b"")
+        tools.eq_(list(self.store.refresh().keys()), ["mypkg"])
+        assert call.called
+        assert self.store.is_installed("mypkg")
+
+    @patch.object(lib, 'call')
+    def test_pip_install_streams(self, call):
+        """ pip should run through lib.call, streaming it's output """
+        call.return_value = (0, b"")
+        self.store.install_all(["mypkg==1.0"])
+        command = call.call_args[0][0]
+        assert command.startswith("%s -m pip install --quiet --target " % sys.executable), command
+        assert command.endswith(" mypkg==1.0"), command
+        tools.eq_(call.call_args[1]['stream'], True)
+        tools.eq_(call.call_args[1]['env']['PIP_DISABLE_PIP_VERSION_CHECK'], "1")
@@ -0,0 +1,81 @@
+from __future__ import unicode_literals
+import re
+
+from mock import Mock
+from nose import tools
+
+from sprinter.core.interpolation import Interpolator, parse_references
+
+context = {
+    'config:root': '/opt',
+    'java:root_dir': '%(config:root)s/java',
+    'java:bin': '%(java:root_dir)s/bin',
+    'java:escaped': '%(java:root_dir|escaped)s',
+    'java:percent': '100%%',
+    'java:share': '%(java:percent)s of %(java:bin)s, 50%%',
+    'a:one': '%(a:two)s',
+    'a:two': '%(a:one)s',
+    'a:missing': '%(a:nonexistent)s',
+    'a:user': '%(config:username)s'
+}
+
+
+class TestInterpolator(object):
+
+    def setup(self):
+        self.context = dict(context)
+        self.interpolator = Interpolator(self.context)
+
+    def test_parse_references(self):
+        """ references should be parsed in order, ignoring %% escapes """
+        tools.eq_(parse_references("%(a:b)s %%(c:d)s %(e:f)s %(a:b)s"), ['a:b', 'e:f'])
+
+    def test_transitive(self):
+        """ references should resolve through other references """
+        tools.eq_(self.interpolator.get('java:bin'), '/opt/java/bin')
+        tools.eq_(self.interpolator.get('java:escaped'), re.escape('/opt/java'))
+        tools.eq_(self.interpolator.get('java:percent'), '100%')
+
+    def test_referenced_escapes(self):
+        """ a referenced value should keep it's %% escapes, and only the value resolved lose them """
+        tools.eq_(self.interpolator.get('java:share'), '100%% of /opt/java/bin, 50%')
+        tools.eq_(self.interpolator.get('java:percent'), '100%')
+
+    def test_interpolate(self):
+        """ a value outside the context should resolve against it """
+        tools.eq_(self.interpolator.interpolate('%(java:bin)s/java %(java:percent)s%%'), '/opt/java/bin/java 100%%%')
+        tools.eq_(self.interpolator.interpolate('%(a:nonexistent)s'), '%(a:nonexistent)s')
+
+    def test_cycle(self):
+        """ values in a cycle should resolve to their raw value, and be reported """
+        self.interpolator.resolve_all()
+        tools.eq_(self.interpolator.get('a:one'), '%(a:two)s')
+        tools.eq_(self.interpolator.cyclic, set(['a:one', 'a:two']))
+        assert self.interpolator.error('a:one')
+
+    def test_missing(self):
+        """ values with missing references should resolve to their raw value, and be reported """
+        tools.eq_(self.interpolator.get('a:missing'), '%(a:nonexistent)s')
+        tools.eq_(self.interpolator.error('a:missing'), "missing a:nonexistent")
+        tools.eq_(self.interpolator.error('java:bin'), None)
+
+    def test_invalidate(self):
+        """ changing a value should re-resolve everything that references it """
+        tools.eq_(self.interpolator.get('java:bin'), '/opt/java/bin')
+        self.context['config:root'] = '/usr'
+        self.interpolator.invalidate('config:root')
+        tools.eq_(self.interpolator.get('java:bin'), '/usr/java/bin')
+        self.context['a:nonexistent'] = 'here'
+        self.interpolator.invalidate('a:nonexistent')
+        tools.eq_(self.interpolator.get('a:missing'), 'here')
+
+    def test_prompt_deferred(self):
+        """ resolve_all should not prompt, but get should """
+        prompt = Mock(side_effect=lambda key: self.context.update({key: 'toumorokoshi'}))
+        self.interpolator = Interpolator(self.context,
+                                         promptable=lambda key: key == 'config:username',
+                                         prompt=prompt)
+        self.interpolator.resolve_all()
+        assert not prompt.called
+        tools.eq_(self.interpolator.get('a:user'), 'toumorokoshi')
+        prompt.assert_called_once_with('config:username')
@@ -1,4 +1,5 @@
 from __future__ import unicode_literals
+import hashlib
 import logging
 import os
 import sys
@@ -9,9 +10,14 @@ from functools import wraps
 from collections import defaultdict
 
 import sprinter.lib as lib
-from sprinter.core import PHASE, load_global_config, Directory, Injections, Manifest, load_manifest, FeatureDict
+from sprinter.core import PHASE, load_global_config, Directory, Injections, Manifest, load_manifest, FeatureDict, FormulaStore
 from sprinter.core.templates import shell_utils_template, source_template
 from sprinter.lib import SprinterException, system
+from sprinter.lib.gitmirrors import GitMirrors
+from sprinter.lib.httpcache import HttpCache, DownloadCache, DEFAULT_TTL, DEFAULT_MAX_SIZE
+from sprinter.lib.scheduler import run_in_dependency_order
+from sprinter.lib.tracing import span
+from sprinter.lib.wheelhouse import Wheelhouse
 from sprinter.external import brew
 
 
@@ -26,6 +32,20 @@ def warmup(f):
     return wrapped
 
 
+def stage(name):
+    """ Decorator to profile a method as the lifecycle stage <name>, if the environment is profiled """
+
+    def decorator(f):
+        @wraps(f)
+        def wrapped(self, *args, **kwargs):
+            if self.profiler is None:
+                return f(self, *args, **kwargs)
+            with self.profiler.stage(name):
+                return f(self, *args, **kwargs)
+        return wrapped
+    return decorator
+
+
 def install_required(f):
     """ Return an exception if the namespace is not already installed """
 
@@ -65,6 +85,34 @@ for shell, shell_config in SHELL_CONFIG.items():
 CONFIG_FILES = RC_FILES + ENV_FILES
 
 
+def _module_digest(cls):
+    """ return a hash of the source of the module cls is defined in, so a new version is told apart """
+    path = getattr(sys.modules.get(cls.__module__), '__file__', None)
+    if not path:
+        return ""
+    if path.endswith((".pyc", ".pyo")) and os.path.exists(path[:-1]):
+        path = path[:-1]
+    try:
+        with open(path, 'rb') as fh:
+            return hashlib.sha1(fh.read()).hexdigest()
+    except (IOError, OSError):
+        return ""
+
+
+def _config_changes(source, target):
+    """
+    return the raw values that differ between the source and target
+    config of a feature, as a dictionary of (source, target) tuples
+    """
+    source_dict = source.raw_dict if source else {}
+    target_dict = target.raw_dict if target else {}
+    changes = {}
+    for key in set(source_dict) | set(target_dict):
+        if source_dict.get(key) != target_dict.get(key):
+            changes[key] = (source_dict.get(key), target_dict.get(key))
+    return changes
+
+
 class Environment(object):
 
     source = None  # the path to the source handle, the handle itself, or a manifest instance
@@ -88,6 +136,17 @@ class Environment(object):
     # specifies where to get the global sprinter root
     global_config = None  # configuration file, which defaults to loading from SPRINTER_ROOT/.global/config.cfg
     ignore_errors = False  # ignore errors in features
+    jobs = 1  # the number of independent features to sync concurrently
+    manifest_cache = None  # the cache remote manifests are fetched through
+    download_cache = None  # the cache archives and binaries are downloaded through
+    formula_store = None  # where third party formulas are installed
+    git_mirrors = None  # the local mirrors git repositories are cloned from, if they are used
+    pip_cache = None  # pip's cache, shared by every feature installing eggs
+    wheelhouse = None  # the wheels pip looks in first, shared by every feature installing eggs
+    offline = False  # install eggs from the wheelhouse only
+    prefetch_jobs = 4  # the number of artifacts to download at once, before syncing
+    force = False  # sync every feature, even those unchanged since their last sync
+    profiler = None  # profiles the stages of the run, if set
 
     def __init__(self,
                  logger=None,
@@ -118,17 +177,48 @@ class Environment(object):
         self.shell_util_path = os.path.join(self.global_path, "utils.sh")
         self.main_manifest = None
 
+        manifest_ttl = DEFAULT_TTL
+        if self.global_config.has_option('global', 'manifest_cache_ttl'):
+            manifest_ttl = int(self.global_config.get('global', 'manifest_cache_ttl'))
+        self.manifest_cache = HttpCache(os.path.join(self.global_path, "manifests"), ttl=manifest_ttl)
+
+        # downloads are shared by every environment under the root
+        download_cache_size = DEFAULT_MAX_SIZE
+        if self.global_config.has_option('global', 'download_cache_size'):
+            download_cache_size = int(self.global_config.get('global', 'download_cache_size')) * 1024 * 1024
+        self.download_cache = DownloadCache(os.path.join(self.global_path, "cache"), max_size=download_cache_size)
+        self.formula_store = FormulaStore(os.path.join(self.global_path, "formulas"))
+        self.pip_cache = os.path.join(self.global_path, "pip")
+        self.wheelhouse = Wheelhouse(os.path.join(self.global_path, "wheelhouse"))
+        if (not self.global_config.has_option('global', 'git_mirrors') or
+                lib.is_affirmative(self.global_config.get('global', 'git_mirrors'))):
+            self.git_mirrors = GitMirrors(os.path.join(self.global_path, "git"))
+
+        if self.global_config.has_option('global', 'http_pool_size'):
+            lib.request.SESSION_MANAGER.configure(
+                pool_size=int(self.global_config.get('global', 'http_pool_size')))
+        if self.global_config.has_option('global', 'http_timeout'):
+            lib.request.SESSION_MANAGER.configure(
+                timeout=float(self.global_config.get('global', 'http_timeout')))
+
         # a dictionary of the errors associated with features.
         # The key is a tuple of feature name and formula, while the value is an instance.
         self._error_dict = defaultdict(list)
 
+        # the fingerprints of the features being synced, and the features
+        # unchanged since their last sync
+        self._fingerprints = None
+        self._unchanged = set()
+        # the names of the features an update syncs, or None for every feature
+        self._selected = None
+
     @warmup
     def install(self):
         """ Install the environment """
         self.phase = PHASE.INSTALL
         if not self.directory.new:
             self.logger.info("Namespace %s directory already exists!" % self.namespace)
-            self.source = load_manifest(self.directory.manifest_path)
+            self.source = load_manifest(self.directory.manifest_path, cache=self.manifest_cache)
             return self.update()
         try:
             self.logger.info("Installing environment %s..." % self.namespace)
@@ -137,8 +227,10 @@ class Environment(object):
             self.instantiate_features()
             self.grab_inputs()
             self._specialize()
-            for feature in self.features.run_order:
-                self.run_action(feature, 'sync')
+            self._fingerprint_features()
+            self._prefetch()
+            self._prepare_batches()
+            self._sync_features()
             self.inject_environment_config()
             self._finalize()
         except Exception:
@@ -153,11 +245,24 @@ class Environment(object):
 
     @warmup
     @install_required
-    def update(self, reconfigure=False):
-        """ update the environment """
+    def update(self, reconfigure=False, force=False, features=None,
+               with_dependents=False, with_dependencies=False):
+        """
+        update the environment. Features unchanged since their last
+        sync are only refreshed, unless <force> is passed.
+
+        If <features> is passed, only those features are synced, along
+        with the features that depend on them if <with_dependents> and
+        that they depend on if <with_dependencies>. The other features
+        are kept as they were installed, and only refreshed.
+        """
         try:
             self.phase = PHASE.UPDATE
+            self.force = self.force or force
             self.logger.info("Updating environment %s..." % self.namespace)
+            if features:
+                self._select_features(features, with_dependents=with_dependents,
+                                      with_dependencies=with_dependencies)
             self.install_sandboxes()
             self.instantiate_features()
             # We don't grab inputs, only on install
@@ -168,8 +273,10 @@ class Environment(object):
             else:
                 self._copy_source_to_target()
             self._specialize(reconfigure=reconfigure)
-            for feature in self.features.run_order:
-                self.run_action(feature, 'sync')
+            self._fingerprint_features()
+            self._prefetch()
+            self._prepare_batches()
+            self._sync_features()
             self.inject_environment_config()
             self._finalize()
         except Exception:
@@ -186,8 +293,7 @@ class Environment(object):
             self.logger.info("Removing environment %s..." % self.namespace)
             self.instantiate_features()
             self._specialize()
-            for feature in self.features.run_order:
-                self.run_action(feature, 'sync')
+            self._sync_features()
             self.clear_all()
             self.directory.remove()
             self.injections.commit()
@@ -247,12 +353,73 @@ class Environment(object):
             for s in self.target.formula_sections():
                 context_dict["%s:root_dir" % s] = self.directory.install_directory(s)
                 context_dict['config:root_dir'] = self.directory.root_dir
-                context_dict['config:node'] = system.NODE
+                context_dict['config:node'] = system.node()
                 self.target.add_additional_context(context_dict)
         for feature in self.features.run_order:
             self.run_action(feature, 'validate', run_if_error=True)
 
     @warmup
+    def plan(self):
+        """
+        Return what syncing the target environment would do, without
+        running any feature's actions, as a dictionary of:
+
+        * features: for each feature, it's name, formula, phase (install,
+          update, remove or unchanged), the values that change as
+          (source, target) tuples, and the artifacts it would download
+        * injections: the files the environment configuration is injected into
+        * uninstalled_formulas: the formulas a sync would install first,
+          whose features are left out
+
+        Nothing is installed, and values are resolved without prompting
+        for inputs that are not set.
+        """
+        self.phase = PHASE.UPDATE if self.source else PHASE.INSTALL
+        self.instantiate_features(install_formulas=False)
+        # the raw changes, before resolve copies the source's values into the target
+        changes = {}
+        for feature in self.features.run_order:
+            instance = self.features[feature]
+            changes[feature] = _config_changes(instance.source, instance.target)
+        manifests = [m for m in (self.source, self.target) if m]
+        for manifest in manifests:
+            manifest.prompt_inputs = False
+        try:
+            self._copy_source_to_target()
+            self._add_context()
+            for feature in self.features.run_order:
+                self.run_action(feature, 'resolve')
+            self._fingerprint_features()
+            features = []
+            for feature in self.features.run_order:
+                instance = self.features[feature]
+                phase = instance.sync_phase()
+                artifacts = []
+                if feature not in self._unchanged and phase != PHASE.REMOVE:
+                    try:
+                        artifacts = [url for url, _ in instance.artifacts()]
+                    except Exception:
+                        self.logger.debug("Unable to list the artifacts of %s" % feature[0], exc_info=True)
+                features.append({
+                    'name': feature[0],
+                    'formula': feature[1],
+                    'phase': 'unchanged' if feature in self._unchanged else phase.name,
+                    'changes': changes[feature],
+                    'artifacts': artifacts,
+                    'errors': list(self._error_dict[feature])
+                })
+        finally:
+            for manifest in manifests:
+                manifest.prompt_inputs = True
+        self.inject_environment_config()
+        injections = set(self.injections.inject_dict) | set(self.global_injections.inject_dict)
+        return {'namespace': self.namespace,
+                'features': features,
+                'injections': sorted(injections),
+                'uninstalled_formulas': self.features.uninstalled_formulas}
+
+    @warmup
+    @stage('inject_environment_config')
     def inject_environment_config(self):
         if not self.do_inject_environment_config:
             return
@@ -297,7 +464,8 @@ class Environment(object):
         if self.target:
             if system.is_osx():
                 if not self.target.is_affirmative('config', 'use_global_packagemanagers'):
-                    self._install_sandbox('brew', brew.install_brew)
+                    self._install_sandbox('brew', brew.install_brew,
+                                          kwargs={'cache': self.download_cache})
                 elif lib.which('brew') is None:
                     install_brew = lib.prompt(
                         "Looks like you don't have brew, " +
@@ -309,14 +477,16 @@ class Environment(object):
                                  output_log_level=logging.DEBUG)
                         lib.call("sudo chown -R %s /usr/local/" % getpass.getuser(),
                                  output_log_level=logging.DEBUG, stdout=None)
-                        brew.install_brew('/usr/local')
+                        brew.install_brew('/usr/local', cache=self.download_cache)
 
-    def instantiate_features(self):
+    @stage('instantiate_features')
+    def instantiate_features(self, install_formulas=True):
         if hasattr(self, 'features') and self.features:
             return
         self.features = FeatureDict(self,
                                     self.source, self.target,
-                                    self.global_path)
+                                    self.formula_store, jobs=self.jobs,
+                                    install_formulas=install_formulas)
 
     def run_feature(self, feature, action):
         for k in self.features.run_order:
@@ -354,15 +524,16 @@ class Environment(object):
         """ return a success message, if one exists """
         return self.main_manifest.get('config', 'message_success', default=None)
 
+    @stage('warmup')
     def warmup(self):
         """ initialize variables necessary to perform a sprinter action """
         self.logger.debug("Warming up...")
 
         try:
             if not isinstance(self.source, Manifest) and self.source:
-                self.source = load_manifest(self.source)
+                self.source = load_manifest(self.source, cache=self.manifest_cache)
             if not isinstance(self.target, Manifest) and self.target:
-                self.target = load_manifest(self.target)
+                self.target = load_manifest(self.target, cache=self.manifest_cache)
             self.main_manifest = self.target or self.source
         except lib.BadCredentialsException:
             e = sys.exc_info()[1]
@@ -421,9 +592,15 @@ class Environment(object):
 
         return (config_file, config_path)
 
+    @stage('_finalize')
     def _finalize(self):
         """ command to run at the end of sprinter's run """
         self.logger.info("Finalizing...")
+        if self._fingerprints is not None:
+            # a feature that failed is synced again on the next update
+            self.main_manifest.set_fingerprints(
+                dict((feature[0], fingerprint) for feature, fingerprint in self._fingerprints.items()
+                     if not self._error_dict[feature]))
         self.write_manifest()
 
         if self.directory.rewrite_config:
@@ -500,37 +677,171 @@ class Environment(object):
         if len(self._error_dict[feature]) > 0 and not run_if_error:
             return
         instance = self.features[feature]
-        try:
-            result = getattr(instance, action)()
-            if result:
-                self.log_feature_error(feature, result)
-        # catch a generic exception within a feature
-        except Exception:
-            e = sys.exc_info()[1]
-            self.logger.info("An exception occurred with action %s in feature %s!" %
-                             (action, feature))
-            self.logger.debug("Exception", exc_info=sys.exc_info())
-            self.log_feature_error(feature, str(e))
+        with span("%s %s" % (action, feature[0]), "feature", feature=feature[0], formula=feature[1],
+                  action=action, phase=self.phase.name if self.phase else None):
+            try:
+                result = getattr(instance, action)()
+                if result:
+                    self.log_feature_error(feature, result)
+            # catch a generic exception within a feature
+            except Exception:
+                e = sys.exc_info()[1]
+                self.logger.info("An exception occurred with action %s in feature %s!" %
+                                 (action, feature))
+                self.logger.debug("Exception", exc_info=sys.exc_info())
+                self.log_feature_error(feature, str(e))
         # any error in a feature should fail immediately
         if self.error_occured:
             raise SprinterException("%s action failed for feature %s!" % (action, feature))
 
+    def _prefetch(self):
+        """
+        Download the artifacts of every feature into the download cache,
+        up to <prefetch_jobs> at once, so the features sync from local
+        files. An artifact that fails to download is left for the
+        feature to download (and report) itself.
+        """
+        artifacts, sha256s = [], {}
+        for feature in self.features.run_order:
+            if self._error_dict[feature] or feature in self._unchanged:
+                continue
+            try:
+                for url, sha256 in self.features[feature].artifacts():
+                    if url not in sha256s:
+                        artifacts.append(url)
+                    sha256s[url] = sha256s.get(url) or sha256
+            except Exception:
+                self.logger.debug("Unable to list the artifacts of %s" % feature[0], exc_info=True)
+        if not artifacts:
+            return
+
+        def fetch(url):
+            try:
+                self.download_cache.fetch(url, sha256=sha256s[url])
+            except Exception:
+                e = sys.exc_info()[1]
+                self.logger.debug("Unable to prefetch %s: %s" % (url, str(e)), exc_info=True)
+
+        self.logger.info("Downloading %d artifacts..." % len(artifacts))
+        run_in_dependency_order(artifacts, {}, fetch,
+                                workers=min(self.prefetch_jobs, len(artifacts)))
+
+    def _prepare_batches(self):
+        """
+        Pass each formula every one of it's features about to sync, so
+        it can do their work at once (see FormulaBase.prepare_batch).
+        If a formula fails to, it's features sync one by one.
+        """
+        batches, formula_classes = {}, []
+        for feature in self.features.run_order:
+            if self._error_dict[feature] or feature in self._unchanged:
+                continue
+            formula_class = type(self.features[feature])
+            if formula_class not in batches:
+                batches[formula_class] = []
+                formula_classes.append(formula_class)
+            batches[formula_class].append(self.features[feature])
+        for formula_class in formula_classes:
+            try:
+                batches[formula_class][0].prepare_batch(batches[formula_class])
+            except Exception:
+                self.logger.debug("Unable to prepare the features of %s together" % formula_class.__name__,
+                                  exc_info=True)
+
+    @stage('sync')
+    def _sync_features(self):
+        """
+        Sync every feature once the features it depends on are synced,
+        running up to <jobs> features at once.
+        """
+        run_in_dependency_order(self.features.run_order,
+                                self.features.dependency_dict(),
+                                lambda feature: self.run_action(
+                                    feature, 'refresh' if feature in self._unchanged else 'sync'),
+                                workers=self.jobs)
+
+    def _fingerprint_features(self):
+        """
+        Fingerprint the configuration of every feature to be synced,
+        and find the features whose fingerprint matches the one
+        recorded by their last sync. Those are only refreshed.
+        """
+        self._fingerprints, self._unchanged = {}, set()
+        if not self.target:
+            return
+        recorded = self.source.fingerprints() if self.source else {}
+        formula_digests = {}
+        for feature in self.features.run_order:
+            instance = self.features[feature]
+            if not self.target.has_section(feature[0]):
+                continue
+            if self._selected is not None and feature[0] not in self._selected:
+                # kept as it was synced, so it keeps the fingerprint of that sync
+                self._unchanged.add(feature)
+                if feature[0] in recorded:
+                    self._fingerprints[feature] = recorded[feature[0]]
+                continue
+            formula_class = type(instance)
+            if formula_class not in formula_digests:
+                formula_digests[formula_class] = _module_digest(formula_class)
+            facts = [formula_class.__module__ + "." + formula_class.__name__, formula_digests[formula_class],
+                     system.operating_system(), system.architecture()]
+            fingerprint = self.target.fingerprint(feature[0], facts=facts)
+            self._fingerprints[feature] = fingerprint
+            if (not self.force and recorded.get(feature[0]) == fingerprint
+                    and instance.should_refresh()):
+                self._unchanged.add(feature)
+        if self._unchanged:
+            self.logger.info("Unchanged since their last update: %s" %
+                             ", ".join(sorted(feature[0] for feature in self._unchanged)))
+
+    def _select_features(self, names, with_dependents=False, with_dependencies=False):
+        """
+        Select the features an update syncs: <names>, with the
+        features that depend on them and/or that they depend on. The
+        other features are kept as they were installed, by replacing
+        their target configuration with their source configuration.
+        """
+        for name in names:
+            if name == 'config' or not (self.source.has_section(name) or self.target.has_section(name)):
+                raise SprinterException("Environment %s has no feature %s!" % (self.namespace, name))
+        selected = set(names)
+        for manifest in [self.source, self.target]:
+            if with_dependents:
+                selected |= manifest.dtree.dependents_of(names)
+            if with_dependencies:
+                selected |= manifest.dtree.dependencies_of(names)
+        sections = set(self.source.formula_sections()) | set(self.target.formula_sections())
+        self.target.copy_sections(self.source, sorted(sections - selected))
+        self._selected = selected
+        self.logger.info("Updating features %s..." % ", ".join(sorted(selected)))
+
+    @stage('_specialize')
     def _specialize(self, reconfigure=False):
         """ Add variables and specialize contexts """
-        # add in the 'root_dir' directories to the context dictionaries
+        self._add_context()
+        for feature in self.features.run_order:
+            if self._selected is not None and feature[0] not in self._selected:
+                continue
+            self.run_action(feature, 'validate', run_if_error=True)
+            if not reconfigure:
+                self.run_action(feature, 'resolve')
+            self.run_action(feature, 'prompt')
+        # resolve every value up front, so features only read resolved values
+        for manifest in [self.source, self.target]:
+            if manifest:
+                manifest.resolve_all()
+
+    def _add_context(self):
+        """ add in the 'root_dir' directories to the context dictionaries """
         for manifest in [self.source, self.target]:
             context_dict = {}
             if manifest:
                 for s in manifest.formula_sections():
                     context_dict["%s:root_dir" % s] = self.directory.install_directory(s)
                     context_dict['config:root_dir'] = self.directory.root_dir
-                    context_dict['config:node'] = system.NODE
+                    context_dict['config:node'] = system.node()
                 manifest.add_additional_context(context_dict)
-        for feature in self.features.run_order:
-            self.run_action(feature, 'validate', run_if_error=True)
-            if not reconfigure:
-                self.run_action(feature, 'resolve')
-            self.run_action(feature, 'prompt')
 
     def _copy_source_to_target(self):
         """ copy source user configuration to target """
@@ -539,6 +850,7 @@ class Environment(object):
                 # always have source override target.
                 self.target.set_input(k, v)
 
+    @stage('grab_inputs')
     def grab_inputs(self, reconfigure=False):
         """ Resolve the source and target config section """
         self._copy_source_to_target()
@@ -11,8 +11,8 @@ HOMEBREW_URL = "http://github.com/mxcl/homebrew/tarball/master"
 logger = logging.getLogger(__name__)
 
 
-def install_brew(target_path):
-    """ Install brew to the target path """
+def install_brew(target_path, cache=None):
+    """ Install brew to the target path, downloading it through <cache> if one is passed """
     if not os.path.exists(target_path):
         try:
             os.makedirs(target_path)
@@ -20,4 +20,4 @@ def install_brew(target_path):
             logger.warn("Unable to create directory %s for brew." % target_path)
             logger.warn("Skipping...")
             return
-    extract_targz(HOMEBREW_URL, target_path, remove_common_prefix=True)
+    extract_targz(HOMEBREW_URL, target_path, remove_common_prefix=True, cache=cache)
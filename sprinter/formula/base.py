@@ -45,6 +45,25 @@ class FormulaBase(object):
         instantiation, before any action's are taken.
         """
 
+    def artifacts(self):
+        """
+        Return the downloads the sync will need, as a list of (url,
+        sha256) tuples. sha256 may be None if it's not known.
+
+        artifacts are downloaded concurrently into the download cache
+        before any feature is synced, so the sync only reads local files.
+        """
+        return []
+
+    @classmethod
+    def prepare_batch(cls, features):
+        """
+        Called once before any feature syncs, with every feature of
+        this formula about to sync. Formulas can do the work of all
+        of them at once here (e.g. install every package in a single
+        call), leaving less for each sync to do.
+        """
+
     def install(self):
         """
         Install is called when a feature does not previously exist.
@@ -58,12 +77,7 @@ class FormulaBase(object):
         """
         install_directory = self.directory.install_directory(self.feature_name)
         cwd = install_directory if os.path.exists(install_directory) else None
-        if self.target.has('env'):
-            self.directory.add_to_env(self.target.get('env'))
-        if self.target.has('rc'):
-            self.directory.add_to_rc(self.target.get('rc'))
-        if self.target.has('gui'):
-            self.directory.add_to_gui(self.target.get('gui'))
+        FormulaBase.refresh(self)
         if self.target.has('command'):
             lib.call(self.target.get('command'), shell=True, cwd=cwd)
 
@@ -77,6 +91,37 @@ class FormulaBase(object):
         """
         return FormulaBase.install(self)
 
+    def refresh(self):
+        """
+        Refresh is called instead of update when the feature's
+        configuration has not changed since it was last synced.
+
+        The environment's env, rc and gui files are rewritten on every
+        run, so refresh should add what the feature contributes to
+        them, without installing anything.
+
+        errors should either be reported via self._log_error(), or raise an exception
+        """
+        if self.target.has('env'):
+            self.directory.add_to_env(self.target.get('env'))
+        if self.target.has('rc'):
+            self.directory.add_to_rc(self.target.get('rc'))
+        if self.target.has('gui'):
+            self.directory.add_to_gui(self.target.get('gui'))
+
+    def should_refresh(self):
+        """
+        Returns true if the feature, unchanged since it was last
+        synced, only needs a refresh rather than an update.
+
+        A formula overriding update but not refresh may add content of
+        it's own to the env, rc or gui files there, which refresh would
+        not, so those features are updated unless the formula says
+        otherwise. Formulas with work to do on every update (e.g. a
+        command to run) should return false.
+        """
+        return not _overrides(type(self), 'update') or _overrides(type(self), 'refresh')
+
     def remove(self):
         """
         Remove is called when a feature no longer exists.
@@ -194,3 +239,13 @@ class FormulaBase(object):
         main_manifest.set(key,
                           lib.prompt(prompt_string,
                                      default=prompt_default))
+
+
+def _overrides(formula_class, method):
+    """ return true if formula_class, or a parent other than FormulaBase, defines method """
+    for cls in formula_class.__mro__:
+        if cls is FormulaBase:
+            return False
+        if method in cls.__dict__:
+            return True
+    return False
@@ -40,6 +40,10 @@ class CommandFormula(FormulaBase):
         self.__run_command('update', 'target')
         FormulaBase.update(self)
 
+    def should_refresh(self):
+        # the update command runs on every update
+        return not self.target.has('update')
+
     def remove(self):
         self.__run_command('remove', 'source')
         FormulaBase.remove(self)
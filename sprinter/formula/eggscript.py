@@ -7,14 +7,29 @@ eggs = pelican, pelican-gist
        jedi, epc
 links = http://github.com/toumorokoshi/sprinter/tarball/master#egg=sprinter-0.6
 redownload = true
+venv = true
+
+With venv, the sandbox is created with the standard library's venv
+module, rather than the bundled virtualenv (which pythons without venv
+fall back to).
+
+A hash of the eggs is recorded with the distributions they installed,
+and pip is not run again while both match, unless redownload is set,
+which upgrades the eggs on every update. pip's cache is shared by
+every feature, so a wheel is only built once.
+
+pip looks for eggs in the wheelhouse (see sprinter.lib.wheelhouse)
+first, and with --offline, only there.
 """
 from __future__ import unicode_literals
+import glob
+import hashlib
+import json
 import os
 import re
 
 import sprinter.lib as lib
 from sprinter.formula.base import FormulaBase
-from sprinter.external.virtualenv import file_search_dirs, create_environment as create_virtualenv
 
 # a list of regex's that should no be symlinked to the bin path
 BLACKLISTED_EXECUTABLES = [
@@ -23,45 +38,75 @@ BLACKLISTED_EXECUTABLES = [
     "^activate.*$",
     "^pip.*$"]
 
+STATE_FILE = ".sprinter-eggs.json"  # the hash of the eggs installed, and their distributions
+
 
 class EggscriptFormula(FormulaBase):
 
-    valid_options = FormulaBase.valid_options + ['egg', 'eggs', 'redownload']
+    valid_options = FormulaBase.valid_options + ['egg', 'eggs', 'redownload', 'venv']
 
     def install(self):
-        create_virtualenv(self.directory.install_directory(self.feature_name),
-                          search_dirs=file_search_dirs())
-        self.__install_eggs(self.target)
+        if not self.__is_satisfied(self.target):
+            _create_environment(self.directory.install_directory(self.feature_name),
+                                _uses_venv(self.target), self.logger)
+            self.__install_eggs(self.target)
         self.__add_paths(self.target)
         return FormulaBase.install(self)
 
     def update(self):
-        if (self.source.get('egg', '') != self.target.get('egg', '') or
-            self.source.get('eggs', '') != self.target.get('eggs', '') or
-            (self.target.has('redownload') and self.target.is_affirmative('redownload'))):
-                self.__install_eggs(self.target)
+        if _uses_venv(self.source) != _uses_venv(self.target):
+            self.logger.debug("The sandbox of %s changed, creating it again..." % self.feature_name)
+            self.directory.remove_feature(self.feature_name)
+            _create_environment(self.directory.install_directory(self.feature_name),
+                                _uses_venv(self.target), self.logger)
+        redownload = self.target.has('redownload') and self.target.is_affirmative('redownload')
+        if redownload or not self.__is_satisfied(self.target):
+            self.__install_eggs(self.target, upgrade=redownload)
         self.__add_paths(self.target)
         return FormulaBase.update(self)
 
+    def should_refresh(self):
+        # redownload upgrades the eggs on every update
+        return not (self.target.has('redownload') and self.target.is_affirmative('redownload'))
+
     def validate(self):
         if self.target:
             if not (self.target.has('egg') or self.target.has('eggs')):
                 self.logger.warn("No eggs will be installed! 'egg' or 'eggs' parameter not set!")
         return FormulaBase.validate(self)
-                
-    def __install_eggs(self, config):
+
+    def __is_satisfied(self, config):
+        """ return true if the eggs of config are installed, and nothing was installed or removed since """
+        state_path = os.path.join(self.directory.install_directory(self.feature_name), STATE_FILE)
+        if not os.path.exists(state_path):
+            return False
+        with open(state_path) as fh:
+            state = json.load(fh)
+        return (state.get('hash') == _hash(config) and
+                state.get('distributions') == _distributions(self.directory.install_directory(self.feature_name)))
+
+    def __install_eggs(self, config, upgrade=False):
         """ Install eggs for a particular configuration """
-        eggs = []
-        if config.has('egg'):
-            eggs += [config.get('egg')]
-        if config.has('eggs'):
-            eggs += [egg.strip() for egg in re.split(',|\n', config.get('eggs'))]
+        install_directory = self.directory.install_directory(self.feature_name)
+        eggs = get_eggs(config)
         self.logger.debug("Installing eggs %s..." % eggs)
-        with open(os.path.join(self.directory.install_directory(self.feature_name), 'requirements.txt'),
-                  'w+') as fh:
+        with open(os.path.join(install_directory, 'requirements.txt'), 'w+') as fh:
             fh.write('\n'.join(eggs))
-        lib.call("bin/pip install -r requirements.txt --upgrade",
-                 cwd=self.directory.install_directory(self.feature_name))
+        state_path = os.path.join(install_directory, STATE_FILE)
+        if os.path.exists(state_path):
+            os.unlink(state_path)
+        env = self.environment.wheelhouse.pip_environment(offline=self.environment.offline)
+        env['PIP_CACHE_DIR'] = self.environment.pip_cache
+        error, output = lib.call("bin/pip install -r requirements.txt" + (" --upgrade" if upgrade else ""),
+                                 cwd=install_directory, env=env, stream=True,
+                                 log_path=self.directory.log_path(self.feature_name))
+        if error:
+            self.logger.info(output.decode('utf-8', 'replace'))
+            self._log_error("Unable to install eggs %s!" % ", ".join(eggs))
+            return
+        with open(state_path, 'w') as fh:
+            fh.write(json.dumps({'hash': _hash(config),
+                                 'distributions': _distributions(install_directory)}))
 
     def __add_paths(self, config):
         """ add the proper resources into the environment """
@@ -73,3 +118,49 @@ class EggscriptFormula(FormulaBase):
                     symlink = False
             if symlink:
                 self.directory.symlink_to_bin(f, os.path.join(bin_path, f))
+
+
+def _create_environment(install_directory, use_venv, logger):
+    """ create a sandboxed python at install_directory, with venv if use_venv and it's available """
+    if use_venv:
+        try:
+            import venv
+        except ImportError:
+            logger.warn("venv is not available, using virtualenv instead.")
+        else:
+            venv.EnvBuilder(with_pip=True, symlinks=(os.name != 'nt')).create(install_directory)
+            return
+    from sprinter.external.virtualenv import file_search_dirs, create_environment
+    create_environment(install_directory, search_dirs=file_search_dirs())
+
+
+def _uses_venv(config):
+    """ return true if the sandbox of config is created with venv """
+    return config.has('venv') and config.is_affirmative('venv')
+
+
+def get_eggs(config):
+    """ return the eggs of an eggscript feature's config """
+    eggs = []
+    if config.has('egg'):
+        eggs += [config.get('egg')]
+    if config.has('eggs'):
+        eggs += [egg.strip() for egg in re.split(',|\n', config.get('eggs'))]
+    return eggs
+
+
+def _hash(config):
+    """ return a hash of the eggs of config, and how their sandbox is created """
+    key = "\n".join(get_eggs(config))
+    if _uses_venv(config):
+        key += "\nvenv"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def _distributions(install_directory):
+    """ return the distributions installed in the sandbox at install_directory """
+    paths = []
+    for site_packages in ("lib/python*/site-packages", "Lib/site-packages"):
+        for pattern in ("*.dist-info", "*.egg-info", "*.egg-link"):
+            paths += glob.glob(os.path.join(install_directory, site_packages, pattern))
+    return sorted(os.path.relpath(p, install_directory) for p in paths)
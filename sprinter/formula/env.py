@@ -28,6 +28,11 @@ class EnvFormula(FormulaBase):
             self.directory.add_to_env('export %s=%s' % (c.upper(), self.target.get(c)))
         FormulaBase.update(self)
 
+    def refresh(self):
+        for c in (c for c in self.target.keys() if c not in self.ignored_keys):
+            self.directory.add_to_env('export %s=%s' % (c.upper(), self.target.get(c)))
+        FormulaBase.refresh(self)
+
     def validate(self):
         # all config values are valid
         pass
@@ -6,6 +6,25 @@ formula = sprinter.formula.git
 url = https://github.com/toumorokoshi/sub.git
 branch = toumorokoshi
 rc = . %(sub:root_dir)s/libexec/sub-init
+
+Large repositories can be cloned partially:
+
+depth = 1                  # only fetch the last <depth> commits
+filter = blob:none         # only fetch the blobs that are checked out
+sparse_paths = src/app     # only check out these paths (whitespace separated)
+             docs
+single_branch = true       # only fetch <branch>
+submodules_jobs = 4        # check out submodules, <jobs> at a time
+
+Repositories are cloned through a local mirror (see
+sprinter.lib.gitmirrors), unless depth or filter is set: those
+repositories are cloned from the remote, as a mirror holds the full
+history. A change to the depth, filter or single_branch is made to the
+existing clone, keeping it's work. A change to the url clones the
+repository again, after warning it's work will be lost.
+
+The output of clones, fetches and submodule updates is logged as it
+comes, and appended to the feature's log.
 """
 from __future__ import unicode_literals
 import logging
@@ -23,7 +42,8 @@ class GitFormula(FormulaBase):
     """ A sprinter formula for git"""
 
     required_options = FormulaBase.required_options + ['url']
-    valid_options = FormulaBase.valid_options + ['branch']
+    valid_options = FormulaBase.valid_options + ['branch', 'depth', 'filter', 'sparse_paths',
+                                                 'single_branch', 'submodules_jobs']
 
     def install(self):
         if not lib.which('git'):
@@ -31,7 +51,7 @@ class GitFormula(FormulaBase):
             return
         self.__clone_repo(self.target.get('url'),
                           self.directory.install_directory(self.feature_name),
-                          branch=self.target.get('branch', 'master'))
+                          branch=_option(self.target, 'branch'))
         FormulaBase.install(self)
 
     def update(self):
@@ -47,68 +67,174 @@ class GitFormula(FormulaBase):
             self.logger.debug("No repository cloned. Re-cloning...")
             self.__clone_repo(self.target.get('url'),
                               target_directory,
-                              branch=target_branch)
-
-        if self.target.get('url') != self.source.get('url'):
+                              branch=_option(self.target, 'branch'))
 
-            self.logger.debug("Old git repository Found. Deleting...")
+        elif self.source.get('url') != self.target.get('url'):
+            self.logger.warn("The url of %s changed, so it's cloned again. "
+                             "Changes not pushed from %s are lost!" % (self.feature_name, target_directory))
             self.directory.remove_feature(self.feature_name)
             self.__clone_repo(self.target.get('url'),
                               target_directory,
-                              branch=self.target.get('branch', 'master'))
-
-        elif source_branch != target_branch:
-            self.__checkout_branch(target_directory, target_branch)
+                              branch=_option(self.target, 'branch'))
 
         else:
-            if not os.path.exists(target_directory):
-                self.logger.debug("No repository cloned. Re-cloning...")
-                self.__clone_repo(self.target.get('url'),
-                                  target_directory,
-                                  branch=target_branch)
-            self.__fetch_merge_repo(target_directory, target_branch)
+            self.__change_clone_options(target_directory, target_branch)
+            if _option(self.source, 'sparse_paths') != _option(self.target, 'sparse_paths'):
+                self.__set_sparse_paths(target_directory)
+            if source_branch != target_branch:
+                self.__checkout_branch(target_directory, target_branch)
+            else:
+                self.__fetch_merge_repo(target_directory, target_branch)
+            self.__update_submodules(target_directory)
 
         FormulaBase.update(self)
 
+    def should_refresh(self):
+        # update adds nothing to the env, rc or gui files that refresh doesn't
+        return True
+
     def __checkout_branch(self, target_directory, branch):
         self.logger.debug("Checking out branch %s..." % branch)
-        for command in ("git fetch origin {0}".format(branch),
+        for command in (self.__fetch_command(branch),
                         "git checkout {0}".format(branch)):
             error, output = lib.call(
                 command,
                 output_log_level=logging.DEBUG,
-                cwd=target_directory
+                cwd=target_directory,
+                stream=True,
+                log_path=self.directory.log_path(self.feature_name)
             )
             if error:
                 self.logger.info(output)
                 raise GitException("An error occurred when checking out a branch!")
 
-    def __clone_repo(self, repo_url, target_directory, branch):
+    def __clone_repo(self, repo_url, target_directory, branch=None):
+        """ clone straight to <branch>, or the remote's default branch if it's None """
         self.logger.debug("Cloning repository %s into %s..." % (repo_url, target_directory))
-        error, output = lib.call("git clone %s %s" % (repo_url, target_directory),
-                                 output_log_level=logging.DEBUG)
+        mirror = self.__mirror()
+        error, output = lib.call(" ".join(["git clone"] + self.__clone_flags(branch) +
+                                          [mirror or repo_url, target_directory]),
+                                 output_log_level=logging.DEBUG,
+                                 stream=True,
+                                 log_path=self.directory.log_path(self.feature_name))
+        if not error and mirror:
+            # the clone pushes and pulls to the remote, not the mirror
+            error, output = lib.call("git remote set-url origin %s" % repo_url,
+                                     output_log_level=logging.DEBUG,
+                                     cwd=target_directory)
         if error:
             self.logger.info(output)
             raise GitException("An error occurred when cloning!")
-        if branch != "master":
-            self.__checkout_branch(target_directory, branch)
+        if self.target.has('sparse_paths'):
+            self.__set_sparse_paths(target_directory)
+        self.__update_submodules(target_directory)
+
+    def __clone_flags(self, branch):
+        flags = []
+        if branch:
+            flags += ["-b", branch]
+        if self.target.has('single_branch'):
+            flags.append("--single-branch" if self.target.is_affirmative('single_branch')
+                         else "--no-single-branch")
+        if self.target.has('depth'):
+            flags += ["--depth", self.target.get('depth')]
+        if self.target.has('filter'):
+            flags.append("--filter=%s" % self.target.get('filter'))
+        if self.target.has('sparse_paths'):
+            flags.append("--sparse")
+        return flags
+
+    def __change_clone_options(self, target_directory, branch):
+        """ change the depth, filter and single_branch of an existing clone to the target's """
+        commands = []
+        if _option(self.source, 'depth') and not self.target.has('depth'):
+            # a new depth is fetched to by the update's fetch
+            if os.path.exists(os.path.join(target_directory, ".git", "shallow")):
+                commands.append("git fetch --unshallow %s" % (self.__mirror() or "origin"))
+        if _option(self.source, 'filter') != _option(self.target, 'filter'):
+            if self.target.has('filter'):
+                commands += ["git config remote.origin.promisor true",
+                             "git config remote.origin.partialclonefilter %s" % self.target.get('filter')]
+            else:
+                # objects left out by the old filter are still fetched when they're needed
+                commands.append("git config --unset remote.origin.partialclonefilter")
+        if _option(self.source, 'single_branch') != _option(self.target, 'single_branch'):
+            single_branch = self.target.has('single_branch') and self.target.is_affirmative('single_branch')
+            commands.append("git remote set-branches origin %s" % (branch if single_branch else "*"))
+        for command in commands:
+            error, output = lib.call(command, output_log_level=logging.DEBUG, cwd=target_directory)
+            if error:
+                self.logger.info(output)
+                raise GitException("An error occurred when changing the clone's options!")
+
+    def __set_sparse_paths(self, target_directory):
+        if self.target.has('sparse_paths'):
+            command = "git sparse-checkout set %s" % " ".join(self.target.get('sparse_paths').split())
+        else:
+            command = "git sparse-checkout disable"
+        error, output = lib.call(command, output_log_level=logging.DEBUG, cwd=target_directory)
+        if error:
+            self.logger.info(output)
+            raise GitException("An error occurred when setting the sparse paths!")
+
+    def __update_submodules(self, target_directory):
+        if not self.target.has('submodules_jobs'):
+            return
+        self.logger.debug("Updating submodules...")
+        error, output = lib.call("git submodule update --init --recursive --jobs %s" % self.target.get('submodules_jobs'),
+                                 output_log_level=logging.DEBUG,
+                                 cwd=target_directory,
+                                 stream=True,
+                                 log_path=self.directory.log_path(self.feature_name))
+        if error:
+            self.logger.info(output)
+            raise GitException("An error occurred when updating submodules!")
 
     def __fetch_merge_repo(self, target_directory, target_branch):
         self.logger.debug("Fetching branch %s..." % target_branch)
-        os.chdir(target_directory)
-
-        error, output = lib.call("git fetch origin %s" % target_branch,
-                                 output_log_level=logging.DEBUG)
+        error, output = lib.call(self.__fetch_command(target_branch),
+                                 output_log_level=logging.DEBUG,
+                                 cwd=target_directory,
+                                 stream=True,
+                                 log_path=self.directory.log_path(self.feature_name))
         if error:
             self.logger.info(output)
             raise GitException("An error occurred while fetching!")
 
         self.logger.info(output)
         self.logger.debug("Merging branch %s..." % target_branch)
-        error, output = lib.call("git merge --ff-only origin %s" % target_branch,
-                                     output_log_level=logging.DEBUG)
+        # a shallow clone's history may not reach the fetched commit, so it's reset instead,
+        # which keeps local changes as merge does
+        command = "git reset --keep" if self.target.has('depth') else "git merge --ff-only"
+        error, output = lib.call("%s origin/%s" % (command, target_branch),
+                                 output_log_level=logging.DEBUG,
+                                 cwd=target_directory)
         if error:
             #do not want to raise exception on merge failures/conflicts
             self.logger.warning(output)
         else:
             self.logger.info(output)
+
+    def __fetch_command(self, branch):
+        """ return the command fetching branch into origin/<branch>, from the mirror if there is one """
+        flags = ""
+        if self.target.has('depth'):
+            flags += "--depth %s " % self.target.get('depth')
+        if self.target.has('filter'):
+            flags += "--filter=%s " % self.target.get('filter')
+        return "git fetch {0}{1} +refs/heads/{2}:refs/remotes/origin/{2}".format(
+            flags, self.__mirror() or "origin", branch)
+
+    def __mirror(self):
+        """ return the path to an up to date mirror of the target's url, or None """
+        if self.environment.git_mirrors is None:
+            return None
+        if self.target.has('depth') or self.target.has('filter'):
+            # a mirror holds the full history
+            return None
+        return self.environment.git_mirrors.update(self.target.get('url'))
+
+
+def _option(config, key):
+    """ return the value of an option, or None if it's not set """
+    return config.get(key) if config.has(key) else None
@@ -5,12 +5,35 @@ Installs a package from whatever the native package manager is
 formula = sprinter.formula.package
 apt-get = git
 brew = git
+
+Several packages can be listed, separated by whitespace.
+
+The package features of a run are installed together: the packages
+are checked against what is installed in a single query, and only the
+missing ones are installed, in a single call to the package manager.
+Features with depends skip the install if all their packages already
+are, and are otherwise installed on their own, once what they depend on
+has synced. If the single call fails (e.g. on an unknown package), each
+feature's packages are installed in a call of their own. As before, a
+package that fails to install is only warned about.
+
+A package pinned to a version (apt-get's git=1:2.1) only counts as
+installed when that version is.
 """
 from __future__ import unicode_literals
 import logging
 from sprinter import lib
 from sprinter.lib import system
 from sprinter.formula.base import FormulaBase
+from sprinter.core import PHASE
+
+# the commands listing which of a set of packages are installed. brew
+# lists every installed package.
+INSTALLED_QUERIES = {
+    'apt-get': "dpkg-query -W -f=${Package}=${Version}=${Status}\\n",
+    'yum': "rpm -q --qf %{NAME}\\n",
+    'brew': "brew list -1",
+}
 
 
 class PackageFormulaException(Exception):
@@ -20,6 +43,63 @@ class PackageFormulaException(Exception):
 class PackageFormula(FormulaBase):
 
     valid_options = FormulaBase.valid_options + ['apt-get', 'brew', 'yum']
+    package_states = None  # the state of each package after they were installed together, if they were
+
+    @classmethod
+    def prepare_batch(cls, features):
+        """
+        Install the packages of every feature that needs them, in a
+        single call to the package manager, skipping those already
+        installed. Each feature then reports on it's own packages.
+        """
+        package_manager, args, sudo_required = _get_package_manager()
+        if not package_manager:
+            return
+        packages_by_feature = {}
+        for feature in features:
+            if feature.sync_phase() in (PHASE.INSTALL, PHASE.UPDATE) and feature._needs_install(package_manager):
+                packages_by_feature[feature] = feature.target.get(package_manager).split()
+        packages = []
+        for feature_packages in packages_by_feature.values():
+            packages += [p for p in feature_packages if p not in packages]
+        if not packages:
+            return
+        packages.sort()
+        installed = _installed_packages(package_manager, packages)
+        for feature in list(packages_by_feature):
+            if feature.target.has('depends'):
+                # it may need what it depends on (e.g. a repository) to be
+                # set up first, so it only skips installing if it can
+                if all(p in installed for p in packages_by_feature[feature]):
+                    feature.package_states = dict((p, "already installed") for p in packages_by_feature[feature])
+                del packages_by_feature[feature]
+        missing = []
+        for feature_packages in packages_by_feature.values():
+            missing += [p for p in feature_packages if p not in installed and p not in missing]
+        missing.sort()
+        now_installed = set()
+        if missing:
+            logger = logging.getLogger("sprinter.formula." + cls.__name__)
+            logger.info("Installing %s..." % " ".join(missing))
+            if _install_packages(package_manager, args, sudo_required, missing):
+                # one bad package fails the whole transaction, so each
+                # feature installs it's own, and only fails on it's own
+                logger.warn("Unable to install the packages together, installing them per feature...")
+                for feature in sorted(packages_by_feature, key=lambda f: f.feature_name):
+                    feature_missing = [p for p in packages_by_feature[feature] if p in missing]
+                    if feature_missing:
+                        _install_packages(package_manager, args, sudo_required, feature_missing)
+            now_installed = _installed_packages(package_manager, missing)
+        for feature, feature_packages in packages_by_feature.items():
+            states = {}
+            for package in feature_packages:
+                if package in installed:
+                    states[package] = "already installed"
+                elif package in now_installed:
+                    states[package] = "installed"
+                else:
+                    states[package] = "failed"
+            feature.package_states = states
 
     def install(self):
         self.__get_package_manager()
@@ -28,47 +108,107 @@ class PackageFormula(FormulaBase):
 
     def update(self):
         self.__get_package_manager()
-        install_package = False
-        if self.package_manager and self.target.has(self.package_manager):
-            if not self.source.has(self.package_manager):
-                install_package = True
-            if self.source.get(self.package_manager) != self.target.get(self.package_manager):
-                install_package = True
-        if install_package:
+        if self.package_manager and self._needs_install(self.package_manager):
             self.__install_package(self.target)
         FormulaBase.update(self)
 
+    def should_refresh(self):
+        # update adds nothing to the env, rc or gui files that refresh doesn't
+        return True
+
+    def _needs_install(self, package_manager):
+        """ return true if the target has packages for <package_manager> the source did not """
+        if not self.target.has(package_manager):
+            return False
+        if not self.source or not self.source.has(package_manager):
+            return True
+        return self.source.get(package_manager) != self.target.get(package_manager)
+
     def __install_package(self, config):
-        if self.package_manager and config.has(self.package_manager):
+        if self.package_states is not None:
+            self.__report_package_states()
+        elif self.package_manager and config.has(self.package_manager):
             package = config.get(self.package_manager)
             self.logger.info("Installing %s..." % package)
-            call_command = "%s%s install %s" % (self.package_manager, self.args, package)
-            if self.sudo_required:
-                call_command = "sudo " + call_command
-            self.logger.debug("Calling command: %s" % call_command)
-            # it's not possible to retain remember sudo privileges across shells unless they pipe
-            # to STDOUT. Nothing we can do about that for now.
-            lib.call(call_command, output_log_level=logging.DEBUG, stdout=None)
+            # the exit code is ignored, as it always has been: package
+            # managers fail on packages that are already installed too
+            _install_packages(self.package_manager, self.args, self.sudo_required, [package])
+
+    def __report_package_states(self):
+        """ report the packages installed for this feature, together with the others """
+        for package in sorted(self.package_states):
+            state = self.package_states[package]
+            if state == "failed":
+                self.logger.warn("Unable to install %s!" % package)
+            else:
+                self.logger.info("%s is %s." % (package, state))
 
     def __get_package_manager(self):
         """
         Installs and verifies package manager
         """
-        package_manager = ""
-        args = ""
-        sudo_required = True
-        if system.is_osx():
-            package_manager = "brew"
-            sudo_required = False
-        elif system.is_debian():
-            package_manager = "apt-get"
-            args = " -y"
-        elif system.is_fedora():
-            package_manager = "yum"
-        if lib.which(package_manager) is None:
-            self.logger.warn("Package manager %s not installed! Packages will not be installed."
-                             % package_manager)
-            self.package_manager = None
-        self.package_manager = package_manager
-        self.sudo_required = sudo_required
-        self.args = args
+        self.package_manager, self.args, self.sudo_required = _get_package_manager()
+
+
+def _get_package_manager():
+    """ return the package manager of the system, it's arguments, and whether it needs sudo """
+    package_manager = ""
+    args = ""
+    sudo_required = True
+    if system.is_osx():
+        package_manager = "brew"
+        sudo_required = False
+    elif system.is_debian():
+        package_manager = "apt-get"
+        args = " -y"
+    elif system.is_fedora():
+        package_manager = "yum"
+    if lib.which(package_manager) is None:
+        logging.getLogger(__name__).warn("Package manager %s not installed! Packages will not be installed."
+                                         % package_manager)
+        package_manager = None
+    return package_manager, args, sudo_required
+
+
+def _install_packages(package_manager, args, sudo_required, packages):
+    """ install packages in a single call to the package manager, returning it's exit code """
+    call_command = "%s%s install %s" % (package_manager, args, " ".join(packages))
+    if sudo_required:
+        call_command = "sudo " + call_command
+    logging.getLogger(__name__).debug("Calling command: %s" % call_command)
+    # streamed, as installs can take long. sudo prompts for it's password
+    # on the terminal, rather than through the output.
+    return lib.call(call_command, output_log_level=logging.DEBUG, stream=True)[0]
+
+
+def _installed_packages(package_manager, packages):
+    """
+    return which of <packages> are installed, with a single query. A
+    package pinned to a version is only installed if that version is.
+    """
+    if package_manager == "brew":
+        command = INSTALLED_QUERIES[package_manager]
+    else:
+        command = "%s %s" % (INSTALLED_QUERIES[package_manager], " ".join(_package_name(p) for p in packages))
+    # the query fails when any of the packages is missing, but still lists the others
+    output = lib.call(command, output_log_level=logging.DEBUG)[1] or b""
+    names = set()
+    for line in output.decode('utf-8', 'replace').splitlines():
+        if package_manager == "apt-get":
+            fields = line.split("=", 2)
+            if len(fields) == 3 and fields[2].split()[-1:] == ["installed"]:
+                names.add(fields[0])
+                names.add("%s=%s" % (fields[0], fields[1]))
+        else:
+            names.add(line.strip())
+    return set(p for p in packages if _installed_name(p) in names)
+
+
+def _package_name(package):
+    """ return the name of a package, without a version (apt-get's git=1:2.1) or tap (brew's user/tap/git) """
+    return package.split("=", 1)[0].split("/")[-1]
+
+
+def _installed_name(package):
+    """ return the name a package is listed as installed under, keeping the version it's pinned to """
+    return package.split("/")[-1]
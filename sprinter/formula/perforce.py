@@ -20,6 +20,7 @@ from __future__ import unicode_literals
 import os
 import re
 import shutil
+from contextlib import closing
 import sprinter.lib as lib
 from sprinter.lib import system
 from sprinter.core import PHASE
@@ -101,14 +102,19 @@ class PerforceFormula(FormulaBase):
                                    "Would you like to completely remove the p4 directory?",
                                    default="no")
 
+    def artifacts(self):
+        phase = self.sync_phase()
+        if phase == PHASE.INSTALL or (phase == PHASE.UPDATE and self.__version_changed()):
+            return [(url, None) for url in self.__package_urls(self.target)]
+        return []
+
     def install(self):
         config = self.target
         self.p4environ = dict(list(os.environ.items()) + [('P4USER', config.get('username')),
                                                           ('P4PASSWD', config.get('password')),
                                                           ('P4CLIENT', config.get('client'))])
         installed = self.__install_perforce(config)
-        if not os.path.exists(os.path.expanduser(config.get('root_path'))):
-            os.makedirs(os.path.expanduser(config['root_path']))
+        lib.makedirs(os.path.expanduser(config.get('root_path')))
         if config.is_affirmative('write_p4settings'):
             self.__write_p4settings(config)
         if config.is_affirmative('overwrite_client') and installed:
@@ -117,12 +123,16 @@ class PerforceFormula(FormulaBase):
         FormulaBase.install(self)
 
     def update(self):
-        if self.source.get('version', 'r13.2') != self.target.get('version', 'r13.2'):
+        if self.__version_changed():
             os.unlink(os.path.join(self.directory.install_directory(self.feature_name), 'p4'))
             self.__install_perforce(self.target)
         self.__add_p4_env(self.target)
         FormulaBase.update(self)
 
+    def refresh(self):
+        self.__add_p4_env(self.target)
+        FormulaBase.refresh(self)
+
     def remove(self):
         if self.source.is_affirmative('remove_p4root'):
             self.logger.info("Removing %s..." % self.source.get('root_path'))
@@ -142,22 +152,31 @@ class PerforceFormula(FormulaBase):
         if not system.is_64_bit():
             self.logger.warn("Perforce formula is only designed for 64 bit systems! Not install executables...")
             return False
-        version = config.get('version', 'r13.2')
-        key = 'osx' if system.is_osx() else 'linux'
-        perforce_packages = package_dict[version][key]
+        p4_url, p4v_url = self.__package_urls(config)
         d = self.directory.install_directory(self.feature_name)
-        if not os.path.exists(d):
-            os.makedirs(d)
+        lib.makedirs(d)
         self.logger.info("Downloading p4 executable...")
-        with open(os.path.join(d, "p4"), 'wb+') as fh:
-            fh.write(lib.cleaned_request('get', url_prefix + perforce_packages['p4']).content)
+        with closing(lib.download(p4_url, cache=self.environment.download_cache)) as download:
+            with open(os.path.join(d, "p4"), 'wb+') as fh:
+                shutil.copyfileobj(download, fh)
         self.directory.symlink_to_bin("p4", os.path.join(d, "p4"))
         self.p4_command = os.path.join(d, "p4")
         self.logger.info("Installing p4v...")
         if system.is_osx():
-            return self._install_p4v_osx(url_prefix + perforce_packages['p4v'])
+            return self._install_p4v_osx(p4v_url)
         else:
-            return self._install_p4v_linux(url_prefix + perforce_packages['p4v'])
+            return self._install_p4v_linux(p4v_url)
+
+    def __version_changed(self):
+        return self.source.get('version', 'r13.2') != self.target.get('version', 'r13.2')
+
+    def __package_urls(self, config):
+        """ return the urls of the p4 and p4v packages for this system, if it's supported """
+        if not system.is_64_bit():
+            return []
+        key = 'osx' if system.is_osx() else 'linux'
+        perforce_packages = package_dict[config.get('version', 'r13.2')][key]
+        return [url_prefix + perforce_packages['p4'], url_prefix + perforce_packages['p4v']]
 
     def _install_p4v_osx(self, url, overwrite=False):
         """ Install perforce applications and binaries for mac """
@@ -165,7 +184,7 @@ class PerforceFormula(FormulaBase):
         root_dir = os.path.expanduser(os.path.join("~", "Applications"))
         package_exists = len([x for x in P4V_APPLICATIONS if os.path.exists(os.path.join(root_dir, x))])
         if not package_exists or overwrite:
-            lib.extract_dmg(url, root_dir)
+            lib.extract_dmg(url, root_dir, cache=self.environment.download_cache)
         else:
             self.logger.warn("P4V exists already in %s! Not overwriting..." % root_dir)
         return True
@@ -174,7 +193,8 @@ class PerforceFormula(FormulaBase):
         """ Install perforce applications and binaries for linux """
         lib.extract_targz(url,
                           self.directory.install_directory(self.feature_name),
-                          remove_common_prefix=True)
+                          remove_common_prefix=True,
+                          cache=self.environment.download_cache)
         bin_path = os.path.join(self.directory.install_directory(self.feature_name), 'bin')
         if os.path.exists(bin_path):
             for f in os.listdir(bin_path):
@@ -207,8 +227,7 @@ class PerforceFormula(FormulaBase):
         self.logger.info("Configuring p4 client...")
         client_dict = config.to_dict()
         client_dict['root_path'] = os.path.expanduser(config.get('root_path'))
-        os.chdir(client_dict['root_path'])
-        client_dict['hostname'] = system.NODE
+        client_dict['hostname'] = system.node()
         client_dict['p4view'] = config['p4view'] % self.environment.target.get_context_dict()
         client = re.sub('//depot', '    //depot', p4client_template % client_dict)
         self.logger.info(lib.call("%s client -i" % self.p4_command,
@@ -56,6 +56,10 @@ class SSHFormula(FormulaBase):
         self.__generate_key(self.target)
         self.__install_ssh_config(self.target)
 
+    def should_refresh(self):
+        # update adds nothing to the env, rc or gui files that refresh doesn't
+        return True
+
     def deactivate(self):
         self.injections.inject(ssh_config_path, "")
 
@@ -71,8 +75,7 @@ class SSHFormula(FormulaBase):
         """
         cwd = config.get('ssh_path', self.directory.install_directory(self.feature_name))
         if not config.has('create') or config.is_affirmative('create'):
-            if not os.path.exists(cwd):
-                os.makedirs(cwd)
+            lib.makedirs(cwd)
             if not os.path.exists(os.path.join(cwd, config.get('keyname'))):
                 command = "ssh-keygen -t %(type)s -f %(keyname)s -N  " % config.to_dict()
                 lib.call(command, cwd=cwd, output_log_level=logging.DEBUG)
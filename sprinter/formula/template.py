@@ -9,6 +9,10 @@ target = ~/.gitignore
 username = %(config:username)s
 password = %(config:mywebsitepassword)s
 on_update = false
+
+On remove, the generated file is removed if remove_file_on_delete is
+set, which is asked for (defaulting to yes) when it isn't. A file that
+is already gone is left alone.
 """
 from __future__ import unicode_literals
 import os
@@ -24,23 +28,34 @@ class TemplateFormula(FormulaBase):
 
     def prompt(self):
         if self.environment.phase == PHASE.REMOVE:
-            self.source.prompt('remove_file_on_delete',
+            self._prompt_value('remove_file_on_delete',
                                "Would you like to remove %s?" % self.source.get('target'),
                                default="yes")
 
+    def artifacts(self):
+        phase = self.sync_phase()
+        if phase == PHASE.INSTALL or (phase == PHASE.UPDATE and self.__on_update()):
+            if self.target.get('source').startswith("http") and not self.target.has('username'):
+                return [(self.target.get('source'), None)]
+        return []
+
     def install(self):
         self.__install_file(self.target)
         FormulaBase.install(self)
 
     def update(self):
-        if self.target.has('on_update') and self.target.is_affirmative('on_update'):
+        if self.__on_update():
             self.__install_file(self.target)
         FormulaBase.update(self)
 
+    def should_refresh(self):
+        return not self.__on_update()
+
     def remove(self):
         if self.source.is_affirmative('remove_file_on_delete', False):
-            os.path.unlink(
-                os.path.expanduser(self.source.get('target')))
+            target_file = os.path.expanduser(self.source.get('target'))
+            if os.path.exists(target_file):
+                os.unlink(target_file)
         FormulaBase.remove(self)
 
     def validate(self):
@@ -51,6 +66,9 @@ class TemplateFormula(FormulaBase):
                                  "both required to authenticate to a source!")
         FormulaBase.validate(self)
 
+    def __on_update(self):
+        return self.target.has('on_update') and self.target.is_affirmative('on_update')
+
     def __install_file(self, config):
         source = config.get('source')
         if source.startswith("http"):
@@ -59,12 +77,11 @@ class TemplateFormula(FormulaBase):
                                                             config.get('password'),
                                                             source).decode("utf-8")
             else:
-                source_content = lib.cleaned_request('get', source).text
+                with open(self.environment.download_cache.fetch(source), 'rb') as fh:
+                    source_content = fh.read().decode("utf-8")
         else:
             source_content = open(os.path.expanduser(source)).read()
         target_file = os.path.expanduser(config.get('target'))
-        parent_directory = os.path.dirname(target_file)
-        if not os.path.exists(parent_directory):
-            os.makedirs(parent_directory)
+        lib.makedirs(os.path.dirname(target_file))
         with open(target_file, 'w+') as fh:
             fh.write(source_content)
@@ -4,6 +4,20 @@ from mock import Mock, patch
 from sprinter.testtools import FormulaTest
 from sprinter.formula.base import FormulaBase
 
+
+class UpdatingFormula(FormulaBase):
+
+    def update(self):
+        self.directory.add_to_env("export UPDATED=true")
+        FormulaBase.update(self)
+
+
+class RefreshingFormula(UpdatingFormula):
+
+    def refresh(self):
+        self.directory.add_to_env("export UPDATED=true")
+        FormulaBase.refresh(self)
+
 source_config = """
 [prompt_value_source]
 formula = sprinter.formula.base
@@ -47,6 +61,13 @@ class TestFormulaBase(FormulaTest):
         super(TestFormulaBase, self).setup(source_config=source_config,
                                            target_config=target_config)
 
+    def test_should_refresh(self):
+        """ A formula overriding update, but not refresh, should not be refreshed in it's place """
+        config = self.environment.target.get_feature_config('install_with_rc')
+        assert FormulaBase(self.environment, 'install_with_rc', target=config).should_refresh()
+        assert not UpdatingFormula(self.environment, 'install_with_rc', target=config).should_refresh()
+        assert RefreshingFormula(self.environment, 'install_with_rc', target=config).should_refresh()
+
     def test_install_with_rc(self):
         """ Test install with rc """
         self.directory.add_to_rc = Mock()
@@ -83,6 +83,11 @@ class TestCommandFormula(FormulaTest):
         self.environment.run_feature("update", 'sync')
         call.assert_called_once_with("echo 'update up...'", shell=False, stdout=subprocess.PIPE)
 
+    def test_should_refresh(self):
+        """ A command feature with an update command should be updated on every update """
+        assert not self.environment.features[('update', 'sprinter.formula.command')].should_refresh()
+        assert self.environment.features[('with-shell', 'sprinter.formula.command')].should_refresh()
+
     @patch.object(lib, 'call', new_callable=create_mock_call)
     def test_remove(self, call):
         self.environment.run_feature("remove", 'sync')
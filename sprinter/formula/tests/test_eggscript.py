@@ -1,5 +1,11 @@
+from __future__ import unicode_literals
 import logging
+import os
+import sys
+from io import StringIO
 from mock import Mock, patch
+from nose.tools import eq_
+from sprinter.core import load_manifest
 from sprinter.testtools import FormulaTest
 import sprinter.lib as lib
 from nose.plugins.attrib import attr
@@ -27,6 +33,11 @@ eggs = jedi, epc==0.5
 formula = sprinter.formula.eggscript
 egg = sprinter
 links = http://github.com/toumorokoshi/sprinter/tarball/master#sprinter-0.6
+
+[venv_example]
+formula = sprinter.formula.eggscript
+eggs = jedi, epc==0.5
+venv = true
 """
 
 
@@ -36,6 +47,97 @@ class TestEggscriptFormula(FormulaTest):
     def setup(self):
         super(TestEggscriptFormula, self).setup(source_config=source_config,
                                                 target_config=target_config)
+        self.install_directory = self.directory.install_directory('venv_example')
+        self.distribution = os.path.join(self.install_directory, "lib", "python3.3", "site-packages",
+                                         "jedi-0.7.0.dist-info")
+        self.feature = self.environment.features[('venv_example', 'sprinter.formula.eggscript')]
+        # formula modules are loaded apart from the sprinter package
+        self.eggscript = sys.modules[type(self.feature).__module__]
+
+    def _create_environment(self, install_directory, use_venv, logger):
+        os.makedirs(os.path.join(install_directory, "bin"))
+        os.makedirs(os.path.dirname(self.distribution))
+
+    def _pip(self, command, **kw):
+        if not os.path.exists(self.distribution):
+            os.makedirs(self.distribution)
+        return (0, b"")
+
+    @patch.object(lib, 'call')
+    def test_venv_example(self, call):
+        """ The egg formula should install the eggs into a venv, through the shared pip cache """
+        call.side_effect = self._pip
+        os.makedirs(self.environment.wheelhouse.path)
+        with patch.object(self.eggscript, '_create_environment', side_effect=self._create_environment) as create:
+            self.environment.run_feature('venv_example', 'sync')
+        eq_(create.call_args[0][:2], (self.install_directory, True))
+        eq_(call.call_args[0][0], "bin/pip install -r requirements.txt")
+        eq_(call.call_args[1]['env']['PIP_CACHE_DIR'], self.environment.pip_cache)
+        eq_(call.call_args[1]['env']['PIP_FIND_LINKS'], self.environment.wheelhouse.path)
+        assert 'PIP_NO_INDEX' not in call.call_args[1]['env']
+        with open(os.path.join(self.install_directory, 'requirements.txt')) as fh:
+            eq_(fh.read(), "jedi\nepc==0.5")
+
+    @patch.object(lib, 'call')
+    def test_offline(self, call):
+        """ An offline install should only install eggs from the wheelhouse """
+        call.side_effect = self._pip
+        self.environment.offline = True
+        with patch.object(self.eggscript, '_create_environment', side_effect=self._create_environment):
+            self.environment.run_feature('venv_example', 'sync')
+        eq_(call.call_args[1]['env']['PIP_NO_INDEX'], "1")
+
+    @patch.object(lib, 'call')
+    def test_update_satisfied(self, call):
+        """ The egg formula should only run pip when the installed eggs no longer match """
+        call.side_effect = self._pip
+        with patch.object(self.eggscript, '_create_environment', side_effect=self._create_environment):
+            self.environment.run_feature('venv_example', 'sync')
+        feature = self.feature
+        feature.source = feature.target
+        call.reset_mock()
+        feature.update()
+        assert not call.called
+        os.rmdir(self.distribution)
+        feature.update()
+        eq_(call.call_args[0][0], "bin/pip install -r requirements.txt")
+        call.reset_mock()
+        feature.target.set('redownload', 'true')
+        feature.update()
+        eq_(call.call_args[0][0], "bin/pip install -r requirements.txt --upgrade")
+
+    @patch.object(lib, 'call')
+    def test_update_venv_changed(self, call):
+        """ The egg formula should create the sandbox again when venv changes """
+        call.side_effect = self._pip
+        with patch.object(self.eggscript, '_create_environment', side_effect=self._create_environment):
+            self.environment.run_feature('venv_example', 'sync')
+        feature = self.feature
+        feature.source = feature.target
+        feature.target = load_manifest(StringIO(target_config.replace("venv = true", "venv = false")),
+                                       namespace="test").get_feature_config('venv_example')
+        open(os.path.join(self.install_directory, "bin", "stale"), 'w').close()
+        call.reset_mock()
+        with patch.object(self.eggscript, '_create_environment', side_effect=self._create_environment) as create:
+            feature.update()
+        eq_(create.call_args[0][:2], (self.install_directory, False))
+        assert not os.path.exists(os.path.join(self.install_directory, "bin", "stale"))
+        eq_(call.call_args[0][0], "bin/pip install -r requirements.txt")
+
+    @patch.object(lib, 'call')
+    def test_failed_install(self, call):
+        """ A failed pip install should be an error, and be tried again on the next update """
+        call.return_value = (1, b"")
+        with patch.object(self.eggscript, '_create_environment', side_effect=self._create_environment):
+            self.feature.install()
+        assert self.environment.error_occured
+        assert not os.path.exists(os.path.join(self.install_directory, self.eggscript.STATE_FILE))
+        call.reset_mock()
+        call.side_effect = self._pip
+        self.feature.source = self.feature.target
+        self.feature.update()
+        assert call.called
+        assert os.path.exists(os.path.join(self.install_directory, self.eggscript.STATE_FILE))
 
     @attr('full')
     def skip_simple_example(self):
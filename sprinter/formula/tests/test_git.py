@@ -2,18 +2,35 @@ from __future__ import unicode_literals
 import logging
 import os
 import os.path
+import shutil
+import subprocess
+import tempfile
+from io import StringIO
 from mock import patch
+from nose.plugins.skip import SkipTest
+from nose.tools import eq_
+from sprinter.core import load_manifest
 from sprinter.testtools import FormulaTest
 import sprinter.lib as lib
+from sprinter.lib.gitmirrors import GitMirrors
 
 vals = {
-    'repoA': 'git://github.com/toumorokoshi/sprinter.git'
+    'repoA': 'git://github.com/toumorokoshi/sprinter.git',
+    'repoB': 'git://github.com/toumorokoshi/sub.git'
 }
 
 source_config = """
 [update]
 formula = sprinter.formula.git
 url = %(repoA)s
+
+[reclone]
+formula = sprinter.formula.git
+url = %(repoA)s
+
+[moved]
+formula = sprinter.formula.git
+url = %(repoA)s
 """ % vals
 
 target_config = """
@@ -25,6 +42,26 @@ url = %(repoA)s
 formula = sprinter.formula.git
 url = %(repoA)s
 branch = develop
+
+[partial]
+formula = sprinter.formula.git
+url = %(repoA)s
+branch = develop
+depth = 1
+filter = blob:none
+single_branch = true
+sparse_paths = src
+               docs
+submodules_jobs = 4
+
+[reclone]
+formula = sprinter.formula.git
+url = %(repoA)s
+depth = 1
+
+[moved]
+formula = sprinter.formula.git
+url = %(repoB)s
 """ % vals
 
 
@@ -46,7 +83,8 @@ class TestGitFormula(FormulaTest):
         self.environment.run_feature('simple_example', 'sync')
         call.assert_called_with("git clone %s %s" % (vals['repoA'],
                                                      self.directory.install_directory('simple_example')),
-                                output_log_level=logging.DEBUG)
+                                output_log_level=logging.DEBUG, stream=True,
+                                log_path=self.directory.log_path('simple_example'))
 
     @patch.object(lib, 'call')
     def test_update_different_branches(self, call_mock):
@@ -55,14 +93,18 @@ class TestGitFormula(FormulaTest):
         call_mock.return_value = (0, '')
         self.environment.run_feature('update', 'sync')
         call_mock.assert_any_call(
-            "git fetch origin develop",
+            "git fetch origin +refs/heads/develop:refs/remotes/origin/develop",
             output_log_level=logging.DEBUG,
-            cwd=self.directory.install_directory('update')
+            cwd=self.directory.install_directory('update'),
+            stream=True,
+            log_path=self.directory.log_path('update')
         )
         call_mock.assert_any_call(
             "git checkout develop",
             output_log_level=logging.DEBUG,
-            cwd=self.directory.install_directory('update')
+            cwd=self.directory.install_directory('update'),
+            stream=True,
+            log_path=self.directory.log_path('update')
         )
 
     @patch.object(lib, 'call')
@@ -70,6 +112,155 @@ class TestGitFormula(FormulaTest):
         """ The git formula should re-clone a repo if the repo directory doesn't exist """
         call_mock.return_value = (0, '')
         self.environment.run_feature('update', 'sync')
-        call_mock.assert_any_call("git clone %s %s" % (vals['repoA'],
-                                                       self.directory.install_directory('update')),
-                                  output_log_level=logging.DEBUG)
+        call_mock.assert_any_call("git clone -b develop %s %s" % (vals['repoA'],
+                                                                  self.directory.install_directory('update')),
+                                  output_log_level=logging.DEBUG, stream=True,
+                                  log_path=self.directory.log_path('update'))
+
+    @patch.object(lib, 'call')
+    def test_partial_clone(self, call_mock):
+        """ The git formula should clone shallow, partial and sparse repositories straight from the remote """
+        call_mock.return_value = (0, '')
+        self.environment.run_feature('partial', 'sync')
+        directory = self.directory.install_directory('partial')
+        call_mock.assert_any_call("git clone -b develop --single-branch --depth 1 --filter=blob:none --sparse %s %s"
+                                  % (vals['repoA'], directory),
+                                  output_log_level=logging.DEBUG, stream=True,
+                                  log_path=self.directory.log_path('partial'))
+        call_mock.assert_any_call("git sparse-checkout set src docs",
+                                  output_log_level=logging.DEBUG, cwd=directory)
+        call_mock.assert_any_call("git submodule update --init --recursive --jobs 4",
+                                  output_log_level=logging.DEBUG, cwd=directory, stream=True,
+                                  log_path=self.directory.log_path('partial'))
+        assert not [c for c in call_mock.call_args_list if "--mirror" in c[0][0]]
+
+    @patch.object(lib, 'call')
+    def test_update_changed_clone_options(self, call_mock):
+        """ The git formula should change the depth of an existing clone, rather than clone it again """
+        directory = self.directory.install_directory('reclone')
+        os.makedirs(directory)
+        call_mock.return_value = (0, '')
+        self.environment.run_feature('reclone', 'sync')
+        assert os.path.exists(directory)
+        assert not [c for c in call_mock.call_args_list if c[0][0].startswith("git clone")]
+        call_mock.assert_any_call("git fetch --depth 1 origin +refs/heads/master:refs/remotes/origin/master",
+                                  output_log_level=logging.DEBUG, cwd=directory, stream=True,
+                                  log_path=self.directory.log_path('reclone'))
+
+    @patch.object(lib, 'call')
+    def test_update_changed_url(self, call_mock):
+        """ The git formula should clone again when the url changes """
+        directory = self.directory.install_directory('moved')
+        os.makedirs(directory)
+        call_mock.return_value = (0, '')
+        self.environment.run_feature('moved', 'sync')
+        call_mock.assert_any_call("git clone %s %s" % (vals['repoB'], directory),
+                                  output_log_level=logging.DEBUG, stream=True,
+                                  log_path=self.directory.log_path('moved'))
+
+
+class TestGitMirrors(FormulaTest):
+    """ Tests for cloning and updating through the git mirrors, against a local repository """
+
+    def setup(self):
+        if not lib.which('git'):
+            raise SkipTest("git is not installed")
+        self.temp_dir = tempfile.mkdtemp()
+        self.remote = os.path.join(self.temp_dir, "remote.git")
+        self.work = os.path.join(self.temp_dir, "work")
+        self._git(self.temp_dir, "init", "--bare", self.remote)
+        self._git(self.temp_dir, "init", self.work)
+        self._commit("first")
+        super(TestGitMirrors, self).setup(
+            target_config="[repo]\nformula = sprinter.formula.git\nurl = %s\n" % self.remote)
+        self.repo = self.directory.install_directory('repo')
+
+    def teardown(self):
+        shutil.rmtree(self.temp_dir)
+        self.tearDown()
+
+    def _git(self, cwd, *args):
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call(("git",) + args, cwd=cwd, stdout=devnull, stderr=subprocess.STDOUT)
+
+    def _commit(self, name):
+        with open(os.path.join(self.work, name), 'w') as fh:
+            fh.write(name)
+        self._git(self.work, "add", name)
+        self._git(self.work, "-c", "user.name=test", "-c", "user.email=test@localhost",
+                  "commit", "-m", name)
+        self._git(self.work, "push", self.remote, "HEAD:refs/heads/master")
+
+    def test_install(self):
+        """ The git formula should clone from a mirror, with the remote as the clone's origin """
+        self.environment.run_feature('repo', 'sync')
+        assert os.path.exists(os.path.join(self.repo, "first"))
+        assert os.path.exists(self.environment.git_mirrors.path(self.remote))
+        remote_url = subprocess.Popen(["git", "config", "remote.origin.url"], cwd=self.repo,
+                                      stdout=subprocess.PIPE).communicate()[0]
+        eq_(remote_url.decode('utf-8').strip(), self.remote)
+
+    def test_update(self):
+        """ The git formula should update through the mirror, fetching it once per run """
+        self.environment.run_feature('repo', 'sync')
+        self._commit("second")
+        feature = self.environment.features[('repo', 'sprinter.formula.git')]
+        feature.source = feature.target
+        # a new run
+        self.environment.git_mirrors = GitMirrors(self.environment.git_mirrors.mirror_dir)
+        with patch.object(lib, 'call', wraps=lib.call) as call:
+            feature.update()
+            self.environment.git_mirrors.update(self.remote)
+        assert os.path.exists(os.path.join(self.repo, "second"))
+        mirror_fetches = [c for c in call.call_args_list if c[0][0] == "git fetch --prune origin"]
+        eq_(len(mirror_fetches), 1)
+
+    def test_mirrored_concurrently(self):
+        """ A mirror created by another run during the clone should be used, and the clone discarded """
+        git_mirrors = self.environment.git_mirrors
+        path = git_mirrors.path(self.remote)
+        real_call = lib.call
+
+        def call(command, **kwargs):
+            if "--mirror" in command:
+                real_call("git clone --mirror %s %s" % (self.remote, path))
+            return real_call(command, **kwargs)
+
+        with patch.object(lib, 'call', side_effect=call):
+            eq_(git_mirrors.update(self.remote), path)
+        eq_(os.listdir(git_mirrors.mirror_dir), [os.path.basename(path)])
+
+    def test_unshallow(self):
+        """ Removing the depth should fetch the full history into the existing clone, keeping it's work """
+        feature = self.environment.features[('repo', 'sprinter.formula.git')]
+        self._commit("second")
+        feature.target.set('url', "file://" + self.remote)
+        feature.target.set('depth', '1')
+        feature.install()
+        with open(os.path.join(self.repo, "untracked"), 'w') as fh:
+            fh.write("work")
+        feature.source = load_manifest(StringIO("[repo]\nformula = sprinter.formula.git\nurl = file://%s\n"
+                                                "depth = 1\n" % self.remote),
+                                       namespace="test").get_feature_config('repo')
+        feature.target.remove('depth')
+        feature.update()
+        assert os.path.exists(os.path.join(self.repo, "untracked"))
+        count = subprocess.Popen(["git", "rev-list", "--count", "HEAD"], cwd=self.repo,
+                                 stdout=subprocess.PIPE).communicate()[0]
+        eq_(count.decode('utf-8').strip(), "2")
+
+    def test_shallow_update(self):
+        """ A shallow clone should stay shallow, and update to the remote's latest commit """
+        feature = self.environment.features[('repo', 'sprinter.formula.git')]
+        # git ignores depth for a plain path
+        feature.target.set('url', "file://" + self.remote)
+        feature.target.set('depth', '1')
+        feature.install()
+        self._commit("second")
+        self._commit("third")
+        feature.source = feature.target
+        feature.update()
+        assert os.path.exists(os.path.join(self.repo, "third"))
+        count = subprocess.Popen(["git", "rev-list", "--count", "HEAD"], cwd=self.repo,
+                                 stdout=subprocess.PIPE).communicate()[0]
+        eq_(count.decode('utf-8').strip(), "1")
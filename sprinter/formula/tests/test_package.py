@@ -1,6 +1,8 @@
 from __future__ import unicode_literals
 import logging
+import sys
 from mock import Mock, patch
+from nose.tools import eq_
 from sprinter.testtools import FormulaTest, set_os_types
 import sprinter.lib as lib
 
@@ -46,23 +48,26 @@ class TestPackageFormula(FormulaTest):
     @patch.object(lib, 'call')
     def test_simple_example_osx(self, call):
         """ A brew package should install on osx """
+        call.return_value = (0, None)
         with set_os_types(osx=True):
             self.environment.run_feature('simple_example', 'sync')
-            call.assert_called_with("brew install git", output_log_level=logging.DEBUG, stdout=None)
+            call.assert_called_with("brew install git", output_log_level=logging.DEBUG, stream=True)
 
     @patch.object(lib, 'call')
     def test_simple_example_debian(self, call):
         """ An apt-get package should install on debian """
+        call.return_value = (0, None)
         with set_os_types(debian=True):
             self.environment.run_feature('simple_example', 'sync')
-            call.assert_called_with("sudo apt-get -y install git-core", output_log_level=logging.DEBUG, stdout=None)
+            call.assert_called_with("sudo apt-get -y install git-core", output_log_level=logging.DEBUG, stream=True)
 
     @patch.object(lib, 'call')
     def test_simple_example_fedora(self, call):
         """ A yum package should install properly on fedora """
+        call.return_value = (0, None)
         with set_os_types(fedora=True):
             self.environment.run_feature('simple_example', 'sync')
-            call.assert_called_with("sudo yum install git-core", output_log_level=logging.DEBUG, stdout=None)
+            call.assert_called_with("sudo yum install git-core", output_log_level=logging.DEBUG, stream=True)
 
     @patch.object(lib, 'call')
     def test_no_update(self, call):
@@ -73,6 +78,110 @@ class TestPackageFormula(FormulaTest):
     @patch.object(lib, 'call')
     def test_update_different_package(self, call):
         """ An feature with a new formula """
+        call.return_value = (0, None)
         with set_os_types(debian=True):
             self.environment.run_feature('update_new_package', 'sync')
-            call.assert_called_with("sudo apt-get -y install gitB", output_log_level=logging.DEBUG, stdout=None)
+            call.assert_called_with("sudo apt-get -y install gitB", output_log_level=logging.DEBUG, stream=True)
+
+
+batch_config = """
+[tools]
+formula = sprinter.formula.package
+apt-get = git curl
+
+[editor]
+formula = sprinter.formula.package
+apt-get = vim curl
+
+[repository]
+formula = sprinter.formula.package
+apt-get = nginx
+depends = tools
+"""
+
+
+class TestPackageBatch(FormulaTest):
+    """ Tests for installing the packages of several features together """
+
+    def setup(self):
+        super(TestPackageBatch, self).setup(target_config=batch_config)
+        self.which_original = lib.which
+        lib.which = Mock(return_value=True)
+        self.features = [self.environment.features[(name, 'sprinter.formula.package')]
+                         for name in ('tools', 'editor', 'repository')]
+
+    def teardown(self):
+        lib.which = self.which_original
+
+    @patch.object(lib, 'call')
+    def test_prepare_batch(self, call):
+        """ The missing packages should be installed in a single call, and reported per feature """
+        call.side_effect = [(0, b"git=1:2.1=install ok installed\ncurl==unknown ok not-installed\n"),
+                            (0, b""),
+                            (1, b"curl=7.0=install ok installed\n")]
+        with set_os_types(debian=True):
+            self.features[0].prepare_batch(self.features)
+        eq_(call.call_args_list[0][0][0], "dpkg-query -W -f=${Package}=${Version}=${Status}\\n curl git nginx vim")
+        call.assert_any_call("sudo apt-get -y install curl vim", output_log_level=logging.DEBUG, stream=True)
+        eq_(call.call_count, 3)
+        eq_(self.features[0].package_states, {'git': "already installed", 'curl': "installed"})
+        eq_(self.features[1].package_states, {'vim': "failed", 'curl': "installed"})
+        # it waits on what it depends on
+        eq_(self.features[2].package_states, None)
+
+    @patch.object(lib, 'call')
+    def test_prepare_batch_failed(self, call):
+        """ When the single call fails, each feature should install it's own packages, and only fail on those """
+        call.side_effect = [(0, b"git=1:2.1=install ok installed\n"),
+                            (100, None),
+                            (100, None),
+                            (0, None),
+                            (0, b"curl=7.0=install ok installed\n")]
+        with set_os_types(debian=True):
+            self.features[0].prepare_batch(self.features)
+        commands = [c[0][0] for c in call.call_args_list]
+        eq_(commands[1:4], ["sudo apt-get -y install curl vim",
+                            "sudo apt-get -y install vim curl",
+                            "sudo apt-get -y install curl"])
+        eq_(self.features[0].package_states, {'git': "already installed", 'curl': "installed"})
+        eq_(self.features[1].package_states, {'vim': "failed", 'curl': "installed"})
+
+    @patch.object(lib, 'call')
+    def test_unknown_package(self, call):
+        """ The exit code of a feature's own install should be ignored, as it always was """
+        call.return_value = (100, None)
+        with set_os_types(debian=True):
+            self.features[2].install()
+        call.assert_called_with("sudo apt-get -y install nginx", output_log_level=logging.DEBUG, stream=True)
+        assert not self.environment.error_occured
+
+    @patch.object(lib, 'call')
+    def test_prepare_batch_installed(self, call):
+        """ Nothing should be installed if every package already is """
+        call.return_value = (0, b"curl=7.0=install ok installed\ngit=1:2.1=install ok installed\n"
+                                b"nginx=1.4=install ok installed\nvim=7.4=install ok installed\n")
+        with set_os_types(debian=True):
+            self.features[0].prepare_batch(self.features)
+            self.environment.run_feature('tools', 'sync')
+            # including the features with depends
+            self.environment.run_feature('repository', 'sync')
+        eq_(call.call_count, 1)
+        eq_(self.features[2].package_states, {'nginx': "already installed"})
+
+    @patch.object(lib, 'call')
+    def test_failed_package(self, call):
+        """ A package that failed to install should only be warned about by it's feature """
+        self.features[1].package_states = {'vim': "failed", 'curl': "installed"}
+        with set_os_types(debian=True):
+            self.features[1].install()
+        assert not call.called
+        assert not self.environment.error_occured
+
+    @patch.object(lib, 'call')
+    def test_pinned_package(self, call):
+        """ A package pinned to a version should only be installed already if that version is """
+        call.return_value = (0, b"git=1:2.0=install ok installed\ncurl=7.0=install ok installed\n")
+        with set_os_types(debian=True):
+            installed = sys.modules[type(self.features[0]).__module__]._installed_packages(
+                'apt-get', ['git=1:2.1', 'curl=7.0', 'curl'])
+        eq_(installed, set(['curl=7.0', 'curl']))
@@ -1,8 +1,10 @@
 from __future__ import unicode_literals
+import os
 import tempfile
 import shutil
+from io import BytesIO
 from mock import Mock, patch
-from nose.tools import ok_
+from nose.tools import eq_, ok_
 from nose.plugins.attrib import attr
 from sprinter.testtools import FormulaTest, set_os_types
 import sprinter.lib as lib
@@ -47,3 +49,17 @@ class TestPerforceFormula(FormulaTest):
                     self.environment.run_feature("install", 'sync')
                     ok_(extract_targz.called)
                     ok_(call.caled)
+
+    def test_download_is_closed(self):
+        """ The downloaded p4 executable should be closed once it's written """
+        self.environment.features[('install', 'sprinter.formula.perforce')].target.set('root_path', self.temp_dir)
+        download = Mock(wraps=BytesIO(b"p4"))
+        with patch.object(lib, 'download', return_value=download):
+            with patch.object(lib, 'extract_targz'):
+                with patch.object(lib, 'call', return_value=(0, b"")):
+                    with patch('sprinter.lib.system.is_64_bit', return_value=True):
+                        with set_os_types(debian=True):
+                            self.environment.run_feature("install", 'sync')
+        ok_(download.close.called)
+        with open(os.path.join(self.directory.install_directory("install"), "p4"), 'rb') as fh:
+            eq_(fh.read(), b"p4")
@@ -1,8 +1,10 @@
 from __future__ import unicode_literals
 import httpretty
+from mock import patch
 import os
 import shutil
 import tempfile
+from sprinter.core import PHASE
 from sprinter.testtools import FormulaTest
 
 source_config = """
@@ -10,6 +12,17 @@ source_config = """
 formula = sprinter.formula.template
 source = %(temp_dir)s/in.txt
 target = %(temp_dir)s/out.txt
+
+[remove_example]
+formula = sprinter.formula.template
+source = %(temp_dir)s/in.txt
+target = %(temp_dir)s/removed.txt
+remove_file_on_delete = yes
+
+[prompt_example]
+formula = sprinter.formula.template
+source = %(temp_dir)s/in.txt
+target = %(temp_dir)s/removed.txt
 """
 
 target_config = """
@@ -71,7 +84,37 @@ class TestUnpackFormula(FormulaTest):
         out_file = os.path.join(self.temp_dir, 'out.txt')
         assert os.path.exists(out_file)
         assert open(out_file).read() == UPDATE_TEMPLATE
-        
+
+    def test_remove_example(self):
+        """ The template formula should remove the file when remove_file_on_delete is set """
+        out_file = os.path.join(self.temp_dir, 'removed.txt')
+        with open(out_file, 'w+') as fh:
+            fh.write(SIMPLE_TEMPLATE)
+        self.environment.run_feature("remove_example", 'sync')
+        assert not os.path.exists(out_file)
+
+    @patch('sprinter.lib.prompt')
+    def test_prompt_example(self, prompt):
+        """ The template formula should ask whether to remove the file on remove """
+        prompt.return_value = "no"
+        self.environment.phase = PHASE.REMOVE
+        self.environment.run_feature("prompt_example", 'prompt')
+        assert prompt.called
+        assert self.environment.source.get_feature_config("prompt_example").get('remove_file_on_delete') == "no"
+
+    def test_remove_missing_file(self):
+        """ The template formula should remove cleanly when the file is already gone """
+        self.environment.run_feature("remove_example", 'sync')
+        assert not self.environment.error_occured
+        assert not os.path.exists(os.path.join(self.temp_dir, 'removed.txt'))
+
+    @patch('sprinter.lib.prompt')
+    def test_prompt_answered(self, prompt):
+        """ The template formula should not ask again whether to remove the file once it's answered """
+        self.environment.phase = PHASE.REMOVE
+        self.environment.run_feature("remove_example", 'prompt')
+        assert not prompt.called
+
 
 SIMPLE_TEMPLATE = """
 This is a simple template.
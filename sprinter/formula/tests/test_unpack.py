@@ -1,5 +1,6 @@
 from __future__ import unicode_literals
 from mock import Mock, patch
+from nose.tools import eq_
 from sprinter.testtools import FormulaTest, set_os_types
 import sprinter.lib as lib
 
@@ -42,17 +43,26 @@ class TestUnpackFormula(FormulaTest):
     def test_zip_with_target(self, extract_zip):
         """ Test the zip extracting to a specific target """
         self.environment.run_feature("zip_with_target", 'sync')
-        extract_zip.assert_called_with(TEST_ZIP, '/testpath', remove_common_prefix=False)
+        extract_zip.assert_called_with(TEST_ZIP, '/testpath', remove_common_prefix=False,
+                                       cache=self.environment.download_cache, sha256=None)
 
     @patch.object(lib, 'extract_dmg')
     def test_dmg_with_target(self, extract_dmg):
         """ Test the dmg extracting to a specific target """
         with set_os_types(osx=True):
             self.environment.run_feature("dmg_with_target", 'sync')
-            extract_dmg.assert_called_with(TEST_DMG, '/testpath', remove_common_prefix=False)
+            extract_dmg.assert_called_with(TEST_DMG, '/testpath', remove_common_prefix=False,
+                                           cache=self.environment.download_cache, sha256=None)
 
     @patch.object(lib, 'extract_targz')
     def test_targz_with_target(self, extract_targz):
         """ Test the targz extracting to a specific target """
         self.environment.run_feature("targz_with_target", 'sync')
-        extract_targz.assert_called_with(TEST_TARGZ, '/testpath', remove_common_prefix=False)
+        extract_targz.assert_called_with(TEST_TARGZ, '/testpath', remove_common_prefix=False,
+                                         cache=self.environment.download_cache, sha256=None)
+
+    def test_artifacts(self):
+        """ The url to unpack should be declared as an artifact """
+        self.environment.instantiate_features()
+        feature = [f for f in self.environment.features.run_order if f[0] == 'targz_with_target'][0]
+        eq_(self.environment.features[feature].artifacts(), [(TEST_TARGZ, None)])
@@ -8,11 +8,15 @@ symlink = go
 remove_common_prefix = true
 url = https://go.googlecode.com/files/go1.1.linux-amd64.tar.gz
 target = /tmp/
+
+sha256 is optional. If set, the download must match it, and a cached
+copy is used without checking the url for changes.
 """
 
 from __future__ import unicode_literals
 import os
 
+from sprinter.core import PHASE
 from sprinter.formula.base import FormulaBase
 from sprinter.lib import ExtractException, system
 from sprinter.core.directory import DirectoryException
@@ -27,9 +31,17 @@ class UnpackFormula(FormulaBase):
     """ A sprinter formula for unpacking a compressed package and extracting it"""
 
     valid_options = FormulaBase.valid_options + ['executable', 'symlink', 'target',
-                                                 'remove_common_prefix', 'type']
+                                                 'remove_common_prefix', 'type', 'sha256']
     required_options = FormulaBase.required_options + ['url']
 
+    def artifacts(self):
+        phase = self.sync_phase()
+        if phase == PHASE.INSTALL or (phase == PHASE.UPDATE and self.__changed()):
+            url_type = self.target.get('type', self.target.get('url'))
+            if not url_type.endswith("dmg") or system.is_osx():
+                return [(self.target.get('url'), self.__sha256(self.target))]
+        return []
+
     def install(self):
         self.__install(self.target)
         if self.target.has('executable'):
@@ -40,7 +52,7 @@ class UnpackFormula(FormulaBase):
         FormulaBase.install(self)
 
     def update(self):
-        if self.source.get('url') != self.target.get('url'):
+        if self.__changed():
             if os.path.exists(self.directory.install_directory(self.feature_name)):
                 try:
                     self.directory.remove_feature(self.feature_name)
@@ -62,6 +74,10 @@ class UnpackFormula(FormulaBase):
                                           symlink)
         FormulaBase.update(self)
 
+    def should_refresh(self):
+        # update adds nothing to the env, rc or gui files that refresh doesn't
+        return True
+
     def remove(self):
         if self.source.has('executable'):
             symlink = self.source.get('symlink', self.source.get('executable'))
@@ -78,24 +94,34 @@ class UnpackFormula(FormulaBase):
                                 config.is_affirmative('remove_common_prefix'))
         destination = config.get('target', self.directory.install_directory(self.feature_name))
         url_type = config.get('type', config.get('url'))
+        download_options = {'cache': self.environment.download_cache,
+                            'sha256': self.__sha256(config)}
         try:
             if url_type.endswith("tar.gz") or url_type.endswith("tar.bz2") or url_type.endswith("tar"):
                 lib.extract_targz(config.get('url'), destination,
-                                  remove_common_prefix=remove_common_prefix)
+                                  remove_common_prefix=remove_common_prefix, **download_options)
 
             elif config.get('type', config.get('url')).endswith("zip"):
                 lib.extract_zip(config.get('url'), destination,
-                                remove_common_prefix=remove_common_prefix)
+                                remove_common_prefix=remove_common_prefix, **download_options)
 
             elif config.get('type', config.get('url')).endswith("dmg"):
                 if not system.is_osx():
                     self.logger.warn("Non OSX based distributions can not install a dmg!")
                 else:
                     lib.extract_dmg(config.get('url'), destination,
-                                    remove_common_prefix=remove_common_prefix)
+                                    remove_common_prefix=remove_common_prefix, **download_options)
         except ExtractException:
             self.logger.warn("Unable to extract file for feature %s" % self.feature_name)
 
+    def __changed(self):
+        """ return true if the target downloads something else than the source """
+        return (self.source.get('url') != self.target.get('url') or
+                self.__sha256(self.source) != self.__sha256(self.target))
+
+    def __sha256(self, config):
+        return config.get('sha256') if config.has('sha256') else None
+
     def __symlink_executable(self, source, target):
         source_path = os.path.join(self.directory.install_directory(self.feature_name),
                                    source)
@@ -1,11 +1,16 @@
 """Sprinter, an environment installation and management tool.
 Usage:
-  sprinter install <environment_source> [-avi -n <namespace> -u <username> -p <password> -l <local_path> --allow-bad-certificate]
-  sprinter update <environment_name> [-ravi -u <username> -p <password> --allow-bad-certificate]
-  sprinter (remove | deactivate | activate) <environment_name> [-v]
+  sprinter install <environment_source> [-avi -n <namespace> -u <username> -p <password> -l <local_path> -j <jobs> --offline --trace <file> --profile <dir> --allow-bad-certificate]
+  sprinter update <environment_name> [-ravi -u <username> -p <password> -j <jobs> --offline --force --feature <feature> --with-dependents --with-dependencies --trace <file> --profile <dir> --allow-bad-certificate]
+  sprinter plan <environment_name> [-av -u <username> -p <password> --json --allow-bad-certificate]
+  sprinter remove <environment_name> [-v -j <jobs> --trace <file> --profile <dir>]
+  sprinter (deactivate | activate) <environment_name> [-v]
   sprinter validate <environment_source> [-avi -u <username> -p <password> --allow-bad-certificate]
   sprinter environments
   sprinter globals [-r]
+  sprinter cache [-v] [--prune | --clear]
+  sprinter formulas [-v -j <jobs> --refresh]
+  sprinter wheelhouse [build] [-v]
   sprinter (-h | --help)
   sprinter (-V | --version)
 
@@ -19,20 +24,34 @@ Options:
   -p <password>, --password <password>      When using basic authentication, this is the password used
   -l, --local <local_path>                  Intall the environment as a local. This installs objects relative to the local directory, and doesn't inject.
   -i, --ignore-errors                       Ignore errors in a formula
+  -j <jobs>, --jobs <jobs>                  The number of independent features to sync concurrently [default: 1]
+  --force                                   During an update, sync every feature, even those unchanged since the last update
+  --feature <feature>                       During an update, only sync these features (comma separated)
+  --with-dependents                         With --feature, also sync the features that depend on them
+  --with-dependencies                       With --feature, also sync the features they depend on
   --allow-bad-certificate                   Do not verify ssl certificates when pulling environment configurations
+  --trace <file>                            Write a trace of the run to <file>, in chrome's trace_event format
+  --profile <dir>                           Write a cProfile of each stage of the run, and a report, to <dir>
+  --json                                    Print the plan as json
+  --prune                                   Remove the least recently used downloads until the cache fits it's size limit
+  --clear                                   Remove every download from the cache
+  --refresh                                 Install every third party formula again, e.g. to pick up new releases
+  --offline                                 Install eggs from the wheelhouse only (see sprinter wheelhouse build)
   -V, --version                             Show version.
 """
 from __future__ import unicode_literals
+import json
 import logging
 import os
 import signal
 import sys
-import pkg_resources
-from docopt import docopt
+import time
+from docopt import docopt, DocoptExit
 
 import sprinter.lib as lib
 from sprinter.core import PHASE, Manifest, ManifestException, Directory, manifest
 from sprinter.environment import Environment
+from sprinter.lib.tracing import TRACER
 from sprinter.lib import SprinterException, BadCredentialsException
 from sprinter.core.globals import print_global_config, configure_config, write_config
 
@@ -61,10 +80,26 @@ def error(message):
 
 
 def parse_args(argv, Environment=Environment):
-    options = docopt(__doc__, argv=argv, version= pkg_resources.get_distribution('sprinter').version)
+    options = docopt(__doc__, argv=argv)
+    if not options['--jobs'].isdigit() or int(options['--jobs']) < 1:
+        raise DocoptExit("--jobs must be a positive integer, not %s" % options['--jobs'])
+    if options['--version']:
+        print(get_version())
+        sys.exit()
     logging_level = logging.DEBUG if options['--verbose'] else logging.INFO
+    if options['plan'] and not options['--verbose']:
+        # the plan is the output
+        logging_level = logging.WARNING
     # start processing commands
     env = Environment(logging_level=logging_level, ignore_errors=options['--ignore-errors'])
+    env.jobs = int(options['--jobs'])
+    env.offline = options['--offline']
+    if options['--trace']:
+        TRACER.enable()
+    if options['--profile']:
+        from sprinter.lib.profiling import Profiler
+        env.profiler = Profiler(os.path.abspath(os.path.expanduser(options['--profile'])))
+        env.profiler.start()
     try:
         if options['install']:
             target = options['<environment_source>']
@@ -82,12 +117,14 @@ def parse_args(argv, Environment=Environment):
                     target,
                     username=options['<username>'],
                     password=options['<password>'],
-                    verify_certificate=(not options['--allow-bad-certificate'])
+                    verify_certificate=(not options['--allow-bad-certificate']),
+                    cache=env.manifest_cache
                 )
             else:
                 target = manifest.load_manifest(
                     target,
-                    verify_certificate=(not options['--allow-bad-certificate'])
+                    verify_certificate=(not options['--allow-bad-certificate']),
+                    cache=env.manifest_cache
                 )
             env.target = target
             if options['--namespace']:
@@ -97,7 +134,7 @@ def parse_args(argv, Environment=Environment):
                 env.custom_directory_root = os.path.abspath(os.path.expanduser(options['--local']))
             env.install()
 
-        elif options['update']:
+        elif options['update'] or options['plan']:
             target = options['<environment_name>']
             env.directory = Directory(os.path.join(env.root, target),
                                       shell_util_path=env.shell_util_path)
@@ -111,9 +148,20 @@ def parse_args(argv, Environment=Environment):
                 env.source.source(),
                 username=options['<username>'] if use_auth else None,
                 password=options['<password>'] if use_auth else None,
-                verify_certificate=(not options['--allow-bad-certificate'])
+                verify_certificate=(not options['--allow-bad-certificate']),
+                cache=env.manifest_cache
             )
-            env.update(reconfigure=options['--reconfigure'])
+            if options['plan']:
+                plan = env.plan()
+                print(json.dumps(plan, indent=2, sort_keys=True) if options['--json'] else format_plan(plan))
+            else:
+                features = None
+                if options['--feature']:
+                    features = [f.strip() for f in options['--feature'].split(",") if f.strip()]
+                env.update(reconfigure=options['--reconfigure'], force=options['--force'],
+                           features=features,
+                           with_dependents=options['--with-dependents'],
+                           with_dependencies=options['--with-dependencies'])
 
         elif options["remove"]:
             env.directory = Directory(os.path.join(env.root, options['<environment_name>']),
@@ -158,7 +206,8 @@ def parse_args(argv, Environment=Environment):
                     options['<environment_source>'],
                     username=options['<username>'],
                     password=options['<password>'],
-                    verify_certificate=(not options['--allow-bad-certificate'])
+                    verify_certificate=(not options['--allow-bad-certificate']),
+                    cache=env.manifest_cache
                 )
             env.target = options['<environment_source>']
             env.validate()
@@ -172,6 +221,38 @@ def parse_args(argv, Environment=Environment):
                 write_config(env.global_config, env.global_config_path)
             else:
                 print_global_config(env.global_config)
+        elif options['cache']:
+            if options['--prune']:
+                print("Removed %s from the download cache." % format_size(env.download_cache.prune()))
+            elif options['--clear']:
+                print("Removed %s from the download cache." % format_size(env.download_cache.clear()))
+            stats = env.download_cache.stats()
+            print("Download cache at %s:" % stats['path'])
+            print("  %d downloads, %s of %s" % (stats['downloads'],
+                                                format_size(stats['size']),
+                                                format_size(stats['max_size'])))
+
+        elif options['formulas']:
+            if options['--refresh']:
+                errors = env.formula_store.refresh(jobs=env.jobs)
+                for requirement in sorted(errors):
+                    env.logger.error("Unable to refresh %s:\n%s" % (requirement, errors[requirement]))
+            installed = env.formula_store.installed()
+            print("Formulas installed at %s:" % env.formula_store.root)
+            for requirement in sorted(installed):
+                print("  %s (installed %s)" % (requirement, time.strftime(
+                    "%Y-%m-%d %H:%M", time.localtime(installed[requirement]['installed']))))
+
+        elif options['wheelhouse']:
+            if options['build']:
+                requirements = wheelhouse_requirements(env)
+                if requirements:
+                    error, output = env.wheelhouse.build(requirements)
+                    if error:
+                        env.log_error("Unable to build every wheel:\n%s" % output)
+            wheels = env.wheelhouse.wheels()
+            print("Wheelhouse at %s:" % env.wheelhouse.path)
+            print("  %d wheels" % len(wheels))
     except BadCredentialsException:
         e = sys.exc_info()[1]
         raise e
@@ -188,6 +269,87 @@ def parse_args(argv, Environment=Environment):
         env.write_debug_log("/tmp/sprinter.log")
         if env.message_failure():
             env.logger.info(env.message_failure())
+    finally:
+        if options['--trace']:
+            write_trace(env, options['--trace'])
+        if options['--profile']:
+            env.logger.info("Wrote the profile of the run to %s" % env.profiler.write())
+
+
+def write_trace(env, path, count=5):
+    """ write the trace of the run to <path>, and log the <count> slowest features """
+    TRACER.write_chrome_trace(path)
+    slowest = TRACER.totals('feature', 'feature')[:count]
+    if slowest:
+        env.logger.info("Slowest features:")
+        for name, seconds in slowest:
+            env.logger.info("  %-30s %.2fs" % (name, seconds))
+    env.logger.info("Wrote a trace of the run to %s, which can be opened in https://ui.perfetto.dev" % path)
+
+
+def wheelhouse_requirements(env):
+    """ return the eggs of every eggscript feature of the environments installed under env's root """
+    from sprinter.formula.eggscript import get_eggs
+    requirements = []
+    for name in sorted(os.listdir(env.root)) if os.path.exists(env.root) else []:
+        manifest_path = os.path.join(env.root, name, "manifest.cfg")
+        if name == ".global" or not os.path.exists(manifest_path):
+            continue
+        try:
+            installed = manifest.load_manifest(manifest_path, namespace=name, do_inherit=False)
+        except ManifestException:
+            env.logger.warn("Unable to read the manifest of %s, skipping it's eggs." % name)
+            continue
+        for section in installed.formula_sections():
+            config = installed.get_feature_config(section)
+            if config.has('formula') and config.get('formula') == 'sprinter.formula.eggscript':
+                requirements += [egg for egg in get_eggs(config) if egg and egg not in requirements]
+    return requirements
+
+
+def format_plan(plan):
+    """ format a plan for humans """
+    lines = ["Plan for environment %s:" % plan['namespace']]
+    counts = {}
+    for feature in plan['features']:
+        counts[feature['phase']] = counts.get(feature['phase'], 0) + 1
+        lines.append("  %-9s %s (%s)" % (feature['phase'], feature['name'], feature['formula']))
+        for key, (old, new) in sorted(feature['changes'].items()):
+            lines.append("      %s: %s -> %s" % (key, old, new))
+        for url in feature['artifacts']:
+            lines.append("      download %s" % url)
+        for error in feature['errors']:
+            lines.append("      %s" % error)
+    if plan.get('uninstalled_formulas'):
+        lines.append("Formulas to install:")
+        lines += ["  %s" % formula for formula in plan['uninstalled_formulas']]
+    if plan['injections']:
+        lines.append("Files to inject:")
+        lines += ["  %s" % path for path in plan['injections']]
+    lines.append(", ".join("%d to %s" % (counts.get(phase, 0), phase)
+                           for phase in ['install', 'update', 'remove']) +
+                 ", %d unchanged" % counts.get('unchanged', 0))
+    return "\n".join(lines)
+
+
+def format_size(size):
+    """ format a number of bytes for humans """
+    for unit in ['B', 'KB', 'MB']:
+        if size < 1024:
+            return "%.1f %s" % (size, unit)
+        size /= 1024.0
+    return "%.1f GB" % size
+
+
+def get_version():
+    """ return the installed version of sprinter """
+    try:
+        from importlib.metadata import version
+    except ImportError:
+        # pkg_resources is slow to import, so only fall back to it on older pythons
+        import pkg_resources
+        return pkg_resources.get_distribution('sprinter').version
+    return version('sprinter')
 
 
 def parse_domain(url):
@@ -6,6 +6,7 @@ features of the library.
 from __future__ import unicode_literals
 import logging
 import re
+import threading
 
 from getpass import getpass
 
@@ -17,11 +18,13 @@ logger = logging.getLogger(__name__)
 DOMAIN_REGEX = re.compile("^https?://(\w+\.)?\w+\.\w+\/?")
 COMMAND_WHITELIST = ["cd"]
 BYTE_CHUNKS = 50
+# features may sync concurrently, so only one may prompt at a time
+PROMPT_LOCK = threading.RLock()
 
-from .extract import extract_dmg, extract_targz, extract_zip, remove_path, ExtractException
+from .extract import download, extract_dmg, extract_targz, extract_zip, makedirs, remove_path, ExtractException
 from .command import call, whitespace_smart_split, which, is_executable, CommandMissingException
 from .module import get_subclass_from_module
-from .request import CertificateException, BadCredentialsException, authenticated_get, cleaned_request
+from .request import CertificateException, BadCredentialsException, ChecksumException, authenticated_get, cleaned_request
 from .exception import SprinterException, FormulaException
 
 
@@ -33,10 +36,11 @@ def prompt(prompt_string, default=None, secret=False, boolean=False):
     * boolean converts return value to boolean, checking for starting with a Y
     """
     prompt_string += (" (default %s): " % default if default else ": ")
-    if secret:
-        val = getpass(prompt_string)
-    else:
-        val = input(prompt_string)
+    with PROMPT_LOCK:
+        if secret:
+            val = getpass(prompt_string)
+        else:
+            val = input(prompt_string)
     val = (val if val else default)
     if boolean:
         val = val.lower().startswith('y')
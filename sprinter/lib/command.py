@@ -1,10 +1,15 @@
 from __future__ import unicode_literals
+import collections
 import os
 import logging
 import subprocess
 import sys
+import threading
+
+from .tracing import span
 
 COMMAND_WHITELIST = ["cd"]
+TAIL_LINES = 200  # the lines of a streamed command's output kept, for error reports
 
 logger = logging.getLogger(__name__)
 
@@ -17,9 +22,19 @@ class CommandMissingException(Exception):
 
 
 def call(command, stdin=None, stdout=subprocess.PIPE, env=os.environ, cwd=None, shell=False,
-         output_log_level=logging.INFO, sensitive_info=False):
-    """ Better, smarter call logic """
+         output_log_level=logging.INFO, sensitive_info=False, stream=False, tail_lines=TAIL_LINES,
+         log_path=None):
+    """
+    Better, smarter call logic
+
+    With stream, the output is logged a line at a time as the command
+    runs, and only it's last <tail_lines> lines are kept and returned,
+    so a long and verbose command runs in bounded memory. The output
+    is also appended to the file at log_path, if it's set.
+    """
     logger.debug("calling command: %s" % command)
+    if stdin is not None and not isinstance(stdin, bytes):
+        stdin = stdin.encode('utf-8')
     try:
         args = command if shell else whitespace_smart_split(command)
         kw = {}
@@ -27,14 +42,26 @@ def call(command, stdin=None, stdout=subprocess.PIPE, env=os.environ, cwd=None,
             raise CommandMissingException(args[0])
         if shell:
             kw['shell'] = True
-        process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=stdout, stderr=subprocess.STDOUT,
-                                   env=env, cwd=cwd, **kw)
-        output = process.communicate(input=stdin)[0]
-        if output is not None:
-            try:
-                logger.log(output_log_level, output.decode('utf-8'))
-            except UnicodeDecodeError:
-                pass
+        log_file = _open_log(log_path, "<sensitive>" if sensitive_info else command) if log_path else None
+        try:
+            with span("call", "command", command="<sensitive>" if sensitive_info else command) as trace_args:
+                process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=stdout, stderr=subprocess.STDOUT,
+                                           env=env, cwd=cwd, **kw)
+                if stream and stdout == subprocess.PIPE:
+                    output = _stream(process, stdin, output_log_level, tail_lines, log_file)
+                else:
+                    output = process.communicate(input=stdin)[0]
+                    if output is not None:
+                        if log_file:
+                            log_file.write(output)
+                        try:
+                            logger.log(output_log_level, output.decode('utf-8'))
+                        except UnicodeDecodeError:
+                            pass
+                trace_args['exit_code'] = process.returncode
+        finally:
+            if log_file:
+                log_file.close()
         return (process.returncode, output)
     except OSError:
         e = sys.exc_info()[1]
@@ -46,6 +73,57 @@ def call(command, stdin=None, stdout=subprocess.PIPE, env=os.environ, cwd=None,
         raise e
 
 
+def _stream(process, stdin, output_log_level, tail_lines, log_file):
+    """ log the output of process a line at a time, returning it's last <tail_lines> lines """
+    if stdin:
+        # written alongside the reads, so a command that answers before reading all of it can't block
+        writer = threading.Thread(target=_write_stdin, args=(process.stdin, stdin))
+        writer.daemon = True
+        writer.start()
+    else:
+        process.stdin.close()
+    tail = collections.deque(maxlen=tail_lines)
+    for line in iter(process.stdout.readline, b""):
+        tail.append(line)
+        if log_file:
+            log_file.write(line)
+        try:
+            logger.log(output_log_level, line.decode('utf-8').rstrip("\r\n"))
+        except UnicodeDecodeError:
+            pass
+    process.stdout.close()
+    process.wait()
+    return b"".join(tail)
+
+
+def _write_stdin(pipe, stdin):
+    try:
+        pipe.write(stdin)
+    except (IOError, OSError):
+        # the command exited without reading it all
+        pass
+    finally:
+        # a command reading until the end of it's input would wait forever otherwise
+        try:
+            pipe.close()
+        except (IOError, OSError):
+            pass
+
+
+def _open_log(log_path, command):
+    """ open the log at log_path to append the output of command to """
+    log_dir = os.path.dirname(log_path)
+    if log_dir and not os.path.exists(log_dir):
+        try:
+            os.makedirs(log_dir)
+        except OSError:
+            # created by a command running concurrently
+            pass
+    log_file = open(log_path, 'ab')
+    log_file.write(("$ %s\n" % command).encode('utf-8'))
+    return log_file
+
+
 def whitespace_smart_split(command):
     """
     Split a command by whitespace, taking care to not split on whitespace within quotes.
@@ -2,50 +2,207 @@
 dependencytree.py handles the dependency tree of sprinter formulas. It attempts to validate a dependency tree
 """
 from __future__ import unicode_literals
+from collections import defaultdict
 
 
 class DependencyTreeException(Exception):
     """
     Wrapper class for dependency tree exceptions
+
+    missing is a list of (node, dependency) tuples for dependencies that are not in the tree,
+    cycles is a list of cycles, each a list of nodes that depend on the next one.
     """
-    pass
+
+    def __init__(self, message, missing=None, cycles=None):
+        super(DependencyTreeException, self).__init__(message)
+        self.missing = missing or []
+        self.cycles = cycles or []
 
 
 class DependencyTree(object):
     """
     DependencyTree takes a dictionary of nodes and their dependencies (also need to be included in the dependencies)
+
+    node_order is the order nodes are listed in (e.g. the sections of a
+    manifest), which order keeps within a level. It defaults to the
+    order of the dictionary.
     """
 
     order = []  # a valid ordering of the dependency tree
+    levels = []  # a list of sets of nodes. the nodes in a set only depend on nodes in previous sets
+
+    def __init__(self, node_dict, node_order=None):
+        self.dependencies = node_dict
+        self.levels = self.__calculate_levels(node_dict)
+        index = dict((node, i) for i, node in enumerate(node_order or node_dict.keys()))
+        self.order = [node for level in self.levels for node in sorted(level, key=index.get)]
+
+    def critical_path(self, weights=None):
+        """
+        Return the chain of dependencies with the largest total weight,
+        from the first node that must run to the last. <weights> is a
+        dictionary of node weights (e.g. durations), defaulting to 1.
+        """
+        weights = weights or {}
+        cost, previous = {}, {}
+        for node in self.order:
+            previous[node] = None
+            longest = 0
+            for dependency in self.dependencies[node]:
+                if cost[dependency] > longest:
+                    longest, previous[node] = cost[dependency], dependency
+            cost[node] = longest + weights.get(node, 1)
+        if not cost:
+            return []
+        node = max(self.order, key=lambda n: cost[n])
+        path = []
+        while node is not None:
+            path.append(node)
+            node = previous[node]
+        return list(reversed(path))
+
+    def dependencies_of(self, nodes):
+        """ Return the nodes that <nodes> depend on, directly or indirectly """
+        return self.__reachable(nodes, self.dependencies)
 
-    def __init__(self, node_dict):
-        self.order = self.__calculate_order(node_dict)
+    def dependents_of(self, nodes):
+        """ Return the nodes that depend on <nodes>, directly or indirectly """
+        dependents = defaultdict(list)
+        for node, dependencies in self.dependencies.items():
+            for dependency in dependencies:
+                dependents[dependency].append(node)
+        return self.__reachable(nodes, dependents)
 
-    def __calculate_order(self, node_dict):
+    def __reachable(self, nodes, edges):
+        """ return the nodes reachable from <nodes> (which are not in the tree are ignored) """
+        reachable = set()
+        pending = [node for node in nodes if node in self.dependencies]
+        while pending:
+            for node in edges.get(pending.pop(), []):
+                if node not in reachable:
+                    reachable.add(node)
+                    pending.append(node)
+        return reachable - set(nodes)
+
+    def __calculate_levels(self, node_dict):
         """
-        Determine a valid ordering of the nodes in which a node is not called before all of it's dependencies.
+        Group the nodes into levels with Kahn's algorithm, each level
+        holding the nodes whose dependencies are all in previous levels.
 
-        Raise an error if there is a cycle, or nodes are missing.
+        Raise an error listing every missing dependency and every cycle.
         """
         if len(node_dict.keys()) != len(set(node_dict.keys())):
             raise DependencyTreeException("Duplicate Keys Exist in node dictionary!")
-        valid_order = [node for node, dependencies in node_dict.items() if len(dependencies) == 0]
-        remaining_nodes = [node for node in node_dict.keys() if node not in valid_order]
-        while len(remaining_nodes) > 0:
-            node_added = False
-            for node in remaining_nodes:
-                dependencies = [d for d in node_dict[node] if d not in valid_order]
-                if len(dependencies) == 0:
-                    valid_order.append(node)
-                    remaining_nodes.remove(node)
-                    node_added = True
-            if not node_added:
-                # the tree must be invalid, as it was not possible to remove a node.
-                # it's hard to find all the errors, so just spit out the first one you can find.
-                invalid_node = remaining_nodes[0]
-                invalid_dependency = node_dict[invalid_node][0]
-                if invalid_dependency not in remaining_nodes:
-                    raise DependencyTreeException("The dependency list for %s is missing" % invalid_dependency)
+        missing = []
+        waiting_on = {}
+        dependents = defaultdict(list)
+        for node, dependencies in node_dict.items():
+            present = set()
+            for dependency in dependencies:
+                if dependency in node_dict:
+                    present.add(dependency)
                 else:
-                    raise DependencyTreeException("The dependency %s is cyclic or dependent on a cyclic dependency" % invalid_dependency)
-        return valid_order
+                    missing.append((node, dependency))
+            waiting_on[node] = len(present)
+            for dependency in present:
+                dependents[dependency].append(node)
+
+        levels = []
+        level = [node for node, count in waiting_on.items() if count == 0]
+        while level:
+            levels.append(set(level))
+            next_level = []
+            for node in level:
+                for dependent in dependents[node]:
+                    waiting_on[dependent] -= 1
+                    if waiting_on[dependent] == 0:
+                        next_level.append(dependent)
+            level = next_level
+
+        blocked = [node for node, count in waiting_on.items() if count > 0]
+        if missing or blocked:
+            cycles = _find_cycles(sorted(blocked), node_dict)
+            messages = ["%s depends on %s, which does not exist" % m for m in sorted(missing)]
+            messages += ["%s is cyclic" % " -> ".join(c + c[:1]) for c in cycles]
+            raise DependencyTreeException("; ".join(messages), missing=sorted(missing), cycles=cycles)
+        return levels
+
+
+def _find_cycles(nodes, node_dict):
+    """
+    Return a cycle for each strongly connected component among <nodes>.
+    Nodes that are only blocked by a cycle are not part of one.
+    """
+    node_set = set(nodes)
+    edges = dict((n, sorted(set(d for d in node_dict[n] if d in node_set))) for n in nodes)
+    cycles = []
+    for component in _strongly_connected_components(nodes, edges):
+        component = set(component)
+        start = min(component)
+        if len(component) == 1 and start not in edges[start]:
+            continue
+        cycles.append(_shortest_cycle(start, edges, component))
+    return cycles
+
+
+def _strongly_connected_components(nodes, edges):
+    """ an iterative implementation of Tarjan's algorithm """
+    index, lowlink = {}, {}
+    stack, on_stack = [], set()
+    components = []
+    for root in nodes:
+        if root in index:
+            continue
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(edges[root]))]
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = lowlink[child] = len(index)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(edges[child])))
+                    break
+                elif child in on_stack:
+                    lowlink[node] = min(lowlink[node], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    return components
+
+
+def _shortest_cycle(start, edges, component):
+    """ breadth first search for the shortest path from start back to itself """
+    previous = {}
+    frontier = [start]
+    while frontier:
+        next_frontier = []
+        for node in frontier:
+            for child in edges[node]:
+                if child not in component or child in previous:
+                    continue
+                previous[child] = node
+                if child == start:
+                    path = [start]
+                    node = previous[start]
+                    while node != start:
+                        path.append(node)
+                        node = previous[node]
+                    return [path[0]] + list(reversed(path[1:]))
+                next_frontier.append(child)
+        frontier = next_frontier
+    return [start]
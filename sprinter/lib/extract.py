@@ -2,103 +2,168 @@
 Utilities that extract files from packages
 """
 from __future__ import unicode_literals
+import hashlib
 import os
 import shutil
 import sys
 import tarfile
 import tempfile
 import zipfile
+from contextlib import closing
 
 from .command import call
-from .request import download_to_bytesio 
+from .request import CHUNK_SIZE, ChecksumException, download_to_stream, download_to_tempfile
+from .tracing import span
 
 
 class ExtractException(Exception):
     """ Returned if there was an issue with extracting a package """
 
-def extract_targz(url, target_dir, remove_common_prefix=False, overwrite=False):
+
+def download(url, cache=None, sha256=None):
+    """
+    Return a seekable file object with the content of url, fetched
+    through <cache> (a DownloadCache) if one is passed. If <sha256> is
+    passed, the content must match it.
+    """
+    if cache is not None:
+        return open(cache.fetch(url, sha256=sha256), 'rb')
+    fileobj = download_to_tempfile(url)
+    if sha256:
+        _verify(url, fileobj, sha256)
+    return fileobj
+
+
+def download_stream(url, cache=None, sha256=None):
+    """
+    Return a file object with the content of url, that can only be
+    read forward. Unless it has to be verified first, the content is
+    downloaded as it is read (and cached once it is read to the end).
+    """
+    if cache is not None and not sha256:
+        return cache.stream(url)
+    if cache is not None or sha256:
+        return download(url, cache=cache, sha256=sha256)
+    return download_to_stream(url)
+
+
+def _verify(url, fileobj, sha256):
+    checksum = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+        checksum.update(chunk)
+    fileobj.seek(0)
+    if checksum.hexdigest() != sha256.lower():
+        raise ChecksumException("The sha256 of %s is %s, expected %s!" % (url, checksum.hexdigest(), sha256))
+
+
+def extract_targz(url, target_dir, remove_common_prefix=False, overwrite=False, cache=None, sha256=None):
     extract_tar(url, target_dir, additional_compression="gz",
-                remove_common_prefix=remove_common_prefix, overwrite=overwrite)
+                remove_common_prefix=remove_common_prefix, overwrite=overwrite,
+                cache=cache, sha256=sha256)
 
-def extract_tar(url, target_dir, additional_compression="", remove_common_prefix=False, overwrite=False):
-    """ extract a targz and install to the target directory """
+def extract_tar(url, target_dir, additional_compression="", remove_common_prefix=False, overwrite=False,
+                cache=None, sha256=None):
+    """
+    extract a tar (of any compression) and install to the target directory.
+    Members are extracted as they are downloaded, so the archive is never
+    held in memory. remove_common_prefix strips the leading directory of
+    the archive from the members inside it.
+    """
+    fileobj = None
     try:
-        if not os.path.exists(target_dir):
-            os.makedirs(target_dir)
-        tf = tarfile.TarFile.open(fileobj=download_to_bytesio(url))
-        if not os.path.exists(target_dir):
-            os.makedirs(target_dir)
-        common_prefix = os.path.commonprefix(tf.getnames())
-        if not common_prefix.endswith('/'):
-            common_prefix += "/"
-        for tfile in tf.getmembers():
-            if remove_common_prefix:
-                tfile.name = tfile.name.replace(common_prefix, "", 1)
-            if tfile.name != "":
-                target_path = os.path.join(target_dir, tfile.name)
-                if target_path != target_dir and os.path.exists(target_path):
-                    if overwrite:
-                        remove_path(target_path)
-                    else:
-                        continue
-                tf.extract(tfile, target_dir)
-    except OSError:
-        e = sys.exc_info()[1]
-        raise ExtractException(str(e))
-    except IOError:
+        makedirs(target_dir)
+        with span("extract", "extract", url=url, target=target_dir) as trace_args:
+            fileobj = download_stream(url, cache=cache, sha256=sha256)
+            tf = tarfile.open(fileobj=fileobj, mode="r|*")
+            common_prefix = None
+            trace_args['bytes'] = 0
+            for tfile in tf:
+                trace_args['bytes'] += tfile.size
+                if remove_common_prefix:
+                    tfile.name = _strip_current_directory(tfile.name)
+                    if common_prefix is None and tfile.name != "":
+                        common_prefix = tfile.name.split("/")[0] + "/"
+                    if tfile.name + "/" == common_prefix:
+                        tfile.name = ""
+                    elif common_prefix and tfile.name.startswith(common_prefix):
+                        tfile.name = tfile.name[len(common_prefix):]
+                if tfile.name != "":
+                    target_path = os.path.join(target_dir, tfile.name)
+                    if target_path != target_dir and os.path.exists(target_path):
+                        if overwrite:
+                            remove_path(target_path)
+                        else:
+                            continue
+                    tf.extract(tfile, target_dir)
+            # read the padding after the last member, so a download is cached
+            for _ in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+                pass
+    except (OSError, IOError, tarfile.TarError):
         e = sys.exc_info()[1]
         raise ExtractException(str(e))
+    finally:
+        if fileobj is not None:
+            fileobj.close()
+
+
+def _strip_current_directory(name):
+    """ remove the leading ./ of a tar member's name, so ./pkg/a has the prefix pkg/ """
+    while name.startswith("./"):
+        name = name[2:]
+    return "" if name == "." else name
 
 
-def extract_zip(url, target_dir, remove_common_prefix=False, overwrite=False):
+def extract_zip(url, target_dir, remove_common_prefix=False, overwrite=False, cache=None, sha256=None):
     try:
-        if not os.path.exists(target_dir):
-            os.makedirs(target_dir)
-        memory_file = download_to_bytesio(url)
-        zip_file = zipfile.ZipFile(memory_file)
-        common_prefix = os.path.commonprefix(zip_file.namelist())
-        for zip_file_info in zip_file.infolist():
-            target_path = zip_file_info.filename
-            if remove_common_prefix:
-                target_path = target_path.replace(common_prefix, "", 1)
-            if target_path != "":
-                target_path = os.path.join(target_dir, target_path)
-                if target_path != target_dir and os.path.exists(target_path):
-                    if overwrite:
-                        remove_path(target_path)
-                    else:
-                        return
-                zip_file.extract(zip_file_info, target_path)
+        makedirs(target_dir)
+        with span("extract", "extract", url=url, target=target_dir):
+            # zip files need random access, so they are downloaded completely first
+            with closing(download(url, cache=cache, sha256=sha256)) as download_file:
+                zip_file = zipfile.ZipFile(download_file)
+                common_prefix = os.path.commonprefix(zip_file.namelist())
+                for zip_file_info in zip_file.infolist():
+                    target_path = zip_file_info.filename
+                    if remove_common_prefix:
+                        target_path = target_path.replace(common_prefix, "", 1)
+                    if target_path != "":
+                        target_path = os.path.join(target_dir, target_path)
+                        if target_path != target_dir and os.path.exists(target_path):
+                            if overwrite:
+                                remove_path(target_path)
+                            else:
+                                return
+                        zip_file.extract(zip_file_info, target_path)
     except OSError:
         raise ExtractException()
     except IOError:
         raise ExtractException()
 
 
-def extract_dmg(url, target_dir, remove_common_prefix=False, overwrite=False):
+def extract_dmg(url, target_dir, remove_common_prefix=False, overwrite=False, cache=None, sha256=None):
     if remove_common_prefix:
         raise Exception("Remove common prefix for dmg not implemented yet!")
     tmpdir = tempfile.mkdtemp()
     try:
-        if not os.path.exists(target_dir):
-            os.makedirs(target_dir)
-        temp_file = os.path.join(tmpdir, "temp.dmg")
-        with open(temp_file, 'wb+') as fh:
-            fh.write(download_to_bytesio(url).read())
-        call("hdiutil attach %s -mountpoint /Volumes/a/" % temp_file)
-        for f in os.listdir("/Volumes/a/"):
-            if not f.startswith(".") and f != ' ':
-                source_path = os.path.join("/Volumes/a", f)
-                target_path = os.path.join(target_dir, f)
-                if target_path != target_dir and os.path.exists(target_path):
-                    if overwrite:
-                        remove_path(target_path)
+        makedirs(target_dir)
+        with span("extract", "extract", url=url, target=target_dir):
+            temp_file = os.path.join(tmpdir, "temp.dmg")
+            with closing(download_stream(url, cache=cache, sha256=sha256)) as download_file:
+                with open(temp_file, 'wb+') as fh:
+                    shutil.copyfileobj(download_file, fh)
+            call("hdiutil attach %s -mountpoint /Volumes/a/" % temp_file)
+            for f in os.listdir("/Volumes/a/"):
+                if not f.startswith(".") and f != ' ':
+                    source_path = os.path.join("/Volumes/a", f)
+                    target_path = os.path.join(target_dir, f)
+                    if target_path != target_dir and os.path.exists(target_path):
+                        if overwrite:
+                            remove_path(target_path)
+                        else:
+                            return
+                    if os.path.isdir(source_path):
+                        shutil.copytree(source_path, target_path)
                     else:
-                        return
-                if os.path.isdir(source_path):
-                    shutil.copytree(source_path, target_path)
-                else:
-                    shutil.copy(source_path, target_path)
+                        shutil.copy(source_path, target_path)
     except OSError:
         raise ExtractException()
     except IOError:
@@ -108,6 +173,15 @@ def extract_dmg(url, target_dir, remove_common_prefix=False, overwrite=False):
         shutil.rmtree(tmpdir)
 
 
+def makedirs(path):
+    """ create path and it's parents, which features syncing concurrently may be creating as well """
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+
+
 def remove_path(target_path):
     """ Delete the target path """
     if os.path.isdir(target_path):
@@ -0,0 +1,85 @@
+"""
+Local bare mirrors of git repositories, shared by every environment
+under the root.
+
+A repository cloned by several environments (or cloned again on a
+reinstall) is fetched from it's remote once per run, into
+<mirror_dir>/<hash of the url>.git, and the clones and updates are
+then made from the mirror, locally.
+
+If a mirror can not be created or updated, None is returned, and the
+caller is expected to fall back to the remote.
+"""
+from __future__ import unicode_literals
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+import sprinter.lib as lib
+
+logger = logging.getLogger(__name__)
+
+
+class GitMirrors(object):
+
+    mirror_dir = None  # the directory the mirrors are kept in
+
+    def __init__(self, mirror_dir):
+        self.mirror_dir = mirror_dir
+        self._fetched = set()  # the urls this run has already fetched
+        self._url_locks = {}
+        self._lock = threading.Lock()
+
+    def path(self, url):
+        """ return the path to the mirror of url """
+        return os.path.join(self.mirror_dir, hashlib.sha1(url.encode('utf-8')).hexdigest()[:16] + ".git")
+
+    def update(self, url):
+        """
+        Return the path to an up to date mirror of url, creating it if
+        necessary, or None if it can not be. A url is only fetched the
+        first time in a run, concurrent updates of a url wait on the first.
+        """
+        with self._lock:
+            url_lock = self._url_locks.setdefault(url, threading.Lock())
+        with url_lock:
+            path = self.path(url)
+            if url in self._fetched:
+                return path if os.path.exists(path) else None
+            self._fetched.add(url)
+            if os.path.exists(path):
+                logger.debug("Fetching %s into it's mirror..." % url)
+                error, output = lib.call("git fetch --prune origin", cwd=path,
+                                         output_log_level=logging.DEBUG, stream=True)
+                if error:
+                    logger.warn("Unable to update the mirror of %s, using it as is." % url)
+                    logger.debug(output)
+                return path
+            return self.__create(url, path)
+
+    def __create(self, url, path):
+        logger.debug("Mirroring %s..." % url)
+        lib.makedirs(self.mirror_dir)
+        # cloned next to the mirror, so concurrent runs never share a clone
+        temp_path = tempfile.mkdtemp(suffix=".tmp", dir=self.mirror_dir)
+        error, output = lib.call("git clone --mirror %s %s" % (url, temp_path),
+                                 output_log_level=logging.DEBUG, stream=True)
+        if error or not os.path.exists(os.path.join(temp_path, "HEAD")):
+            logger.warn("Unable to mirror %s, cloning it directly." % url)
+            logger.debug(output)
+            shutil.rmtree(temp_path)
+            return None
+        # an interrupted clone never leaves a partial mirror behind
+        try:
+            os.rename(temp_path, path)
+        except OSError:
+            shutil.rmtree(temp_path)
+            if not os.path.exists(path):
+                logger.warn("Unable to mirror %s, cloning it directly." % url)
+                return None
+            # another run created the mirror first
+            logger.debug("%s was mirrored by another run, using it's mirror." % url)
+        return path
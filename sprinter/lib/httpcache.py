@@ -0,0 +1,371 @@
+"""
+On-disk caches of http responses.
+
+HttpCache keeps small bodies (e.g. manifests) by url. A cached response
+is served without contacting the server until it is older than the
+cache's ttl. After that it is revalidated with a conditional request
+(If-None-Match / If-Modified-Since), and a 304 serves the cached body.
+
+DownloadCache keeps large downloads (e.g. archives) by the sha256 of
+their content, and is bounded in size by evicting the least recently
+used downloads. Downloads are always revalidated, unless the expected
+sha256 is passed and already cached.
+
+If the server can not be reached at all, both serve what they have
+cached regardless of it's age, as HttpCache does when the server
+responds with an error of it's own (5xx). Cached files are only
+readable by the user, as manifests may hold credentials.
+"""
+from __future__ import unicode_literals
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from .extract import makedirs as _makedirs
+from .request import BadCredentialsException, ChecksumException, ChunkStream, cleaned_request, iter_response
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 60  # seconds to serve a cached response without revalidating it
+DEFAULT_MAX_SIZE = 2 * 1024 * 1024 * 1024  # bytes of downloads to keep
+
+
+class HttpCache(object):
+
+    cache_dir = None  # the directory the responses are stored in
+    ttl = DEFAULT_TTL
+
+    def __init__(self, cache_dir, ttl=DEFAULT_TTL):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+
+    def get(self, url, auth=None, verify=True):
+        """ Return the body of url, from the cache if it's still valid """
+        metadata, body = self.__read(url)
+        if metadata and time.time() - metadata.get('fetched', 0) < self.ttl:
+            logger.debug("Using cached copy of %s" % url)
+            return body
+
+        import requests
+        try:
+            response = cleaned_request('get', url, headers=_conditional_headers(metadata),
+                                       auth=auth, verify=verify)
+        except requests.exceptions.SSLError:
+            raise
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if metadata is None:
+                raise
+            logger.warn("Unable to reach %s! Using the cached copy from %s." %
+                        (url, time.ctime(metadata.get('fetched', 0))))
+            return body
+
+        if response.status_code == 401:
+            raise BadCredentialsException("Unable to authenticate to %s!" % url)
+        if response.status_code == 304 and metadata:
+            logger.debug("%s has not changed, using cached copy" % url)
+            metadata['fetched'] = time.time()
+            self.__write(url, metadata, body)
+            return body
+        if response.status_code >= 500 and metadata:
+            logger.warn("%s responded with %s! Using the cached copy from %s." %
+                        (url, response.status_code, time.ctime(metadata.get('fetched', 0))))
+            return body
+        if response.status_code == 200:
+            self.__write(url, {'url': url,
+                               'etag': response.headers.get('etag'),
+                               'last_modified': response.headers.get('last-modified'),
+                               'fetched': time.time()}, response.content)
+        return response.content
+
+    def remove(self, url):
+        """ Remove url from the cache """
+        for path in self.__paths(url):
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def __paths(self, url):
+        key = _url_key(url)
+        return (os.path.join(self.cache_dir, key + ".json"),
+                os.path.join(self.cache_dir, key + ".body"))
+
+    def __read(self, url):
+        """ return the metadata and body cached for url, or (None, None) """
+        metadata_path, body_path = self.__paths(url)
+        try:
+            with open(metadata_path) as fh:
+                metadata = json.load(fh)
+            with open(body_path, 'rb') as fh:
+                body = fh.read()
+        except (IOError, OSError, ValueError):
+            return None, None
+        if metadata.get('url') != url:
+            return None, None
+        return metadata, body
+
+    def __write(self, url, metadata, body):
+        """ write the entry atomically, so concurrent runs never read half an entry """
+        metadata_path, body_path = self.__paths(url)
+        try:
+            _write_atomically(body_path, body)
+            _write_atomically(metadata_path, json.dumps(metadata).encode('utf-8'))
+        except (IOError, OSError):
+            logger.debug("Unable to write %s to the cache" % url, exc_info=True)
+
+
+class DownloadCache(object):
+    """
+    A content addressed cache of downloads. The downloads are stored
+    in <cache_dir>/objects by the sha256 of their content, and the
+    validators of each url in <cache_dir>/urls, so urls serving the
+    same content share a single copy.
+    """
+
+    cache_dir = None  # the directory the downloads are stored in
+    max_size = DEFAULT_MAX_SIZE  # the most bytes to keep, excluding the most recent download
+
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self.urls_dir = os.path.join(cache_dir, "urls")
+        self._fetched = {}  # the digests of the urls this cache has already fetched
+        self._url_locks = {}
+        self._lock = threading.Lock()
+
+    def fetch(self, url, sha256=None):
+        """
+        Return the path to the cached content of url, downloading it
+        if it's not cached or has changed. If <sha256> is passed, the
+        content must match it.
+
+        A url is only checked for changes the first time this cache
+        fetches it. Concurrent fetches of a url wait on the first.
+        """
+        sha256 = sha256.lower() if sha256 else None
+        with self.__url_lock(url):
+            digest, response = self.__revalidate(url, sha256)
+            if response is not None:
+                for _ in self.__download(url, response, sha256):
+                    pass
+                digest = self._fetched[url]
+            self._fetched[url] = digest
+            return self.__use(digest)
+
+    def stream(self, url):
+        """
+        Return a file object with the content of url, that can only be
+        read forward. If it's not cached or has changed, it's downloaded
+        as it is read, and cached once it has been read to the end.
+        """
+        with self.__url_lock(url):
+            digest, response = self.__revalidate(url, None)
+            if response is None:
+                self._fetched[url] = digest
+                return open(self.__use(digest), 'rb')
+        return ChunkStream(self.__download(url, response, None))
+
+    def __url_lock(self, url):
+        with self._lock:
+            return self._url_locks.setdefault(url, threading.Lock())
+
+    def __revalidate(self, url, sha256):
+        """
+        return the digest of the cached content of url and None if it
+        can be used, or None and the response to download it from
+        """
+        if sha256 and os.path.exists(self.__object_path(sha256)):
+            logger.debug("Using cached download of %s" % url)
+            return sha256, None
+        digest = self._fetched.get(url)
+        if digest and os.path.exists(self.__object_path(digest)):
+            self.__check(url, digest, sha256)
+            return digest, None
+
+        metadata = self.__read_entry(url)
+        if metadata and not os.path.exists(self.__object_path(metadata['sha256'])):
+            metadata = None
+        import requests
+        try:
+            response = cleaned_request('get', url, headers=_conditional_headers(metadata), stream=True)
+        except requests.exceptions.SSLError:
+            raise
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if metadata is None or sha256 not in (None, metadata['sha256']):
+                raise
+            logger.warn("Unable to reach %s! Using the cached download." % url)
+            return metadata['sha256'], None
+
+        if response.status_code == 304 and metadata:
+            logger.debug("%s has not changed, using cached download" % url)
+            self.__check(url, metadata['sha256'], sha256)
+            return metadata['sha256'], None
+        response.raise_for_status()
+        return None, response
+
+    def stats(self):
+        """ Return a dictionary describing the contents of the cache """
+        objects = self.__objects()
+        return {'path': self.cache_dir,
+                'downloads': len(objects),
+                'size': sum(size for _, size, _ in objects),
+                'max_size': self.max_size}
+
+    def prune(self, max_size=None):
+        """
+        Remove the least recently used downloads until the cache is no
+        larger than <max_size> (defaulting to the cache's), always keeping
+        the most recent. Return the number of bytes removed.
+        """
+        max_size = self.max_size if max_size is None else max_size
+        objects = sorted(self.__objects(), key=lambda o: o[2], reverse=True)
+        kept_size, removed = 0, 0
+        for i, (digest, size, _) in enumerate(objects):
+            if i == 0 or kept_size + size <= max_size:
+                kept_size += size
+                continue
+            try:
+                os.unlink(self.__object_path(digest))
+                removed += size
+            except OSError:
+                pass
+        if removed:
+            self.__remove_dangling_entries()
+        return removed
+
+    def clear(self):
+        """ Remove every download from the cache. Return the number of bytes removed. """
+        size = self.stats()['size']
+        if os.path.exists(self.cache_dir):
+            shutil.rmtree(self.cache_dir)
+        return size
+
+    def __object_path(self, digest):
+        return os.path.join(self.objects_dir, digest)
+
+    def __objects(self):
+        """ return a (digest, size, last used) tuple for every cached download """
+        if not os.path.exists(self.objects_dir):
+            return []
+        objects = []
+        for digest in os.listdir(self.objects_dir):
+            if digest.startswith("tmp"):
+                continue
+            try:
+                stat = os.stat(self.__object_path(digest))
+            except OSError:
+                continue
+            objects.append((digest, stat.st_size, stat.st_mtime))
+        return objects
+
+    def __use(self, digest):
+        """ mark a download as recently used, and return it's path """
+        path = self.__object_path(digest)
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return path
+
+    def __check(self, url, digest, sha256):
+        if sha256 and digest != sha256:
+            raise ChecksumException("The sha256 of %s is %s, expected %s!" % (url, digest, sha256))
+
+    def __download(self, url, response, sha256):
+        """
+        stream the response into the objects directory, yielding it's
+        chunks as they are written. Once the response is read to the end,
+        the download is cached and it's digest recorded as fetched.
+        """
+        logger.info("Downloading url: {0}".format(url))
+        _makedirs(self.objects_dir)
+        checksum, size = hashlib.sha256(), 0
+        fd, temp_path = tempfile.mkstemp(dir=self.objects_dir)
+        try:
+            with span("download", "download", url=url) as trace_args:
+                with os.fdopen(fd, 'wb') as fh:
+                    for chunk in iter_response(response):
+                        checksum.update(chunk)
+                        size += len(chunk)
+                        fh.write(chunk)
+                        yield chunk
+                trace_args['bytes'] = size
+            digest = checksum.hexdigest()
+            self.__check(url, digest, sha256)
+            os.rename(temp_path, self.__object_path(digest))
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+        self.__write_entry(url, {'url': url,
+                                 'etag': response.headers.get('etag'),
+                                 'last_modified': response.headers.get('last-modified'),
+                                 'sha256': digest,
+                                 'size': size})
+        self._fetched[url] = digest
+        self.__use(digest)
+        self.prune()
+
+    def __entry_path(self, url):
+        return os.path.join(self.urls_dir, _url_key(url) + ".json")
+
+    def __read_entry(self, url):
+        try:
+            with open(self.__entry_path(url)) as fh:
+                metadata = json.load(fh)
+        except (IOError, OSError, ValueError):
+            return None
+        if metadata.get('url') != url or not metadata.get('sha256'):
+            return None
+        return metadata
+
+    def __write_entry(self, url, metadata):
+        try:
+            _write_atomically(self.__entry_path(url), json.dumps(metadata).encode('utf-8'))
+        except (IOError, OSError):
+            logger.debug("Unable to write the cache entry for %s" % url, exc_info=True)
+
+    def __remove_dangling_entries(self):
+        """ remove the url entries of downloads that were removed """
+        if not os.path.exists(self.urls_dir):
+            return
+        for name in os.listdir(self.urls_dir):
+            path = os.path.join(self.urls_dir, name)
+            try:
+                with open(path) as fh:
+                    digest = json.load(fh).get('sha256')
+                if digest and not os.path.exists(self.__object_path(digest)):
+                    os.unlink(path)
+            except (IOError, OSError, ValueError):
+                pass
+
+
+def _url_key(url):
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+def _conditional_headers(metadata):
+    """ return the headers to revalidate a cached response with """
+    headers = {}
+    if metadata and metadata.get('etag'):
+        headers['If-None-Match'] = metadata['etag']
+    if metadata and metadata.get('last_modified'):
+        headers['If-Modified-Since'] = metadata['last_modified']
+    return headers
+
+
+def _write_atomically(path, content):
+    """
+    write content to path, so concurrent readers never see part of it.
+    The file is created by mkstemp, so only the user can read it.
+    """
+    directory = os.path.dirname(path)
+    _makedirs(directory)
+    fd, temp_path = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, 'wb') as fh:
+        fh.write(content)
+    os.rename(temp_path, path)
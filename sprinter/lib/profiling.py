@@ -0,0 +1,124 @@
+"""
+profiling.py profiles the stages of a run (e.g. warmup, sync) with
+cProfile, writing a pstats file per stage, and records the top
+allocation sites with tracemalloc where it is available (python 3.4+).
+
+The pstats files can be read with the pstats module, or tools like
+snakeviz.
+"""
+from __future__ import unicode_literals
+import cProfile
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from six import StringIO
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+TOP_ALLOCATIONS = 20  # the number of allocation sites in the report
+TOP_FUNCTIONS = 10  # the number of functions listed per stage in the report
+
+
+class Profiler(object):
+
+    directory = None  # the directory the profiles and report are written to
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._profiles = {}  # a cProfile.Profile per stage
+        self._durations = {}  # the seconds spent in each stage
+        self._order = []  # the stages, in the order they first ran
+        self._stack = []  # the stages currently running, innermost last
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def start(self):
+        """ Start tracing allocations """
+        if tracemalloc is not None and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Profile the body of the with statement as the stage <name>.
+        A stage that runs again adds to it's profile. A stage started
+        within another pauses the outer stage's profile until it ends.
+
+        Only the thread that started a stage is profiled, so features
+        synced concurrently (--jobs) are left out of the sync stage.
+        """
+        with self._lock:
+            if name not in self._profiles:
+                self._profiles[name] = cProfile.Profile()
+                self._durations[name] = 0
+                self._order.append(name)
+            if self._stack:
+                self._profiles[self._stack[-1]].disable()
+            self._stack.append(name)
+        profile, start = self._profiles[name], time.time()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self._lock:
+                self._durations[name] += time.time() - start
+                self._stack.pop()
+                if self._stack:
+                    self._profiles[self._stack[-1]].enable()
+
+    def stop(self):
+        """ Stop tracing allocations, keeping a snapshot of them for the report """
+        if tracemalloc is not None and tracemalloc.is_tracing():
+            self._snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+
+    def write(self):
+        """ Write a pstats file per stage, and a report, returning the report's path """
+        self.stop()
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        for name in self._order:
+            self._profiles[name].dump_stats(os.path.join(self.directory, "%s.pstats" % name))
+        report_path = os.path.join(self.directory, "report.txt")
+        with open(report_path, 'w') as fh:
+            fh.write(self.report())
+        return report_path
+
+    def report(self):
+        """ Return a short text report of the time spent in each stage, and the top allocation sites """
+        lines = ["Time spent per stage:"]
+        for name in self._order:
+            lines.append("  %-30s %8.3fs" % (name, self._durations[name]))
+        for name in self._order:
+            lines += ["", "Slowest functions in %s (cumulative):" % name]
+            lines += self.__top_functions(name)
+        lines += ["", "Top allocation sites:"]
+        if self._snapshot is None:
+            lines.append("  unavailable, tracemalloc requires python 3.4 or later")
+        else:
+            for stat in self._snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+                frame = stat.traceback[0]
+                lines.append("  %10.1f KB %6d blocks  %s:%s" % (stat.size / 1024.0, stat.count,
+                                                              frame.filename, frame.lineno))
+        return "\n".join(lines) + "\n"
+
+    def __top_functions(self, name):
+        stream = StringIO()
+        try:
+            stats = pstats.Stats(self._profiles[name], stream=stream)
+        except TypeError:
+            # raised for a profile without any calls
+            return ["  no calls recorded"]
+        stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        # drop pstats' header, keeping the table
+        table = stream.getvalue().split("\n")
+        for i, line in enumerate(table):
+            if line.strip().startswith("ncalls"):
+                return ["  " + l for l in table[i:] if l.strip()]
+        return ["  no calls recorded"]
@@ -1,12 +1,21 @@
 from __future__ import unicode_literals
 
 import logging
-import requests
 import io
-from clint.textui import progress
+import tempfile
+import threading
+from six.moves.urllib.parse import urlparse
+
+from .tracing import span
 
 logger = logging.getLogger()
 
+CHUNK_SIZE = 1024 * 64
+SPOOL_SIZE = 1024 * 1024 * 16  # bytes of a download to hold in memory before spooling it to disk
+POOL_SIZE = 10  # connections to keep open to each host
+CONNECT_TIMEOUT = 10  # seconds to wait for a connection
+READ_TIMEOUT = 60  # seconds to wait for the server to send data
+
 class BadCredentialsException(Exception):
     """ Returned if the credentials are incorrect """
 
@@ -15,12 +24,17 @@ class CertificateException(Exception):
     """ Returned if the certificates are incorrect """
 
 
+class ChecksumException(Exception):
+    """ Returned if a download does not match it's expected checksum """
+
+
 def authenticated_get(username, password, url, verify=True):
     """
     Perform an authorized query to the url, and return the result
     """
+    import requests
     try:
-        response = requests.get(url, auth=(username, password), verify=verify)
+        response = cleaned_request('get', url, auth=(username, password), verify=verify)
         if response.status_code == 401:
             raise BadCredentialsException(
                 "Unable to authenticate user %s to %s with password provided!"
@@ -31,21 +45,151 @@ def authenticated_get(username, password, url, verify=True):
 
 
 def cleaned_request(request_type, *args, **kwargs):
-    """ Perform a cleaned requests request """
-    s = requests.Session()
-    # this removes netrc checking
-    s.trust_env = False
-    return s.request(request_type, *args, **kwargs)
+    """ Perform a cleaned requests request, through the shared session """
+    return SESSION_MANAGER.request(request_type, *args, **kwargs)
+
+
+class SessionManager(object):
+    """
+    Holds the requests session shared by every request in the process,
+    so connections are kept alive and reused. The session does not
+    read the environment (e.g. netrc), and is safe to use from
+    concurrent threads.
+
+    Credentials can be bound to a host, and are then sent with every
+    request to it that does not pass it's own.
+    """
+
+    pool_size = POOL_SIZE  # connections to keep open to each host
+    timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+    def __init__(self, pool_size=POOL_SIZE, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._session = None
+        self._auth = {}
+        self._lock = threading.Lock()
+
+    def configure(self, pool_size=None, timeout=None):
+        """ Change the pool size or timeout. The session is rebuilt on it's next use. """
+        with self._lock:
+            if pool_size is not None:
+                self.pool_size = pool_size
+            if timeout is not None:
+                self.timeout = timeout
+            self.__close()
+
+    def bind_auth(self, url, auth):
+        """ Send auth with the requests to the host of url """
+        with self._lock:
+            self._auth[urlparse(url).netloc] = auth
+
+    def session(self):
+        """ Return the shared session, creating it if necessary """
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                # this removes netrc checking
+                session.trust_env = False
+                for prefix in ('http://', 'https://'):
+                    session.mount(prefix, HTTPAdapter(pool_connections=self.pool_size,
+                                                      pool_maxsize=self.pool_size))
+                self._session = session
+            return self._session
+
+    def request(self, request_type, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        if kwargs.get('auth') is None:
+            kwargs['auth'] = self._auth.get(urlparse(url).netloc)
+        return self.session().request(request_type, url, **kwargs)
+
+    def close(self):
+        """ Close every pooled connection """
+        with self._lock:
+            self.__close()
+
+    def __close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+SESSION_MANAGER = SessionManager()
 
 
 def download_to_bytesio(url):
     """ Return a bytesio object with a download bar """
-    logger.info("Downloading url: {0}".format(url))
-    r = cleaned_request('get', url, stream=True)
     stream = io.BytesIO()
-    total_length = int(r.headers.get('content-length'))
-    for chunk in progress.bar(r.iter_content(chunk_size=1024), expected_size=(total_length/1024) + 1):
-        if chunk:
+    for chunk in download_chunks(url):
+        stream.write(chunk)
+    stream.seek(0)
+    return stream
+
+
+def download_to_tempfile(url):
+    """
+    Return a temporary file object with a download bar. Small
+    downloads are kept in memory, larger ones are spooled to disk.
+    """
+    stream = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    with span("download", "download", url=url) as trace_args:
+        for chunk in download_chunks(url):
             stream.write(chunk)
+        trace_args['bytes'] = stream.tell()
     stream.seek(0)
     return stream
+
+
+def download_to_stream(url):
+    """
+    Return a read only file object that downloads url as it is read,
+    with a download bar. Only the chunk being read is held in memory.
+    """
+    return ChunkStream(download_chunks(url))
+
+
+def download_chunks(url):
+    """ Return an iterator over the chunks of a download """
+    logger.info("Downloading url: {0}".format(url))
+    response = cleaned_request('get', url, stream=True)
+    response.raise_for_status()
+    return iter_response(response)
+
+
+def iter_response(response):
+    """ Return an iterator over the chunks of a streamed response, with a download bar if it's size is known """
+    chunks = (chunk for chunk in response.iter_content(chunk_size=CHUNK_SIZE) if chunk)
+    content_length = response.headers.get('content-length')
+    if content_length is None:
+        return chunks
+    from clint.textui import progress
+    return progress.bar(chunks, expected_size=(int(content_length) // CHUNK_SIZE) + 1)
+
+
+class ChunkStream(object):
+    """ A read only file object over an iterator of byte chunks """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def close(self):
+        # stop a generator of chunks early, so it can clean up
+        if hasattr(self._chunks, 'close'):
+            self._chunks.close()
+        self._chunks = iter([])
+        self._buffer = b""
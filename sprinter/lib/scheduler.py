@@ -0,0 +1,96 @@
+"""
+scheduler.py runs actions against the nodes of a dependency graph,
+running a node only once all of it's dependencies have completed.
+
+With more than one worker, nodes that do not depend on each other
+run concurrently.
+"""
+from __future__ import unicode_literals
+import sys
+import threading
+from collections import defaultdict
+
+from six import reraise
+from six.moves import queue
+
+# how long to block on a result before checking for interrupts, in seconds
+POLL_INTERVAL = 0.1
+
+
+class SchedulerException(Exception):
+    """ Wrapper class for scheduler exceptions """
+
+
+def run_in_dependency_order(order, dependency_dict, action, workers=1):
+    """
+    Call action(node) for every node in <order>, never calling it
+    for a node before it has been called for all of the node's
+    dependencies in <dependency_dict>.
+
+    Up to <workers> nodes run at once. Nodes that are ready at the
+    same time are started in <order> order, so with a single worker
+    (the default) the nodes run serially in <order>, adjusted only
+    where it would violate a dependency.
+
+    If an action raises, no new nodes are started, the nodes already
+    running are allowed to finish, and the first exception is reraised.
+    """
+    workers = max(workers, 1)
+    position = dict((node, i) for i, node in enumerate(order))
+    waiting_on = {}
+    dependents = defaultdict(list)
+    for node in order:
+        dependencies = set(d for d in dependency_dict.get(node, []) if d in position)
+        waiting_on[node] = dependencies
+        for dependency in dependencies:
+            dependents[dependency].append(node)
+
+    ready = [node for node in order if not waiting_on[node]]
+    results = queue.Queue()
+    finished = 0
+    running = 0
+    exc_info = None
+
+    def run(node):
+        try:
+            action(node)
+            results.put((node, None))
+        except Exception:
+            results.put((node, sys.exc_info()))
+
+    while running or (ready and exc_info is None):
+        while ready and running < workers and exc_info is None:
+            node = ready.pop(0)
+            running += 1
+            if workers == 1:
+                run(node)
+            else:
+                thread = threading.Thread(target=run, args=(node,))
+                thread.daemon = True
+                thread.start()
+        node, error = _next_result(results)
+        running -= 1
+        finished += 1
+        if error is not None:
+            exc_info = exc_info or error
+            continue
+        for dependent in dependents[node]:
+            waiting_on[dependent].discard(node)
+            if not waiting_on[dependent]:
+                ready.append(dependent)
+        ready.sort(key=position.get)
+
+    if exc_info is not None:
+        reraise(*exc_info)
+    if finished != len(order):
+        raise SchedulerException("Unable to run %s: dependencies never completed!" %
+                                 ", ".join(str(n) for n in order if waiting_on[n]))
+
+
+def _next_result(results):
+    """ block on the result queue without swallowing KeyboardInterrupt """
+    while True:
+        try:
+            return results.get(True, POLL_INTERVAL)
+        except queue.Empty:
+            pass
@@ -12,50 +12,113 @@ import re
 debian_match = re.compile(".*(ubuntu|debian).*", re.IGNORECASE)
 fedora_match = re.compile(".*(RHEL).*", re.IGNORECASE)
 
-SYSTEM, NODE, RELEASE, VERSION, ARCHITECTURE, PROCESSOR = platform.uname()
-LINUX_DISTRO, LINUX_VERSION, LINUX_VERSION_NAME = platform.dist()
+OS_RELEASE_PATH = "/etc/os-release"
+
+# platform.uname() and platform.dist() may spawn processes and read
+# files, so they are only looked up the first time they are needed
+_uname = None
+_dist = None
+_dist_like = ()  # the distributions the linux distribution is based on, from os-release
+
+
+def uname():
+    """ return (system, node, release, version, architecture, processor), looked up once """
+    global _uname
+    if _uname is None:
+        _uname = tuple(platform.uname())
+    return _uname
+
+
+def linux_distribution():
+    """ return (distro, version, version name) on linux, and empty strings elsewhere, looked up once """
+    global _dist, _dist_like
+    if _dist is None:
+        if hasattr(platform, 'dist'):
+            _dist = tuple(platform.dist())
+        else:
+            # platform.dist was removed in python 3.8
+            _dist, _dist_like = _read_os_release(OS_RELEASE_PATH)
+    return _dist
+
+
+def _read_os_release(path):
+    """ return the (distro, version, version name) of an os-release file, and the distros it's like """
+    values = {}
+    try:
+        with open(path) as fh:
+            for line in fh:
+                if "=" in line:
+                    key, value = line.strip().split("=", 1)
+                    values[key] = value.strip('"\'')
+    except (IOError, OSError):
+        pass
+    return ((values.get('ID', ''), values.get('VERSION_ID', ''), values.get('VERSION_CODENAME', '')),
+            tuple(values.get('ID_LIKE', '').split()))
+
+
+def _is_distro(names):
+    """ return true if the linux distribution is, or is based on, one of names """
+    distros = (linux_distribution()[0],) + _dist_like
+    return any(distro.lower() in names for distro in distros)
+
+
+def system():
+    return uname()[0]
+
+
+def node():
+    return uname()[1]
+
+
+def release():
+    return uname()[2]
+
+
+def architecture():
+    return uname()[4]
+
 
 def get_system_info():
     """ return the system info as a string """
     return (
         "operating system = " + operating_system() + "\n" +
         "is officially supported = " + str(is_officially_supported()) + "\n" +
-        "node = "   + NODE + "\n" +
-        "release = " + RELEASE + "\n" +
-        "version = " + VERSION + "\n" +
-        "architecture = " + ARCHITECTURE + "\n"
+        "node = "   + node() + "\n" +
+        "release = " + release() + "\n" +
+        "version = " + uname()[3] + "\n" +
+        "architecture = " + architecture() + "\n"
     )
 
 def is_debian():
         """ returns true if the system is debian based """
-        return LINUX_DISTRO.lower() in ['ubuntu', 'debian']
+        return _is_distro(['ubuntu', 'debian'])
 
 
 def is_fedora():
     """ returns true if the system is fedora based """
-    return LINUX_DISTRO.lower() in ['centos', 'redhat', 'fedora']
+    return _is_distro(['centos', 'redhat', 'rhel', 'fedora'])
 
 
 def is_suse():
     """ returns true if the system is suse based """
-    return LINUX_DISTRO.lower() in ['suse']
+    return _is_distro(['suse'])
 
 
 def is_osx():
-    return SYSTEM.lower() == "darwin"
+    return system().lower() == "darwin"
 
 
 def is_linux():
-    return SYSTEM.lower() == "linux"
+    return system().lower() == "linux"
 
 
 def is_64_bit():
-    return ARCHITECTURE == "x86_64"
+    return architecture() == "x86_64"
 
 
 def operating_system():
     """ return the name of the operating system """
-    return LINUX_DISTRO or SYSTEM
+    return linux_distribution()[0] or system()
 
 
 def is_officially_supported():
@@ -65,3 +128,60 @@ def is_officially_supported():
     """
     # TODO: Get the shell name and check that as well
     return is_osx() or is_debian()
+
+
+class _PlatformValue(object):
+    """
+    A value of the platform, looked up the first time it's used. These
+    keep the module constants of earlier versions working without
+    querying the platform on import.
+    """
+
+    def __init__(self, lookup, index):
+        self._lookup = lookup
+        self._index = index
+
+    def __str__(self):
+        return str(self._lookup()[self._index])
+
+    def __unicode__(self):
+        return self._lookup()[self._index]
+
+    def __repr__(self):
+        return repr(self._lookup()[self._index])
+
+    def __eq__(self, other):
+        return self._lookup()[self._index] == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._lookup()[self._index])
+
+    def __bool__(self):
+        return bool(self._lookup()[self._index])
+    __nonzero__ = __bool__
+
+    def __len__(self):
+        return len(self._lookup()[self._index])
+
+    def __add__(self, other):
+        return self._lookup()[self._index] + other
+
+    def __radd__(self, other):
+        return other + self._lookup()[self._index]
+
+    def __getattr__(self, name):
+        return getattr(self._lookup()[self._index], name)
+
+
+SYSTEM = _PlatformValue(uname, 0)
+NODE = _PlatformValue(uname, 1)
+RELEASE = _PlatformValue(uname, 2)
+VERSION = _PlatformValue(uname, 3)
+ARCHITECTURE = _PlatformValue(uname, 4)
+PROCESSOR = _PlatformValue(uname, 5)
+LINUX_DISTRO = _PlatformValue(linux_distribution, 0)
+LINUX_VERSION = _PlatformValue(linux_distribution, 1)
+LINUX_VERSION_NAME = _PlatformValue(linux_distribution, 2)
@@ -1,3 +1,5 @@
+import sys
+from nose import tools
 from sprinter.lib.dependencytree import DependencyTree, DependencyTreeException
 
 LEGAL_TREE = {
@@ -20,6 +22,14 @@ CYCLIC_TREE = {
     'd': ['a']
 }
 
+MULTIPLE_ERROR_TREE = {
+    'a': ['b', 'x'],
+    'b': ['a'],
+    'c': ['c'],
+    'd': ['y', 'b'],
+    'e': []
+}
+
 LEGAL_ORDER = []
 
 
@@ -52,3 +62,51 @@ class TestDependencyTree(object):
         except DependencyTreeException:
             return
         raise("Cyclic tree did not raise an error!")
+
+    def test_levels(self):
+        """ Each level should only depend on previous levels """
+        dt = DependencyTree(LEGAL_TREE)
+        tools.eq_(dt.levels, [set(['c', 'd', 'e']), set(['b']), set(['a'])])
+
+    def test_order_within_level(self):
+        """ The nodes of a level should keep the order they are listed in, rather than sort """
+        dt = DependencyTree(LEGAL_TREE, node_order=['e', 'a', 'd', 'b', 'c'])
+        tools.eq_(dt.order, ['e', 'd', 'c', 'b', 'a'])
+
+    def test_dependencies_of(self):
+        """ dependencies_of should return every direct and indirect dependency """
+        dt = DependencyTree(LEGAL_TREE)
+        tools.eq_(dt.dependencies_of(['a']), set(['b', 'c', 'd']))
+        tools.eq_(dt.dependencies_of(['b', 'e']), set(['d']))
+        tools.eq_(dt.dependencies_of(['x']), set())
+
+    def test_dependents_of(self):
+        """ dependents_of should return every direct and indirect dependent """
+        dt = DependencyTree(LEGAL_TREE)
+        tools.eq_(dt.dependents_of(['d']), set(['a', 'b']))
+        tools.eq_(dt.dependents_of(['a', 'e']), set())
+
+    def test_critical_path(self):
+        """ The critical path should be the longest chain of dependencies """
+        dt = DependencyTree(LEGAL_TREE)
+        tools.eq_(dt.critical_path(), ['d', 'b', 'a'])
+        tools.eq_(dt.critical_path(weights={'e': 10}), ['e'])
+
+    def test_all_errors_reported(self):
+        """ Every missing dependency and cycle should be reported at once """
+        try:
+            DependencyTree(MULTIPLE_ERROR_TREE)
+        except DependencyTreeException:
+            e = sys.exc_info()[1]
+            tools.eq_(e.missing, [('a', 'x'), ('d', 'y')])
+            tools.eq_(e.cycles, [['a', 'b'], ['c']])
+            assert "a -> b -> a is cyclic" in str(e)
+            return
+        raise Exception("Invalid tree did not raise an error!")
+
+    def test_large_chain(self):
+        """ A long chain of dependencies should resolve in order """
+        chain = dict(("n%05d" % i, ["n%05d" % (i - 1)] if i else []) for i in range(5000))
+        dt = DependencyTree(chain)
+        tools.eq_(dt.order, sorted(chain))
+        tools.eq_(len(dt.levels), 5000)
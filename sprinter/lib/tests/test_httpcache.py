@@ -0,0 +1,215 @@
+from __future__ import unicode_literals
+import hashlib
+import os
+import shutil
+import stat
+import tempfile
+import time
+
+import httpretty
+import requests
+from mock import patch
+from nose import tools
+
+from sprinter.lib.httpcache import DownloadCache, HttpCache
+from sprinter.lib.request import BadCredentialsException, ChecksumException
+
+TEST_URI = "http://testme.com/test.cfg"
+TEST_ARCHIVE = "http://testme.com/test.tar.gz"
+ARCHIVE_BODY = b"not really an archive"
+ARCHIVE_SHA256 = hashlib.sha256(ARCHIVE_BODY).hexdigest()
+
+
+class TestHttpCache(object):
+
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.temp_dir)
+
+    @httpretty.activate
+    def test_fresh_entry_is_not_requested(self):
+        """ An entry younger than the ttl should be served without a request """
+        httpretty.register_uri(httpretty.GET, TEST_URI, body="first")
+        cache = HttpCache(self.temp_dir, ttl=60)
+        tools.eq_(cache.get(TEST_URI), b"first")
+        httpretty.register_uri(httpretty.GET, TEST_URI, body="second")
+        tools.eq_(cache.get(TEST_URI), b"first")
+
+    @httpretty.activate
+    def test_conditional_get(self):
+        """ A stale entry should be revalidated with it's validators """
+        httpretty.register_uri(httpretty.GET, TEST_URI, body="first",
+                               etag='"abc"', last_modified="Mon, 01 Jan 2024 00:00:00 GMT")
+        cache = HttpCache(self.temp_dir, ttl=0)
+        tools.eq_(cache.get(TEST_URI), b"first")
+        httpretty.register_uri(httpretty.GET, TEST_URI, body="", status=304)
+        tools.eq_(cache.get(TEST_URI), b"first")
+        request = httpretty.last_request()
+        tools.eq_(request.headers.get('If-None-Match'), '"abc"')
+        tools.eq_(request.headers.get('If-Modified-Since'), "Mon, 01 Jan 2024 00:00:00 GMT")
+
+    @httpretty.activate
+    def test_changed_entry_is_replaced(self):
+        """ A 200 to a conditional request should replace the entry """
+        httpretty.register_uri(httpretty.GET, TEST_URI, body="first", etag='"abc"')
+        cache = HttpCache(self.temp_dir, ttl=0)
+        cache.get(TEST_URI)
+        httpretty.register_uri(httpretty.GET, TEST_URI, body="second", etag='"def"')
+        tools.eq_(cache.get(TEST_URI), b"second")
+        httpretty.register_uri(httpretty.GET, TEST_URI, body="", status=304)
+        tools.eq_(cache.get(TEST_URI), b"second")
+
+    @httpretty.activate
+    def test_offline_fallback(self):
+        """ If the server can not be reached, a stale entry should be served """
+        httpretty.register_uri(httpretty.GET, TEST_URI, body="first")
+        cache = HttpCache(self.temp_dir, ttl=0)
+        cache.get(TEST_URI)
+        with patch('sprinter.lib.httpcache.cleaned_request') as cleaned_request:
+            cleaned_request.side_effect = requests.exceptions.ConnectionError()
+            tools.eq_(cache.get(TEST_URI), b"first")
+
+    @httpretty.activate
+    def test_server_error_fallback(self):
+        """ If the server responds with an error of it's own, a stale entry should be served """
+        httpretty.register_uri(httpretty.GET, TEST_URI, body="first")
+        cache = HttpCache(self.temp_dir, ttl=0)
+        cache.get(TEST_URI)
+        httpretty.register_uri(httpretty.GET, TEST_URI, body="unavailable", status=503)
+        tools.eq_(cache.get(TEST_URI), b"first")
+        httpretty.register_uri(httpretty.GET, TEST_URI, body="unavailable", status=503)
+        tools.eq_(HttpCache(os.path.join(self.temp_dir, "empty")).get(TEST_URI), b"unavailable")
+
+    @httpretty.activate
+    def test_entries_are_private(self):
+        """ Cached entries should only be readable by the user """
+        httpretty.register_uri(httpretty.GET, TEST_URI, body="first")
+        HttpCache(self.temp_dir).get(TEST_URI)
+        for name in os.listdir(self.temp_dir):
+            tools.eq_(stat.S_IMODE(os.stat(os.path.join(self.temp_dir, name)).st_mode), 0o600)
+
+    @tools.raises(requests.exceptions.ConnectionError)
+    def test_offline_without_entry(self):
+        """ If the server can not be reached and nothing is cached, the error should be raised """
+        with patch('sprinter.lib.httpcache.cleaned_request') as cleaned_request:
+            cleaned_request.side_effect = requests.exceptions.ConnectionError()
+            HttpCache(self.temp_dir).get(TEST_URI)
+
+    @httpretty.activate
+    @tools.raises(BadCredentialsException)
+    def test_bad_credentials(self):
+        """ A 401 should raise a BadCredentialsException """
+        httpretty.register_uri(httpretty.GET, TEST_URI, body="", status=401)
+        HttpCache(self.temp_dir).get(TEST_URI, auth=('user', 'wrong'))
+
+    @httpretty.activate
+    def test_errors_are_not_cached(self):
+        """ An error response should not be cached """
+        httpretty.register_uri(httpretty.GET, TEST_URI, body="missing", status=404)
+        cache = HttpCache(self.temp_dir, ttl=60)
+        cache.get(TEST_URI)
+        httpretty.register_uri(httpretty.GET, TEST_URI, body="found")
+        tools.eq_(cache.get(TEST_URI), b"found")
+
+
+class TestDownloadCache(object):
+
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def read(self, path):
+        with open(path, 'rb') as fh:
+            return fh.read()
+
+    @httpretty.activate
+    def test_fetch_is_content_addressed(self):
+        """ Urls serving the same content should share one download """
+        httpretty.register_uri(httpretty.GET, TEST_ARCHIVE, body=ARCHIVE_BODY)
+        httpretty.register_uri(httpretty.GET, "http://mirror.com/test.tar.gz", body=ARCHIVE_BODY)
+        cache = DownloadCache(self.temp_dir)
+        path = cache.fetch(TEST_ARCHIVE)
+        tools.eq_(os.path.basename(path), ARCHIVE_SHA256)
+        tools.eq_(self.read(path), ARCHIVE_BODY)
+        tools.eq_(cache.fetch("http://mirror.com/test.tar.gz"), path)
+        tools.eq_(cache.stats()['downloads'], 1)
+
+    @httpretty.activate
+    def test_revalidates(self):
+        """ A cached download should be revalidated with it's validators """
+        httpretty.register_uri(httpretty.GET, TEST_ARCHIVE, body=ARCHIVE_BODY, etag='"abc"')
+        path = DownloadCache(self.temp_dir).fetch(TEST_ARCHIVE)
+        httpretty.register_uri(httpretty.GET, TEST_ARCHIVE, body="", status=304)
+        tools.eq_(DownloadCache(self.temp_dir).fetch(TEST_ARCHIVE), path)
+        tools.eq_(httpretty.last_request().headers.get('If-None-Match'), '"abc"')
+
+    @httpretty.activate
+    def test_fetched_once(self):
+        """ A url should only be requested the first time a cache fetches it """
+        httpretty.register_uri(httpretty.GET, TEST_ARCHIVE, body=ARCHIVE_BODY)
+        cache = DownloadCache(self.temp_dir)
+        path = cache.fetch(TEST_ARCHIVE)
+        with patch('sprinter.lib.httpcache.cleaned_request') as cleaned_request:
+            tools.eq_(cache.fetch(TEST_ARCHIVE), path)
+            assert not cleaned_request.called
+
+    @httpretty.activate
+    def test_pinned_download_is_not_requested(self):
+        """ A cached download matching the sha256 should be served without a request """
+        httpretty.register_uri(httpretty.GET, TEST_ARCHIVE, body=ARCHIVE_BODY)
+        cache = DownloadCache(self.temp_dir)
+        cache.fetch(TEST_ARCHIVE)
+        with patch('sprinter.lib.httpcache.cleaned_request') as cleaned_request:
+            path = cache.fetch(TEST_ARCHIVE, sha256=ARCHIVE_SHA256.upper())
+            assert not cleaned_request.called
+        tools.eq_(self.read(path), ARCHIVE_BODY)
+
+    @httpretty.activate
+    @tools.raises(ChecksumException)
+    def test_checksum_mismatch(self):
+        """ A download that does not match the sha256 should raise, and not be cached """
+        httpretty.register_uri(httpretty.GET, TEST_ARCHIVE, body=ARCHIVE_BODY)
+        cache = DownloadCache(self.temp_dir)
+        try:
+            cache.fetch(TEST_ARCHIVE, sha256="0" * 64)
+        finally:
+            tools.eq_(cache.stats()['downloads'], 0)
+
+    @httpretty.activate
+    def test_offline_fallback(self):
+        """ If the server can not be reached, the cached download should be served """
+        httpretty.register_uri(httpretty.GET, TEST_ARCHIVE, body=ARCHIVE_BODY)
+        path = DownloadCache(self.temp_dir).fetch(TEST_ARCHIVE)
+        with patch('sprinter.lib.httpcache.cleaned_request') as cleaned_request:
+            cleaned_request.side_effect = requests.exceptions.ConnectionError()
+            tools.eq_(DownloadCache(self.temp_dir).fetch(TEST_ARCHIVE), path)
+            assert cleaned_request.called
+
+    @httpretty.activate
+    def test_least_recently_used_are_evicted(self):
+        """ The cache should evict the least recently used downloads past it's size """
+        for name in ["first", "second", "third"]:
+            httpretty.register_uri(httpretty.GET, "http://testme.com/" + name, body=name * 10)
+        cache = DownloadCache(self.temp_dir, max_size=110)
+        first = cache.fetch("http://testme.com/first")
+        second = cache.fetch("http://testme.com/second")
+        # make first the most recently used
+        os.utime(second, (time.time() - 60, time.time() - 60))
+        cache.fetch("http://testme.com/first")
+        cache.fetch("http://testme.com/third")
+        assert os.path.exists(first)
+        assert not os.path.exists(second)
+        tools.eq_(cache.stats()['size'], 100)
+
+    @httpretty.activate
+    def test_clear(self):
+        """ Clear should remove every download """
+        httpretty.register_uri(httpretty.GET, TEST_ARCHIVE, body=ARCHIVE_BODY)
+        cache = DownloadCache(os.path.join(self.temp_dir, "cache"))
+        cache.fetch(TEST_ARCHIVE)
+        tools.eq_(cache.clear(), len(ARCHIVE_BODY))
+        tools.eq_(cache.stats()['downloads'], 0)
@@ -2,8 +2,10 @@
 Tests for the library
 """
 
+import io
 import os
 import shutil
+import tarfile
 import tempfile
 from base64 import b64encode
 
@@ -16,10 +18,29 @@ from sprinter.formula.env import EnvFormula
 import sprinter.lib as lib
 from sprinter.lib import (BadCredentialsException,
                           CommandMissingException)
+from sprinter.lib.httpcache import DownloadCache
+from sprinter.lib.request import ChunkStream, SessionManager
 
 TEST_TARGZ = "http://github.com/toumorokoshi/sprinter/tarball/master"
 
 
+def _targz(members):
+    """ return a targz of (name, content) members, where members without content are directories """
+    stream = io.BytesIO()
+    tf = tarfile.open(fileobj=stream, mode="w:gz")
+    for name, content in members:
+        info = tarfile.TarInfo(str(name))
+        if content is None:
+            info.type = tarfile.DIRTYPE
+            info.mode = 0o755
+            tf.addfile(info)
+        else:
+            info.size = len(content)
+            tf.addfile(info, io.BytesIO(content))
+    tf.close()
+    return stream.getvalue()
+
+
 class TestLib(object):
 
         def test_get_formula_class(self):
@@ -65,6 +86,35 @@ class TestLib(object):
                     "pip install http://github.com/toumorokoshi/sprinter/tarball/master"),
                 ['pip', 'install', 'http://github.com/toumorokoshi/sprinter/tarball/master'])
 
+        def test_call_stream(self):
+            """ A streamed call should keep the tail of it's output, and append all of it to the log """
+            temp_dir = tempfile.mkdtemp()
+            try:
+                log_path = os.path.join(temp_dir, "logs", "feature.log")
+                with patch.object(lib.command.logger, 'log') as log:
+                    error, output = lib.call("seq 1 500", stream=True, tail_lines=3, log_path=log_path)
+                tools.eq_(error, 0)
+                tools.eq_(output, b"498\n499\n500\n")
+                tools.eq_(log.call_count, 500)
+                with open(log_path, 'rb') as fh:
+                    tools.eq_(fh.read().splitlines()[:3], [b"$ seq 1 500", b"1", b"2"])
+                lib.call("echo again", stream=True, log_path=log_path)
+                with open(log_path, 'rb') as fh:
+                    tools.eq_(fh.read().splitlines()[-2:], [b"$ echo again", b"again"])
+            finally:
+                shutil.rmtree(temp_dir)
+
+        def test_call_stream_stdin(self):
+            """ A streamed call should pass stdin, and return the exit code """
+            tools.eq_(lib.call("cat", stdin=b"one\ntwo\n", stream=True), (0, b"one\ntwo\n"))
+            tools.eq_(lib.call("exit 3", shell=True, stream=True), (3, b""))
+
+        def test_call_text_stdin(self):
+            """ Text stdin should be encoded, and closed once it's written """
+            text = b"caf\xc3\xa9\n".decode('utf-8')
+            tools.eq_(lib.call("cat", stdin=text, stream=True), (0, b"caf\xc3\xa9\n"))
+            tools.eq_(lib.call("cat", stdin=text), (0, b"caf\xc3\xa9\n"))
+
         def test_call_error(self):
             """ Test an exception is thrown for a non-existent command """
             try:
@@ -156,6 +206,81 @@ class TestLib(object):
             finally:
                 shutil.rmtree(test_dir)
 
+        @httpretty.activate
+        def test_targz_without_content_length(self):
+            """ A targz should extract when the server does not send it's length """
+            TEST_URI = "http://testme.com/test.tar.gz"
+            httpretty.register_uri(httpretty.GET, TEST_URI,
+                                   body=open("./test_data/test_tar.tar.gz", 'rb').read(),
+                                   forcing_headers={'content-type': 'application/x-gzip'})
+            test_dir = tempfile.mkdtemp()
+            try:
+                lib.extract_targz(TEST_URI, test_dir, remove_common_prefix=True)
+                assert os.path.exists(os.path.join(test_dir, "sprinter", "formulas"))
+            finally:
+                shutil.rmtree(test_dir)
+
+        @httpretty.activate
+        def test_targz_streams(self):
+            """ A targz should be extracted as it is downloaded, without buffering it """
+            TEST_URI = "http://testme.com/test.tar.gz"
+            httpretty.register_uri(httpretty.GET, TEST_URI,
+                                   body=open("./test_data/test_tar.tar.gz", 'rb').read())
+            test_dir = tempfile.mkdtemp()
+            try:
+                with patch('sprinter.lib.extract.download_to_tempfile') as download_to_tempfile:
+                    lib.extract_targz(TEST_URI, test_dir, remove_common_prefix=True)
+                    assert not download_to_tempfile.called
+                assert os.path.exists(os.path.join(test_dir, "sprinter", "formulas"))
+            finally:
+                shutil.rmtree(test_dir)
+
+        @httpretty.activate
+        def test_targz_current_directory_prefix(self):
+            """ The common prefix of an archive with ./pkg/ members should be pkg/ """
+            TEST_URI = "http://testme.com/test.tar.gz"
+            httpretty.register_uri(httpretty.GET, TEST_URI,
+                                   body=_targz([("./", None), ("./pkg/", None), ("./pkg/bin/", None),
+                                                ("./pkg/bin/tool", b"tool")]))
+            test_dir = tempfile.mkdtemp()
+            try:
+                lib.extract_targz(TEST_URI, test_dir, remove_common_prefix=True)
+                assert os.path.exists(os.path.join(test_dir, "bin", "tool"))
+                assert not os.path.exists(os.path.join(test_dir, "pkg"))
+            finally:
+                shutil.rmtree(test_dir)
+
+        @httpretty.activate
+        def test_targz_streams_into_cache(self):
+            """ A cached targz should be extracted as it is downloaded, and cached """
+            TEST_URI = "http://testme.com/test.tar.gz"
+            httpretty.register_uri(httpretty.GET, TEST_URI,
+                                   body=open("./test_data/test_tar.tar.gz", 'rb').read())
+            test_dir = tempfile.mkdtemp()
+            try:
+                cache = DownloadCache(os.path.join(test_dir, "cache"))
+                with patch('sprinter.lib.extract.download') as download:
+                    lib.extract_targz(TEST_URI, os.path.join(test_dir, "first"),
+                                      remove_common_prefix=True, cache=cache)
+                    assert not download.called
+                assert os.path.exists(os.path.join(test_dir, "first", "sprinter", "formulas"))
+                tools.eq_(cache.stats()['downloads'], 1)
+                with patch('sprinter.lib.httpcache.cleaned_request') as cleaned_request:
+                    lib.extract_targz(TEST_URI, os.path.join(test_dir, "second"),
+                                      remove_common_prefix=True, cache=cache)
+                    assert not cleaned_request.called
+                assert os.path.exists(os.path.join(test_dir, "second", "sprinter", "formulas"))
+            finally:
+                shutil.rmtree(test_dir)
+
+        def test_chunk_stream(self):
+            """ A chunk stream should read across chunk boundaries """
+            stream = ChunkStream([b"abc", b"de", b"", b"fgh"])
+            tools.eq_(stream.read(4), b"abcd")
+            tools.eq_(stream.read(2), b"ef")
+            tools.eq_(stream.read(), b"gh")
+            tools.eq_(stream.read(1), b"")
+
         def test_remove_path(self):
             """ Remove path should handle removing a directory and a path """
             test_dir = tempfile.mkdtemp()
@@ -206,6 +331,28 @@ class TestLib(object):
                                    body=CONTENT, status=401)
             lib.authenticated_get("username", "password", TEST_URI)
 
+        def test_session_is_shared(self):
+            """ Requests should share a session that ignores the environment """
+            manager = SessionManager()
+            session = manager.session()
+            tools.ok_(manager.session() is session)
+            tools.ok_(not session.trust_env)
+            manager.configure(pool_size=2)
+            tools.ok_(manager.session() is not session)
+            tools.eq_(manager.session().get_adapter("http://testme.com")._pool_maxsize, 2)
+
+        @httpretty.activate
+        def test_session_auth_is_bound_per_host(self):
+            """ Bound credentials should only be sent to their host """
+            httpretty.register_uri(httpretty.GET, "http://testme.com/test.html", body="hello")
+            httpretty.register_uri(httpretty.GET, "http://other.com/test.html", body="hello")
+            manager = SessionManager()
+            manager.bind_auth("http://testme.com/manifest.cfg", ("username", "password"))
+            manager.request('get', "http://testme.com/test.html")
+            tools.ok_("Authorization" in httpretty.last_request().headers)
+            manager.request('get', "http://other.com/test.html")
+            tools.ok_("Authorization" not in httpretty.last_request().headers)
+
         @patch.object(lib, 'call')
         def test_insert_environment_osx(self, call):
             """ Insert environment gui should inject variables into the environment """
@@ -0,0 +1,52 @@
+from __future__ import unicode_literals
+import os
+import pstats
+import shutil
+import tempfile
+
+from nose import tools
+
+from sprinter.lib.profiling import Profiler
+
+
+def busy():
+    return sum(range(1000))
+
+
+class TestProfiler(object):
+
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.profiler = Profiler(os.path.join(self.temp_dir, "profile"))
+
+    def teardown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_write(self):
+        """ write should create a pstats file per stage, and a report """
+        self.profiler.start()
+        with self.profiler.stage("warmup"):
+            busy()
+        with self.profiler.stage("sync"):
+            pass
+        report_path = self.profiler.write()
+        for name in ["warmup", "sync"]:
+            assert os.path.exists(os.path.join(self.temp_dir, "profile", name + ".pstats"))
+        with open(report_path) as fh:
+            report = fh.read()
+        assert report.index("warmup") < report.index("sync")
+        assert "Top allocation sites:" in report
+
+    def test_nested_stages(self):
+        """ A stage run within another should only be profiled in the inner stage """
+        with self.profiler.stage("inject_environment_config"):
+            with self.profiler.stage("warmup"):
+                busy()
+        self.profiler.write()
+        profile_path = os.path.join(self.temp_dir, "profile", "%s.pstats")
+        tools.eq_(self.called(profile_path % "warmup"), True)
+        tools.eq_(self.called(profile_path % "inject_environment_config"), False)
+
+    def called(self, path):
+        stats = pstats.Stats(path)
+        return any(function[2] == 'busy' for function in stats.stats)
@@ -0,0 +1,75 @@
+from __future__ import unicode_literals
+import threading
+import time
+
+from nose import tools
+from sprinter.lib.scheduler import run_in_dependency_order, SchedulerException
+
+ORDER = ['e', 'a', 'b', 'c', 'd']
+
+DEPENDENCIES = {
+    'a': ['b', 'c', 'd'],
+    'b': ['d'],
+    'c': [],
+    'd': [],
+    'e': []
+}
+
+
+class TestScheduler(object):
+
+    def test_serial_order(self):
+        """ A single worker should run nodes in order, moved only to respect dependencies """
+        ran = []
+        run_in_dependency_order(ORDER, DEPENDENCIES, ran.append)
+        tools.eq_(ran, ['e', 'c', 'd', 'b', 'a'])
+
+    def test_concurrent_dependencies(self):
+        """ Multiple workers should never run a node before it's dependencies """
+        ran = []
+        lock = threading.Lock()
+
+        def action(node):
+            time.sleep(0.01)
+            with lock:
+                for dependency in DEPENDENCIES[node]:
+                    assert dependency in ran, "%s ran before %s!" % (node, dependency)
+                ran.append(node)
+
+        run_in_dependency_order(ORDER, DEPENDENCIES, action, workers=4)
+        tools.eq_(sorted(ran), sorted(ORDER))
+
+    def test_concurrent_runs_in_parallel(self):
+        """ Independent nodes should run at the same time """
+        started = {'a': threading.Event(), 'b': threading.Event()}
+        other = {'a': 'b', 'b': 'a'}
+        met = {}
+
+        def action(node):
+            # each node waits for the other to start, which never happens if they run one at a time
+            started[node].set()
+            started[other[node]].wait(2)
+            met[node] = started[other[node]].is_set()
+
+        run_in_dependency_order(['a', 'b'], {}, action, workers=2)
+        tools.eq_(met, {'a': True, 'b': True})
+
+    @tools.raises(ValueError)
+    def test_error_stops_scheduling(self):
+        """ An error should stop dependents from running, and be reraised """
+        ran = []
+
+        def action(node):
+            if node == 'd':
+                raise ValueError()
+            ran.append(node)
+
+        try:
+            run_in_dependency_order(ORDER, DEPENDENCIES, action, workers=2)
+        finally:
+            assert 'a' not in ran and 'b' not in ran
+
+    @tools.raises(SchedulerException)
+    def test_cycle(self):
+        """ Nodes that can never run should raise an exception """
+        run_in_dependency_order(['a', 'b'], {'a': ['b'], 'b': ['a']}, lambda node: None)
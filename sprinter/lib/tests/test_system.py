@@ -0,0 +1,54 @@
+from __future__ import unicode_literals
+import os
+import shutil
+import tempfile
+
+from mock import patch
+from nose import tools
+
+from sprinter.lib import system
+
+RHEL_OS_RELEASE = """
+NAME="Red Hat Enterprise Linux"
+VERSION="9.2 (Plow)"
+ID="rhel"
+ID_LIKE="fedora"
+VERSION_ID="9.2"
+"""
+
+
+class TestSystem(object):
+
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_read_os_release(self):
+        """ os-release should be read as the distro, version and version name, and the distros it's like """
+        path = os.path.join(self.temp_dir, "os-release")
+        with open(path, 'w') as fh:
+            fh.write(RHEL_OS_RELEASE)
+        tools.eq_(system._read_os_release(path), (("rhel", "9.2", ""), ("fedora",)))
+
+    def test_read_missing_os_release(self):
+        """ a missing os-release should be read as empty """
+        tools.eq_(system._read_os_release(os.path.join(self.temp_dir, "missing")), (("", "", ""), ()))
+
+    def test_rhel_is_fedora(self):
+        """ rhel, and the distributions based on fedora, should be fedora based """
+        with patch.object(system, 'linux_distribution', return_value=("rhel", "9.2", "")):
+            assert system.is_fedora()
+        with patch.object(system, 'linux_distribution', return_value=("rocky", "9.2", "")):
+            with patch.object(system, '_dist_like', ("rhel", "centos", "fedora")):
+                assert system.is_fedora()
+                assert not system.is_debian()
+
+    def test_constants(self):
+        """ the module constants of earlier versions should look up the platform when used """
+        with patch.object(system, '_uname', ("Linux", "node", "4.0", "#1", "x86_64", "")):
+            tools.eq_(system.SYSTEM, "Linux")
+            tools.eq_(system.SYSTEM.lower(), "linux")
+            tools.eq_("arch = " + system.ARCHITECTURE, "arch = x86_64")
+            assert not system.PROCESSOR
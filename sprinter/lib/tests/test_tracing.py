@@ -0,0 +1,80 @@
+from __future__ import unicode_literals
+import json
+import os
+import shutil
+import tempfile
+
+from nose import tools
+
+import sprinter.lib as lib
+from sprinter.lib.tracing import TRACER, Tracer
+
+
+class TestTracer(object):
+
+    def setup(self):
+        self.tracer = Tracer()
+
+    def test_disabled(self):
+        """ A disabled tracer should not record spans """
+        with self.tracer.span("test", "test"):
+            pass
+        tools.eq_(self.tracer.spans(), [])
+
+    def test_span(self):
+        """ A span should be recorded with it's arguments, including those added in it's body """
+        self.tracer.enable()
+        with self.tracer.span("sync git", "feature", feature="git") as args:
+            args['bytes'] = 10
+        span = self.tracer.spans('feature')[0]
+        tools.eq_(span['name'], "sync git")
+        tools.eq_(span['args'], {'feature': "git", 'bytes': 10})
+        tools.eq_(self.tracer.spans('download'), [])
+
+    @tools.raises(ValueError)
+    def test_span_with_error(self):
+        """ A span should be recorded even if it's body raises an exception """
+        self.tracer.enable()
+        try:
+            with self.tracer.span("failing", "test"):
+                raise ValueError()
+        finally:
+            tools.eq_(len(self.tracer.spans()), 1)
+
+    def test_totals(self):
+        """ Totals should sum the durations by an argument, longest first """
+        self.tracer.record("install a", "feature", 0, 1, {'feature': 'a'})
+        self.tracer.record("install b", "feature", 0, 2, {'feature': 'b'})
+        self.tracer.record("prompt a", "feature", 0, 1.5, {'feature': 'a'})
+        self.tracer.record("call", "command", 0, 5, {'command': 'ls'})
+        tools.eq_(self.tracer.totals('feature', 'feature'), [('a', 2.5), ('b', 2)])
+
+    def test_chrome_trace(self):
+        """ The chrome trace should hold a complete event per span, in microseconds """
+        self.tracer.record("install a", "feature", self.tracer._start + 1, 0.5, {'feature': 'a', 'levels': [1, 2]})
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, "trace.json")
+            self.tracer.write_chrome_trace(path)
+            with open(path) as fh:
+                trace = json.load(fh)
+        finally:
+            shutil.rmtree(temp_dir)
+        event = trace['traceEvents'][0]
+        tools.eq_(event['ph'], 'X')
+        tools.eq_(event['ts'], 1000000)
+        tools.eq_(event['dur'], 500000)
+        tools.eq_(event['cat'], 'feature')
+        tools.eq_(event['args'], {'feature': 'a', 'levels': '[1, 2]'})
+
+    def test_call_is_traced(self):
+        """ lib.call should record a span with the command's exit code """
+        TRACER.enable()
+        try:
+            lib.call("false")
+            span = TRACER.spans('command')[-1]
+            tools.eq_(span['args']['command'], "false")
+            tools.eq_(span['args']['exit_code'], 1)
+        finally:
+            TRACER.enabled = False
+            TRACER.clear()
@@ -0,0 +1,63 @@
+from __future__ import unicode_literals
+import os
+import shutil
+import sys
+import tempfile
+
+from mock import patch
+from nose import SkipTest, tools
+
+import sprinter.lib as lib
+from sprinter.lib.wheelhouse import Wheelhouse
+
+SETUP_PY = """
+from setuptools import setup
+setup(name="wheelhousetest", version="0.1", py_modules=["wheelhousetest"])
+"""
+
+
+class TestWheelhouse(object):
+
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.wheelhouse = Wheelhouse(os.path.join(self.temp_dir, "wheelhouse"))
+
+    def teardown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_pip_environment(self):
+        """ pip should look in the wheelhouse once it exists, and only there when offline """
+        tools.eq_(self.wheelhouse.pip_environment(env={'PATH': "/bin"}), {'PATH': "/bin"})
+        os.makedirs(self.wheelhouse.path)
+        env = self.wheelhouse.pip_environment(env={'PATH': "/bin"})
+        tools.eq_(env, {'PATH': "/bin", 'PIP_FIND_LINKS': self.wheelhouse.path})
+        env = self.wheelhouse.pip_environment(offline=True, env={})
+        tools.eq_(env['PIP_NO_INDEX'], "1")
+
+    def test_build(self):
+        """ build should build a wheel for each requirement into the wheelhouse """
+        try:
+            import wheel
+        except ImportError:
+            raise SkipTest("wheel is not installed")
+        project = os.path.join(self.temp_dir, "project")
+        os.makedirs(project)
+        with open(os.path.join(project, "setup.py"), 'w') as fh:
+            fh.write(SETUP_PY)
+        with open(os.path.join(project, "wheelhousetest.py"), 'w') as fh:
+            fh.write("")
+        tools.eq_(self.wheelhouse.wheels(), [])
+        error, output = self.wheelhouse.build([project], env=dict(os.environ, PIP_NO_INDEX="1"))
+        tools.eq_(error, 0, output)
+        wheels = self.wheelhouse.wheels()
+        tools.eq_(len(wheels), 1)
+        assert wheels[0].startswith("wheelhousetest-0.1-")
+
+    @patch.object(lib, 'call')
+    def test_build_call(self, call):
+        """ pip wheel should run through lib.call, pointed at the wheelhouse """
+        call.return_value = (1, b"No matching distribution")
+        tools.eq_(self.wheelhouse.build(["mypkg"]), (1, "No matching distribution"))
+        assert call.call_args[0][0].startswith("%s -m pip wheel --wheel-dir %s -r " % (sys.executable,
+                                                                                      self.wheelhouse.path))
+        tools.eq_(call.call_args[1]['env']['PIP_FIND_LINKS'], self.wheelhouse.path)
@@ -0,0 +1,112 @@
+"""
+tracing.py records spans: named, timed sections of a run, such as a
+feature's sync, a download or a subprocess. Each span carries
+arguments describing it (e.g. the feature, the bytes downloaded, the
+exit code of a command).
+
+Spans are only recorded once the tracer is enabled, so instrumented
+code costs next to nothing otherwise. The spans can be written as a
+Chrome trace_event file, which can be opened in Perfetto
+(https://ui.perfetto.dev) or chrome://tracing.
+"""
+from __future__ import unicode_literals
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Tracer(object):
+
+    enabled = False  # spans are only recorded if the tracer is enabled
+
+    def __init__(self):
+        self._spans = []
+        self._lock = threading.Lock()
+        self._start = time.time()
+
+    def enable(self):
+        """ Start recording spans """
+        self.enabled = True
+
+    @contextmanager
+    def span(self, name, category, **args):
+        """
+        Time the body of the with statement as a span. The dictionary
+        of arguments is yielded, so the body can add to it.
+        """
+        start = time.time()
+        try:
+            yield args
+        finally:
+            if self.enabled:
+                self.record(name, category, start, time.time() - start, args)
+
+    def record(self, name, category, start, duration, args=None):
+        """ Record a span that started at <start>, and took <duration> seconds """
+        with self._lock:
+            self._spans.append({'name': name,
+                                'category': category,
+                                'start': start,
+                                'duration': duration,
+                                'thread': threading.current_thread().ident,
+                                'args': args or {}})
+
+    def spans(self, category=None):
+        """ Return the recorded spans, of a category if it's passed """
+        with self._lock:
+            return [s for s in self._spans if category in (None, s['category'])]
+
+    def totals(self, category, key):
+        """
+        Return the total duration of the spans of <category> grouped by
+        the argument <key>, as a list of (value, seconds) tuples, longest first.
+        """
+        totals = {}
+        for span in self.spans(category):
+            if key in span['args']:
+                value = span['args'][key]
+                totals[value] = totals.get(value, 0) + span['duration']
+        return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+    def chrome_trace(self):
+        """ Return the spans as a chrome trace_event dictionary """
+        pid = os.getpid()
+        events = []
+        for span in self.spans():
+            events.append({'name': span['name'],
+                           'cat': span['category'],
+                           'ph': 'X',
+                           'ts': int((span['start'] - self._start) * 1000000),
+                           'dur': int(span['duration'] * 1000000),
+                           'pid': pid,
+                           'tid': span['thread'],
+                           'args': dict((k, _jsonable(v)) for k, v in span['args'].items())})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, path):
+        """ Write the spans to <path> as a chrome trace_event file """
+        with open(path, 'w') as fh:
+            fh.write(json.dumps(self.chrome_trace()))
+
+    def clear(self):
+        """ Forget every recorded span """
+        with self._lock:
+            self._spans = []
+        self._start = time.time()
+
+
+def _jsonable(value):
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return "%s" % (value,)
+
+
+# a single tracer for the process, so every module records to the same trace
+TRACER = Tracer()
+
+
+def span(name, category, **args):
+    """ Time a section of code as a span of the process's tracer """
+    return TRACER.span(name, category, **args)
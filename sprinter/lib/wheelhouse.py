@@ -0,0 +1,66 @@
+"""
+A directory of wheels, shared by every environment under the root,
+that pip finds eggs in before going to an index.
+
+Wheels are built into it by sprinter wheelhouse build, for every egg
+of the installed environments. An offline install (--offline) only
+installs from it.
+"""
+from __future__ import unicode_literals
+import logging
+import os
+import sys
+import tempfile
+
+import sprinter.lib as lib
+
+logger = logging.getLogger(__name__)
+
+
+class Wheelhouse(object):
+
+    path = None  # the directory the wheels are kept in
+
+    def __init__(self, path):
+        self.path = path
+
+    def pip_environment(self, offline=False, env=None):
+        """
+        return a copy of env (by default os.environ) pointing pip at the
+        wheelhouse if it exists, and with offline, at the wheelhouse only.
+        Options are passed through the environment, so the command line
+        stays the same.
+        """
+        env = dict(os.environ if env is None else env)
+        # pip warns about find links that do not exist
+        if os.path.isdir(self.path):
+            env['PIP_FIND_LINKS'] = self.path
+        if offline:
+            env['PIP_NO_INDEX'] = "1"
+        return env
+
+    def wheels(self):
+        """ return the file names of the wheels in the wheelhouse """
+        if not os.path.exists(self.path):
+            return []
+        return sorted(f for f in os.listdir(self.path) if f.endswith(".whl"))
+
+    def build(self, requirements, env=None):
+        """
+        build wheels for requirements (and what they require) into the
+        wheelhouse, reusing the wheels already in it. Return pip's exit
+        code and output.
+        """
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        fd, requirements_path = tempfile.mkstemp(suffix=".txt")
+        try:
+            with os.fdopen(fd, 'w') as fh:
+                fh.write("\n".join(requirements))
+            command = "%s -m pip wheel --wheel-dir %s -r %s" % (sys.executable, self.path, requirements_path)
+            logger.info("Building wheels for %s..." % ", ".join(requirements))
+            error, output = lib.call(command, env=self.pip_environment(env=env),
+                                     output_log_level=logging.DEBUG, stream=True)
+        finally:
+            os.unlink(requirements_path)
+        return error, output.decode('utf-8', 'replace')
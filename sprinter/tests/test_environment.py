@@ -59,8 +59,20 @@ class TestEnvironment(object):
                                                  call.validate(),
                                                  call.resolve(),
                                                  call.prompt(),
+                                                 call.artifacts(),
+                                                 call.prepare_batch([formulabase()]),
                                                  call.sync()])
 
+    def test_prefetch_artifacts(self):
+        """ The artifacts of every feature should be downloaded once, before syncing """
+        with patch('sprinter.formula.base.FormulaBase', new=create_mock_formulabase()) as formulabase:
+            formulabase.artifacts.return_value = [("http://testme.com/test.tar.gz", None)]
+            with MockEnvironment(test_source, test_target, mock_formulabase=formulabase) as environment:
+                environment.download_cache = Mock()
+                environment.install()
+                environment.download_cache.fetch.assert_called_once_with(
+                    "http://testme.com/test.tar.gz", sha256=None)
+
     def test_feature_run_order_update(self):
         """ A feature update should have it's methods run in the proper order """
         with patch('sprinter.formula.base.FormulaBase', new=create_mock_formulabase()) as formulabase:
@@ -73,8 +85,102 @@ class TestEnvironment(object):
                                                  call.validate(),
                                                  call.resolve(),
                                                  call.prompt(),
+                                                 call.artifacts(),
+                                                 call.prepare_batch([formulabase()]),
                                                  call.sync()])
 
+    def test_unchanged_features_are_refreshed(self):
+        """ An update should only refresh features unchanged since their last sync """
+        with patch('sprinter.formula.base.FormulaBase', new=create_mock_formulabase()) as formulabase:
+            with MockEnvironment(test_fingerprint_source, test_target, mock_formulabase=formulabase) as environment:
+                environment.directory = Mock(spec=environment.directory)
+                environment.directory.root_dir = "/tmp/"
+                environment.directory.new = False
+                environment.update()
+                fingerprints = environment.target.fingerprints()
+                ok_('testfeature' in fingerprints)
+                environment.source.set_fingerprints(fingerprints)
+                formulabase.reset_mock()
+                environment.update()
+                eq_(formulabase().method_calls, [call.validate(),
+                                                 call.resolve(),
+                                                 call.prompt(),
+                                                 call.should_refresh(),
+                                                 call.refresh()])
+
+    def test_unchanged_features_may_update(self):
+        """ An unchanged feature whose formula has work to do on every update should be updated """
+        with patch('sprinter.formula.base.FormulaBase', new=create_mock_formulabase()) as formulabase:
+            formulabase.should_refresh.return_value = False
+            with MockEnvironment(test_fingerprint_source, test_target, mock_formulabase=formulabase) as environment:
+                environment.directory = Mock(spec=environment.directory)
+                environment.directory.root_dir = "/tmp/"
+                environment.directory.new = False
+                environment.update()
+                environment.source.set_fingerprints(environment.target.fingerprints())
+                formulabase.reset_mock()
+                environment.update()
+                ok_(call.sync() in formulabase().method_calls)
+                ok_(call.refresh() not in formulabase().method_calls)
+
+    def test_force_update_syncs_unchanged_features(self):
+        """ A forced update should sync features unchanged since their last sync """
+        with patch('sprinter.formula.base.FormulaBase', new=create_mock_formulabase()) as formulabase:
+            with MockEnvironment(test_fingerprint_source, test_target, mock_formulabase=formulabase) as environment:
+                environment.directory = Mock(spec=environment.directory)
+                environment.directory.root_dir = "/tmp/"
+                environment.directory.new = False
+                environment.update()
+                environment.source.set_fingerprints(environment.target.fingerprints())
+                formulabase.reset_mock()
+                environment.update(force=True)
+                ok_(call.sync() in formulabase().method_calls)
+                ok_(call.refresh() not in formulabase().method_calls)
+
+    def test_update_selected_features(self):
+        """ An update of some features should only sync them, and keep the others as installed """
+        with MockEnvironment(test_select_source, test_select_target) as environment:
+            environment.directory = Mock(spec=environment.directory)
+            environment.directory.root_dir = "/tmp/"
+            environment.directory.new = False
+            environment.directory.install_directory.side_effect = lambda name: "/tmp/" + name
+            with patch('sprinter.formula.base.lib.call') as lib_call:
+                environment.update(features=['a'], with_dependents=True)
+                eq_(sorted(c[0][0] for c in lib_call.call_args_list), ['echo new a', 'echo new b'])
+            eq_(environment.target.get('c', 'command'), 'echo old c')
+            ok_(not environment.target.has_section('d'))
+            ok_(call('echo c') in environment.directory.add_to_rc.call_args_list)
+
+    @raises(SprinterException)
+    def test_update_missing_feature(self):
+        """ An update of a feature the environment does not have should raise an exception """
+        with MockEnvironment(test_select_source, test_select_target) as environment:
+            environment.directory = Mock(spec=environment.directory)
+            environment.directory.new = False
+            environment.update(features=['nope'])
+
+    def test_plan(self):
+        """ A plan should describe each feature's phase and changes, without syncing them """
+        with MockEnvironment(test_plan_source, test_plan_target) as environment:
+            environment.directory = Mock(spec=environment.directory)
+            environment.directory.root_dir = "/tmp/"
+            environment.directory.install_directory.side_effect = lambda name: "/tmp/" + name
+            environment.do_inject_environment_config = False
+            with patch('sprinter.lib.prompt', side_effect=AssertionError("a plan should not prompt")):
+                with patch.object(environment.formula_store, 'install_all') as install_all:
+                    plan = environment.plan()
+            ok_(not install_all.called)
+            features = dict((feature['name'], feature) for feature in plan['features'])
+            eq_(features['added']['phase'], 'install')
+            eq_(features['removed']['phase'], 'remove')
+            eq_(features['changed']['phase'], 'update')
+            eq_(features['changed']['changes'], {'rc': ('echo old', 'echo new'),
+                                                 'env': ('TOKEN=%(config:token)s', None)})
+            ok_('uninstalled' not in features)
+            eq_(plan['uninstalled_formulas'], ['notinstalled==1.0'])
+            ok_(not environment.directory.add_to_rc.called)
+            eq_(plan['injections'], [])
+
     def test_feature_run_order_remove(self):
         """ A feature remove should have it's methods run in the proper order """
         with patch('sprinter.formula.base.FormulaBase', new=create_mock_formulabase()) as formulabase:
@@ -265,6 +371,85 @@ test_source = """
 formula = sprinter.formula.base
 """
 
+test_fingerprint_source = """
+[config]
+namespace = testsprinter
+
+[testfeature]
+formula = sprinter.formula.base
+"""
+
+test_plan_source = """
+[config]
+namespace = testsprinter
+inputs = token
+
+[removed]
+formula = sprinter.formula.base
+
+[changed]
+formula = sprinter.formula.base
+rc = echo old
+env = TOKEN=%(config:token)s
+"""
+
+test_plan_target = """
+[config]
+namespace = testsprinter
+
+[added]
+formula = sprinter.formula.base
+
+[changed]
+formula = sprinter.formula.base
+rc = echo new
+
+[uninstalled]
+formula = sprinter.formula.notinstalled:notinstalled==1.0
+"""
+
+test_select_source = """
+[config]
+namespace = testsprinter
+
+[a]
+formula = sprinter.formula.base
+command = echo old a
+
+[b]
+formula = sprinter.formula.base
+depends = a
+command = echo old b
+
+[c]
+formula = sprinter.formula.base
+command = echo old c
+rc = echo c
+"""
+
+test_select_target = """
+[config]
+namespace = testsprinter
+
+[a]
+formula = sprinter.formula.base
+command = echo new a
+
+[b]
+formula = sprinter.formula.base
+depends = a
+command = echo new b
+
+[c]
+formula = sprinter.formula.base
+command = echo new c
+rc = echo c
+
+[d]
+formula = sprinter.formula.base
+command = echo new d
+"""
+
 test_target = """
 [config]
 namespace = testsprinter
@@ -5,11 +5,14 @@ import unittest
 import logging
 import tempfile
 import shutil
+import json
 import os
+from docopt import DocoptExit
 from mock import call, patch, Mock
 
-from sprinter.install import parse_args, parse_domain
+from sprinter.install import format_plan, format_size, parse_args, parse_domain, wheelhouse_requirements
 from sprinter.core.manifest import Manifest
+from sprinter.lib.tracing import TRACER
 
 TEST_MANIFEST = \
     """
@@ -71,7 +74,8 @@ class TestInstall(unittest.TestCase):
             parse_args(args, Environment=environment)
             load_manifest.assert_called_with(
                 'http://www.google.com',
-                verify_certificate=False)
+                verify_certificate=False,
+                cache=environment().manifest_cache)
             environment.assert_has_calls(calls)
 
     @patch('sprinter.environment.Environment')
@@ -85,6 +89,122 @@ class TestInstall(unittest.TestCase):
         parse_args(args, Environment=environment)
         environment.assert_has_calls(calls)
 
+    @patch('sprinter.environment.Environment')
+    def test_cache_prune(self, environment):
+        """ cache --prune should prune the download cache """
+        environment().download_cache.prune.return_value = 2048
+        environment().download_cache.stats.return_value = {
+            'path': '/tmp/cache', 'downloads': 1, 'size': 1024, 'max_size': 4096}
+        parse_args(['cache', '--prune'], Environment=environment)
+        environment().download_cache.prune.assert_called_with()
+        assert not environment().download_cache.clear.called
+        assert not environment().log_error.called
+
+    @patch('sprinter.environment.Environment')
+    def test_formulas_refresh(self, environment):
+        """ formulas --refresh should install the stored formulas again """
+        environment().jobs = 2
+        environment().formula_store.refresh.return_value = {}
+        environment().formula_store.installed.return_value = {'mypkg': {'installed': 0}}
+        parse_args(['formulas', '--refresh', '-j', '2'], Environment=environment)
+        environment().formula_store.refresh.assert_called_with(jobs=2)
+        assert not environment().log_error.called
+
+    @patch('sprinter.environment.Environment')
+    def test_invalid_jobs(self, environment):
+        """ --jobs should be a positive integer, exiting with the usage otherwise """
+        for jobs in ['0', '-2', 'two']:
+            with self.assertRaises(DocoptExit):
+                parse_args(['formulas', '-j', jobs], Environment=environment)
+        assert not environment.called
+
+    @patch('sprinter.environment.Environment')
+    def test_wheelhouse_build(self, environment):
+        """ wheelhouse build should build the eggs of the installed environments """
+        environment().root = self.temp_dir
+        environment().wheelhouse.build.return_value = (0, "")
+        environment().wheelhouse.wheels.return_value = ["jedi-0.7.0-py2-none-any.whl"]
+        self._write_manifest("tools", "[jedi]\nformula = sprinter.formula.eggscript\negg = jedi\n")
+        parse_args(['wheelhouse', 'build'], Environment=environment)
+        environment().wheelhouse.build.assert_called_with(["jedi"])
+        assert not environment().log_error.called
+
+    @patch('sprinter.environment.Environment')
+    def test_offline(self, environment):
+        """ --offline should install eggs from the wheelhouse only """
+        with patch('sprinter.core.manifest.load_manifest') as load_manifest:
+            load_manifest.return_value = Mock(spec=Manifest)
+            parse_args(['install', 'http://www.google.com', '--offline'], Environment=environment)
+        self.assertTrue(environment().offline)
+
+    def test_wheelhouse_requirements(self):
+        """ The eggs of every eggscript feature installed should be required once """
+        self._write_manifest("tools", """
+[jedi]
+formula = sprinter.formula.eggscript
+eggs = jedi, epc==0.5
+
+[git]
+formula = sprinter.formula.package
+apt-get = git
+""")
+        self._write_manifest("editor", """
+[epc]
+formula = sprinter.formula.eggscript
+egg = epc==0.5
+eggs = pyflakes
+""")
+        os.makedirs(os.path.join(self.temp_dir, ".global"))
+        environment = Mock(root=self.temp_dir)
+        self.assertEqual(wheelhouse_requirements(environment), ["epc==0.5", "pyflakes", "jedi"])
+
+    def _write_manifest(self, namespace, content):
+        os.makedirs(os.path.join(self.temp_dir, namespace))
+        with open(os.path.join(self.temp_dir, namespace, "manifest.cfg"), 'w') as fh:
+            fh.write(content)
+
+    @patch('sprinter.environment.Environment')
+    def test_trace(self, environment):
+        """ --trace should write a chrome trace of the run """
+        trace_path = os.path.join(self.temp_dir, "trace.json")
+        environment().root = self.temp_dir
+        try:
+            with patch('sprinter.core.manifest.load_manifest') as load_manifest:
+                load_manifest.return_value = Mock(spec=Manifest)
+                parse_args(['remove', 'test', '--trace', trace_path], Environment=environment)
+        finally:
+            TRACER.enabled = False
+            TRACER.clear()
+        with open(trace_path) as fh:
+            assert 'traceEvents' in json.load(fh)
+
+    def test_format_size(self):
+        """ Sizes should be formatted in the largest fitting unit """
+        self.assertEqual(format_size(512), "512.0 B")
+        self.assertEqual(format_size(1536), "1.5 KB")
+        self.assertEqual(format_size(3 * 1024 * 1024 * 1024), "3.0 GB")
+
+    def test_format_plan(self):
+        """ A plan should be formatted as a line per feature, and a summary """
+        plan = {'namespace': 'test',
+                'features': [{'name': 'git', 'formula': 'sprinter.formula.git', 'phase': 'update',
+                              'changes': {'branch': ('develop', 'master')},
+                              'artifacts': [], 'errors': []},
+                             {'name': 'env', 'formula': 'sprinter.formula.env', 'phase': 'unchanged',
+                              'changes': {}, 'artifacts': [], 'errors': []}],
+                'injections': ['/home/test/.bashrc'],
+                'uninstalled_formulas': ['myformula==1.0']}
+        self.assertEqual(format_plan(plan).splitlines(), [
+            "Plan for environment test:",
+            "  update    git (sprinter.formula.git)",
+            "      branch: develop -> master",
+            "  unchanged env (sprinter.formula.env)",
+            "Formulas to install:",
+            "  myformula==1.0",
+            "Files to inject:",
+            "  /home/test/.bashrc",
+            "0 to install, 1 to update, 0 to remove, 1 unchanged"])
+
     def test_parse_domain(self):
         """ Test if domains are properly parsed """
         match_tuples = [
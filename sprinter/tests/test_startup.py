@@ -0,0 +1,74 @@
+"""
+Tests that the command line starts quickly: shell hooks and scripts
+call sprinter often, so heavy modules must only be imported by the
+commands that need them.
+"""
+from __future__ import unicode_literals
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from nose import tools
+
+import sprinter
+
+HEAVY_MODULES = ['requests', 'clint', 'pip', 'pkg_resources', 'sprinter.external.virtualenv',
+                 'cProfile', 'pstats']
+
+# runs in a new interpreter, printing the heavy modules imported
+CHECK_SCRIPT = """
+import json, platform, sys
+
+def fail(*args):
+    raise AssertionError("the platform was queried on startup")
+platform.uname = platform.dist = platform.linux_distribution = fail
+
+from sprinter.install import parse_args
+if sys.argv[1:]:
+    parse_args(sys.argv[1:])
+heavy = %r
+print(json.dumps(sorted(m for m in heavy if sys.modules.get(m))))
+""" % HEAVY_MODULES
+
+GLOBAL_CONFIG = """
+[global]
+env_source_rc = false
+
+[shell]
+bash = false
+zsh = false
+gui = false
+"""
+
+
+class TestStartup(object):
+
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.temp_dir, ".sprinter", ".global"))
+        with open(os.path.join(self.temp_dir, ".sprinter", ".global", "config.cfg"), 'w') as fh:
+            fh.write(GLOBAL_CONFIG)
+
+    def teardown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _imported_heavy_modules(self, *args):
+        env = dict(os.environ)
+        env['HOME'] = self.temp_dir
+        env['PYTHONPATH'] = os.path.dirname(os.path.dirname(os.path.abspath(sprinter.__file__)))
+        process = subprocess.Popen([sys.executable, "-c", CHECK_SCRIPT] + list(args),
+                                   stdout=subprocess.PIPE, env=env)
+        output = process.communicate()[0]
+        tools.eq_(process.returncode, 0)
+        return json.loads(output.decode('utf-8').strip().split("\n")[-1])
+
+    def test_import(self):
+        """ Importing the command line should not import heavy modules, or query the platform """
+        tools.eq_(self._imported_heavy_modules(), [])
+
+    def test_environments(self):
+        """ Listing environments should not import heavy modules """
+        tools.eq_(self._imported_heavy_modules("environments"), [])
@@ -53,7 +53,7 @@ def create_mock_environment(source_config=None, target_config=None,
             formula_dict = {'sprinter.formula.base': mock_formulabase}
             environment.features = FeatureDict(environment,
                                                environment.source, environment.target,
-                                               environment.global_path,
+                                               environment.formula_store,
                                                formula_dict=formula_dict)
         return environment, temp_directory
     
@@ -66,6 +66,8 @@ def create_mock_formulabase():
     mock_formulabase.resolve.return_value = None
     mock_formulabase.prompt.return_value = None
     mock_formulabase.sync.return_value = None
+    mock_formulabase.refresh.return_value = None
+    mock_formulabase.artifacts.return_value = []
     for phase in PHASE.values:
         setattr(mock_formulabase, phase.name, Mock(return_value=None))
 